@@ -1,86 +1,137 @@
 """
 Convert Courlis listing binary file to Opthyca file format
+
+Several listing files can be converted in parallel with the `--batch` option which accepts folders (all their
+`*.listingcourlis` files) or glob patterns.
 """
 import argparse
-import scipy.io as spio
-import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import glob
+import os.path
+import time
+
+from courlis_tools.core.parsers.read_listing import ReadListingFile
+from courlis_tools.core.writers.write_opt import write_opt
+
+
+LISTING_EXTENSION = '.listingcourlis'
+
+
+def listing2opt(in_listing, out_opt, verbose=True):
+    with ReadListingFile(in_listing) as listing:
+        if verbose:
+            print("%i frames, %i sections, %i couches" % (listing.res_plong.nb_frames, listing.nb_sections,
+                                                          listing.nb_layers))
+        write_opt(listing.res_plong, out_opt)
+
+
+def find_listings(paths):
+    """
+    :param paths: folders, files or glob patterns
+    :type paths: [str]
+    :return: sorted paths of the listing files
+    """
+    listings = set()
+    for path in paths:
+        if os.path.isdir(path):
+            listings.update(glob.glob(os.path.join(path, '*' + LISTING_EXTENSION)))
+        else:
+            listings.update(filter(os.path.isfile, glob.glob(path)))
+    return sorted(listings)
+
 
+def output_path(in_listing, out_folder=None):
+    out_opt = os.path.splitext(in_listing)[0] + '.opt'
+    if out_folder is None:
+        return out_opt
+    return os.path.join(out_folder, os.path.basename(out_opt))
 
-def listing2opt(in_listing, out_opt):
+
+def is_up_to_date(in_listing, out_opt):
+    return os.path.exists(out_opt) and os.path.getmtime(out_opt) >= os.path.getmtime(in_listing)
+
+
+def _convert_task(in_listing, out_opt):
+    """Conversion in a worker process: errors are returned instead of being raised"""
+    start = time.perf_counter()
     try:
-        with spio.FortranFile(in_listing, 'r') as f:
-            res = f.read_reals(float)
-            while True:
-                res = np.vstack((res, f.read_reals(float)))
-    except TypeError:
-        pass
-
-    listePdt = np.unique(res[:, 0])
-
-    nombrePdT = len(listePdt)
-    nombreSection = sum(res[:, 0] == listePdt[0])
-    nombreCouche = sum(res[:, 1] == 1999)//(nombrePdT-1)
-
-    Uno = np.array([1 for i in range(nombreSection)])
-    PdT = res[0:nombreSection, 0]
-    NumeroSection = res[0:nombreSection, 1]
-    variables = res[0:nombreSection, 2:17]
-    Q = res[0:nombreSection, 5]*res[0:nombreSection, 6]
-
-    print("%i frames, %i sections, %i couches" % (nombrePdT, nombreSection, nombreCouche))
-
-    Resultats = np.insert(variables, 0, PdT, axis=1)
-    Resultats = np.insert(Resultats, 1, Uno, axis=1)
-    Resultats = np.insert(Resultats, 17, Q, axis=1)
-    Resultats = np.insert(Resultats, 2, NumeroSection, axis=1)
-
-    OPT = Resultats
-
-    for i in range(1,nombrePdT):
-        rangeIndex_1 = i*nombreSection + (i-1)*(nombreCouche+3)
-        rangeIndex_2 = rangeIndex_1 + nombreSection
-
-        PdT = res[rangeIndex_1:rangeIndex_2, 0]
-        NumeroSection = res[rangeIndex_1:rangeIndex_2, 1]
-        variables = res[rangeIndex_1:rangeIndex_2, 2:17]
-        Q = res[rangeIndex_1:rangeIndex_2, 5]*res[rangeIndex_1:rangeIndex_2, 6]
-
-        Resultats = np.insert(variables, 0, PdT, axis=1)
-        Resultats = np.insert(Resultats, 1, Uno, axis=1)
-        Resultats = np.insert(Resultats, 17, Q, axis=1)
-        Resultats = np.insert(Resultats, 2, NumeroSection, axis=1)
-
-        OPT = np.vstack((OPT, Resultats))
-
-    with open(out_opt, 'w') as w:
-        w.write('[variables]\n')
-        w.write('\"Cote de l eau\";\"Z\";\"m\";3\n')
-        w.write('\"Cote du fond\";\"ZREF\";\"m\";4\n')
-        w.write('\"Vitesse mineure\";\"VMIN\";\"m/s\";4\n')
-        w.write('\"Section mouillee mineure\";\"E1\";\"m2\";2\n')
-        w.write('\"Concentration en vase\";\"CVas\";\"g/l\";4\n')
-        w.write('\"Concentration en sable\";\"CSbl\";\"g/l\";4\n')
-        w.write('\"Depot cumule\";\"DepT\";\"T\";3\n')
-        w.write('\"Variation de surface cumulee\";\"Vsur\";\"m2\";3\n')
-        w.write('\"Flux massique de vase\";\"FlVs\";\"kg/m/s\";3\n')
-        w.write('\"Flux massique de sable\";\"FlSb\";\"kg/m/s\";3\n')
-        w.write('\"Contrainte au fond maximale\";\"THMx\";\"N/m2\";3\n')
-        w.write('\"Contrainte moyenne\";\"THMy\";\"N/m2\";3\n')
-        w.write('\"Contrainte effective moyenne\";\"TEMy\";\"N/m2\";3\n')
-        w.write('\"Concentration d''equilibre moy\";\"CeqM\";\"g/l\";3\n')
-        w.write('\"Debit\";\"Q\";\"m3/s\";1\n')
-        w.write('[resultats]\n')
-        for i in range(np.size(OPT, 0)):
-            j = 0
-            w.write("{:16.8f}".format(OPT[i, j]))
-            for j in range(1, np.size(OPT, 1)):
-                w.write(";{:16.8f}".format(OPT[i, j]))
-            w.write("\n")
+        listing2opt(in_listing, out_opt, verbose=False)
+        status, message = 'converted', ''
+    except Exception as e:  # reported in the summary, other files are still converted
+        status, message = 'error', str(e).replace('\n', ' ')
+    return status, time.perf_counter() - start, message
+
+
+def listing2opt_batch(paths, out_folder=None, nb_workers=None, force=False):
+    """
+    Convert several listing files in parallel (on a pool of processes)
+    :param paths: folders, files or glob patterns
+    :type paths: [str]
+    :param out_folder: folder of the Opthyca files (next to the listing files if None)
+    :type out_folder: str
+    :param nb_workers: number of processes (number of CPUs if None)
+    :type nb_workers: int
+    :param force: convert files even if their Opthyca file is more recent
+    :type force: bool
+    :return: list of (in_listing, out_opt, status, duration in seconds, message) where status is `converted`,
+        `skipped` (output is up to date) or `error`
+    """
+    if out_folder is not None:
+        os.makedirs(out_folder, exist_ok=True)
+    summary = []
+    tasks = []
+    out_opts = set()
+    for in_listing in find_listings(paths):
+        out_opt = output_path(in_listing, out_folder)
+        if out_opt in out_opts:
+            summary.append((in_listing, out_opt, 'error', 0.0, 'Output file is already written by another listing'))
+        elif not force and is_up_to_date(in_listing, out_opt):
+            summary.append((in_listing, out_opt, 'skipped', 0.0, ''))
+        else:
+            tasks.append((in_listing, out_opt))
+        out_opts.add(out_opt)
+
+    if tasks:
+        with ProcessPoolExecutor(max_workers=nb_workers) as executor:
+            futures = [executor.submit(_convert_task, in_listing, out_opt) for in_listing, out_opt in tasks]
+            for (in_listing, out_opt), future in zip(tasks, futures):
+                summary.append((in_listing, out_opt) + future.result())
+    return sorted(summary)
+
+
+def write_summary(summary, csv_path=None):
+    for in_listing, out_opt, status, duration, message in summary:
+        print("%-9s %8.2f s  %s%s" % (status, duration, in_listing, ' (%s)' % message if message else ''))
+    nb_by_status = {status: sum(1 for row in summary if row[2] == status)
+                    for status in ('converted', 'skipped', 'error')}
+    print("~> %i converted, %i skipped, %i errors (total conversion time: %.2f s)"
+          % (nb_by_status['converted'], nb_by_status['skipped'], nb_by_status['error'],
+             sum(row[3] for row in summary)))
+    if csv_path is not None:
+        with open(csv_path, 'w', newline='') as fileout:
+            writer = csv.writer(fileout, delimiter=';')
+            writer.writerow(['in_listing', 'out_opt', 'status', 'duration', 'message'])
+            writer.writerows(summary)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('in_listing', help="Courlis listing binary file")
-    parser.add_argument('out_opt', help="Opthyca file")
+    parser.add_argument('in_listing', nargs='?', help="Courlis listing binary file")
+    parser.add_argument('out_opt', nargs='?', help="Opthyca file")
+    parser.add_argument('--batch', nargs='+', metavar='PATH',
+                        help="folders or glob patterns of listing files to convert in parallel")
+    parser.add_argument('--out_folder', help="folder of the Opthyca files (batch mode, default: next to listings)")
+    parser.add_argument('--workers', type=int, help="number of processes (batch mode, default: number of CPUs)")
+    parser.add_argument('--force', action='store_true', help="convert even up-to-date files (batch mode)")
+    parser.add_argument('--summary', help="CSV file with the timing and error of each file (batch mode)")
     args = parser.parse_args()
-    listing2opt(args.in_listing, args.out_opt)
+    if args.batch:
+        if args.in_listing is not None:
+            parser.error("positional arguments can not be used with --batch")
+        summary = listing2opt_batch(args.batch, args.out_folder, args.workers, args.force)
+        write_summary(summary, args.summary)
+    else:
+        if args.in_listing is None or args.out_opt is None:
+            parser.error("in_listing and out_opt are required (or use --batch)")
+        listing2opt(args.in_listing, args.out_opt)
@@ -1,230 +1,824 @@
 import numpy as np
+import re
 import shapefile
+from struct import unpack
 
-from .section import Section
+from .geom_diff import GeometryDiff, MATCH_PK, PK_TOLERANCE
+from .hydraulics import HydraulicTable
+from .interp import interpolate_scattered
+from .native_geom import load_native, NATIVE_EXTENSION, save_native
+from .section_interp import interpolate_sections
+from .section_store import SectionStore
+from .simplify import resample_sections, simplify_sections
+from .spatial_index import SpatialIndex
 from .utils import GeometryRequestException
+from .validation import check_store, REQUIRED_LIMITS
+from .writers.write_shp import POINTZ, POINTZ_DTYPE, SHP_HEADER_SIZE, SHX_DTYPE, write_dbf, write_pointz, \
+    write_polylinez
 
 
 class Geometry:
     """
     Representation of a 1D hydro-sedimentological model
 
-    sections <Section>: list of sections
+    store <SectionStore>: points, limits and layers of all sections in flat arrays
+    sections <Section>: list of sections (views on `store`)
     nb_layers <int>: number of sediment layers
     layer_names <[str]>: (nb_layers)
+    reach_name <str>: name of the river reach (written in Mascaret/Courlis files)
     """
     COURLIS_FLOAT_FMT = '%.6f'
     ST_SECTION_ENDING = '     999.9990     999.9990     999.9990 '
+    NB_VALUES_PER_BLOCK = 2 ** 20  # approximative number of values formatted at once
+    LABEL_REGEX = re.compile(r'([A-Za-z_]\S*)[ \t\r]*$', re.MULTILINE)  # label at the end of a point line
+    COURLIS_HEADER_REGEX = re.compile(r'(?:Profil|PROFIL|profil)[^\n]*')  # profile header (at line start)
+    COURLIS_LABEL_REGEX = re.compile(r' [A-Za-z_]\S*')  # label of a point in a Mascaret/Courlis file
+    COURLIS_REF_HEADER_LENGTH = 11  # Profil, reach, name, PK, 2 bank coordinates, AXE and its coordinates
+    DEFAULT_REACH_NAME = 'Bief_0'
 
-    def __init__(self, filename):
+    def __init__(self, filename, reach_name=DEFAULT_REACH_NAME):
+        """
+        :param filename: geometry file to load (empty geometry if None)
+        :type filename: str
+        :param reach_name: name of the river reach (replaced by the one of the first section header for
+            Mascaret/Courlis and `georef` files)
+        :type reach_name: str
+        """
         self.iter_pos = 0
         self.filename = filename
+        self.reach_name = reach_name
+        self.store = None
         self.sections = []
         self.nb_layers = 0
         self.layer_names = []
+        self._spatial_index = None
+        self._hydraulic_tables = {}  # {layer: (store, elevations, table)}
+        if filename is None:
+            return
         try:
             if filename.endswith('.ST'):
                 self.load_ST()
             elif filename.endswith('.georef'):
-                self.load_georef()
+                if Geometry._has_georeferenced_header(filename):
+                    self.load_courlis(ref=True, layers=False)
+                else:
+                    self.load_georef()
+            elif filename.endswith('.geo'):
+                self.load_courlis(ref=False, layers=False)
+            elif filename.endswith('.geoC'):
+                self.load_courlis(ref=False, layers=True)
+            elif filename.endswith('.georefC'):
+                self.load_courlis(ref=True, layers=True)
+            elif filename.endswith('.shp'):
+                self.load_shp()
+            elif filename.endswith(NATIVE_EXTENSION):
+                self.load_native()
             else:
                 raise NotImplementedError('File format is not supported!')
         except FileNotFoundError as e:
             raise GeometryRequestException(e)
 
+    @staticmethod
+    def from_store(store, layer_names=None, reach_name=DEFAULT_REACH_NAME, filename=None):
+        """
+        Geometry of a store (which is not copied)
+        :param store: points, limits and layers of all sections
+        :type store: SectionStore
+        :param layer_names: names of the layers (`layer_1`, `layer_2`... if None)
+        :type layer_names: [str]
+        :param reach_name: name of the river reach
+        :type reach_name: str
+        :param filename: file from which the store was read
+        :type filename: str
+        :rtype: Geometry
+        """
+        geometry = Geometry(None, reach_name)
+        geometry.filename = filename
+        geometry._set_store(store)
+        geometry.layer_names = ['layer_%i' % (i + 1) for i in range(geometry.nb_layers)] if layer_names is None \
+            else list(layer_names)
+        return geometry
+
+    @staticmethod
+    def _read_lines(filename):
+        with open(filename, 'r') as filein:
+            lines = filein.read().split('\n')
+        if lines[-1] == '':
+            lines.pop()  # end-of-file
+        return lines
+
+    @staticmethod
+    def _parse_point_lines(lines, nb_values, parse_line):
+        """
+        Parse point lines in bulk: numeric values are converted at once and labels at the end of lines (limits) are
+        located with a regular expression. Lines which are not in the usual form are parsed one by one by
+        `parse_line` (to find the malformed line or for unusual labels).
+        :return: 2D-array with the shape (nb_lines, nb_values) and list of (line index, label)
+        """
+        text = '\n'.join(lines)
+        labels = []
+        pieces = []
+        line_id, pos, end = 0, 0, 0
+        for match in Geometry.LABEL_REGEX.finditer(text):
+            start = match.start()
+            if start > 0 and not text[start - 1].isspace():
+                continue  # end of a number (e.g. exponent)
+            line_id += text.count('\n', pos, start)
+            pos = start
+            labels.append((line_id, match.group(1)))
+            pieces.append(text[end:start])
+            end = match.end()
+        pieces.append(text[end:])
+        try:
+            values = np.fromstring(''.join(pieces), sep=' ')
+        except ValueError:  # unmatched data
+            values = np.array([])
+        if values.size == nb_values * len(lines) and len(set(line_id for line_id, _ in labels)) == len(labels):
+            return values.reshape(len(lines), nb_values), labels
+
+        values = np.empty((len(lines), nb_values))
+        labels = []
+        for i, line in enumerate(lines):
+            values[i], label = parse_line(line + '\n')
+            if label is not None:
+                labels.append((i, label))
+        return values, labels
+
+    @staticmethod
+    def _parse_ST_point_line(line):
+        line_split = line.split()
+        try:
+            if len(line_split) == 3:
+                return [float(v) for v in line_split], None
+            elif len(line_split) == 4:
+                return [float(v) for v in line_split[:-1]], line_split[-1]
+        except ValueError:
+            pass
+        raise GeometryRequestException('Coordinates are not readable\n' + 'Guilty line:\n' + line)
+
+    @staticmethod
+    def _parse_georef_point_line(line):
+        try:
+            dist_str, z_str, _ = line.split()
+            return [float(dist_str), float(z_str)], None
+        except ValueError:
+            raise GeometryRequestException('Coordinates are not readable\n' + 'Guilty line:\n' + line)
+
+    @staticmethod
+    def _split_limits(labels, offsets):
+        """Split labels by section: list of {limit_name: point_numbering} for each section"""
+        limits = [{} for _ in range(len(offsets) - 1)]
+        if labels:
+            line_ids = np.array([line_id for line_id, _ in labels])
+            section_ids = np.searchsorted(np.array(offsets), line_ids, side='right') - 1
+            for (line_id, label), i in zip(labels, section_ids.tolist()):
+                limits[i][label] = line_id - offsets[i]
+        return limits
+
     def load_ST(self):
-        with open(self.filename, 'r') as filein:
-            line = filein.readline()
-            eof = False
-            while not eof:  # end-of-file reached
-                # Read header of the cross-section profile
-                try:
-                    profile_id_str, _, _, nb_points_str, PK_str, profile_name = line.split()
-                except ValueError:
-                    raise GeometryRequestException('Section header not readable\n' + 'Guilty line:\n' + line)
-                try:
-                    nb_points = int(nb_points_str)
-                    profile_id = int(profile_id_str)
-                    PK = float(PK_str)
-                except ValueError:
-                    raise GeometryRequestException('Section header values could not be interpreted\n'
-                                                   'Guilty line:\n' + line)
-                section = Section(profile_id, profile_name, PK)
-                section.allocate(nb_points)
-
-                # Read coordinates of points
-                for i in range(nb_points):
-                    line = filein.readline()
-                    line_split = line.split()
-                    if len(line_split) == 3:
-                        x, y, z = [float(v) for v in line_split]
-                        limit = None
-                    elif len(line_split) == 4:
-                        x, y, z, limit = [float(v) for v in line_split[:-1]] + [line_split[-1]]
-                    else:
-                        raise GeometryRequestException('Coordinates are not readable\n' + 'Guilty line:\n' + line)
-                    section.set_point(i, x, y, z, limit)
-
-                # Read footer of cross-section profile
-                line = filein.readline()
-                if line.strip() != Geometry.ST_SECTION_ENDING.strip():
-                    raise GeometryRequestException('Section footer not found (check number of points)\n'
-                                                   'Guilty line:\n' + line)
-                self.sections.append(section)
-
-                # Check end-of-file, otherwise it is a new section
-                line = filein.readline()
-                if line == '':
-                    eof = True
+        lines = Geometry._read_lines(self.filename)
+        headers = []  # (profile_id, profile_name, PK)
+        point_lines = []
+        offsets = [0]
+
+        def error(message, line):
+            # Errors in previous point lines come first
+            Geometry._parse_point_lines(point_lines, 3, Geometry._parse_ST_point_line)
+            raise GeometryRequestException(message + '\nGuilty line:\n' + line)
+
+        if not lines:
+            error('Section header not readable', '')
+        i = 0
+        while i < len(lines):
+            # Read header of the cross-section profile
+            line = lines[i] + '\n'
+            try:
+                profile_id_str, _, _, nb_points_str, PK_str, profile_name = line.split()
+            except ValueError:
+                error('Section header not readable', line)
+            try:
+                nb_points = int(nb_points_str)
+                profile_id = int(profile_id_str)
+                PK = float(PK_str)
+            except ValueError:
+                error('Section header values could not be interpreted', line)
+            headers.append((profile_id, profile_name, PK))
+
+            # Coordinates of points
+            point_lines.extend(lines[i + 1:i + 1 + nb_points])
+            if len(point_lines) < offsets[-1] + nb_points:
+                error('Coordinates are not readable', '')
+            offsets.append(len(point_lines))
+
+            # Read footer of cross-section profile
+            i += nb_points + 1
+            line = lines[i] + '\n' if i < len(lines) else ''
+            if line.strip() != Geometry.ST_SECTION_ENDING.strip():
+                error('Section footer not found (check number of points)', line)
+            i += 1
+
+        values, labels = Geometry._parse_point_lines(point_lines, 3, Geometry._parse_ST_point_line)
+        limits = Geometry._split_limits(labels, offsets)
+        x, y, z = values.T
+        self._set_store(SectionStore([header[0] for header in headers], [header[1] for header in headers],
+                                     [header[2] for header in headers], offsets, x, y, z, limits))
 
     def load_georef(self):
         """
         Build horizontally
         Distance is supposed to be from left to right bank
+        The reach name is read in the first section header.
         """
-        with open(self.filename, 'r') as filein:
-            id_section = 0
-            name = ''
-            PK = -1.0
-            dist, z = [], []
-            for line in filein:
-                if line.startswith('PROFIL'):
-                    if dist:
-                        section = Section(id_section, name, PK)
-                        section.set_points_from_trans(dist, z)
-                        self.sections.append(section)
+        lines = Geometry._read_lines(self.filename)
+        headers = []  # (id_section, name, PK)
+        point_lines = []
+        offsets = [0]
+        id_section = 0
+        if not lines or not lines[0].startswith('PROFIL'):
+            headers.append((id_section, '', -1.0))
+        for line in lines:
+            if line.startswith('PROFIL'):
+                if headers:
+                    offsets.append(len(point_lines))
+                try:
                     _, _, name, PK_str = line.split()
                     PK = float(PK_str)
-                    dist, z = [], []
-                    id_section += 1
-                else:
-                    dist_str, z_str, _ = line.split()
-                    dist.append(float(dist_str))
-                    z.append(float(z_str))
-            section = Section(id_section, name, PK)
-            section.set_points_from_trans(dist, z)
-            self.sections.append(section)
+                except ValueError:
+                    Geometry._parse_point_lines(point_lines, 2, Geometry._parse_georef_point_line)
+                    raise GeometryRequestException('Section header not readable\n' + 'Guilty line:\n' + line + '\n')
+                if id_section == 0:
+                    self.reach_name = line.split()[1]
+                id_section += 1
+                headers.append((id_section, name, PK))
+            else:
+                point_lines.append(line)
+        offsets.append(len(point_lines))
+
+        values, labels = Geometry._parse_point_lines(point_lines, 2, Geometry._parse_georef_point_line)
+        # A section without any point is ignored (except the last one)
+        kept = [i for i in range(len(headers)) if offsets[i] != offsets[i + 1] or i == len(headers) - 1]
+        nb_points = np.ediff1d(offsets)[kept]
+        PK = np.array([headers[i][2] for i in kept], dtype=float)
+        limits = [{'RD': 0, 'RG': n - 1} if n > 1 else ({'RD': 0} if n == 1 else {}) for n in nb_points.tolist()]
+        self._set_store(SectionStore([headers[i][0] for i in kept], [headers[i][1] for i in kept], PK,
+                                     np.concatenate(([0], np.cumsum(nb_points))), np.repeat(PK, nb_points),
+                                     values[:, 0], values[:, 1], limits))
+
+    @staticmethod
+    def _has_georeferenced_header(filename):
+        """Check if the first profile header contains bank and `AXE` coordinates (as written by `save_courlis`)"""
+        with open(filename, 'r') as filein:
+            return len(filein.readline().split()) == Geometry.COURLIS_REF_HEADER_LENGTH
+
+    @staticmethod
+    def _parse_courlis_point_line(line, nb_values, label_position):
+        line_split = line.split()
+        try:
+            if len(line_split) == nb_values + 1:
+                del line_split[label_position]
+                return [float(v) for v in line_split]
+        except ValueError:
+            pass
+        raise GeometryRequestException('Coordinates are not readable\n' + 'Guilty line:\n' + line)
+
+    def load_courlis(self, ref, layers):
+        """
+        Read a Mascaret/Courlis geometry file (as written by `save_courlis`)
+        Without georeferenced coordinates, the geometry is built horizontally (as in `load_georef`).
+        Limits `RD` and `RG` are the first and the last points, the `FON` limit is the point nearest to the `AXE`.
+        Layer names are not stored in these files, they are named `layer_1`, `layer_2`...
+        :param ref: points have coordinates and headers have bank and `AXE` coordinates
+        :type ref: bool
+        :param layers: points have layer elevations
+        :type layers: bool
+        """
+        with open(self.filename, 'r') as filein:
+            text = filein.read()
+        headers = [header for header in Geometry.COURLIS_HEADER_REGEX.finditer(text)
+                   if header.start() == 0 or text[header.start() - 1] == '\n']
+        if not text.strip():
+            raise GeometryRequestException('No section found in file')
+        if not headers or text[:headers[0].start()].strip():
+            line = text[:headers[0].start() if headers else len(text)].strip().split('\n')[0]
+            raise GeometryRequestException('Points without section header\n' + 'Guilty line:\n' + line + '\n')
+
+        names, PK, axes = [], [], []
+        chunks = []  # text of the point lines of each section
+        offsets = [0]
+        for i, header in enumerate(headers):
+            line = header.group()
+            line_split = line.split()
+            try:
+                if len(line_split) != (Geometry.COURLIS_REF_HEADER_LENGTH if ref else 4):
+                    raise ValueError
+                if i == 0:
+                    self.reach_name = line_split[1]
+                names.append(line_split[2])
+                PK.append(float(line_split[3]))
+                if ref:
+                    if line_split[8].upper() != 'AXE':
+                        raise ValueError
+                    axes.append((float(line_split[9]), float(line_split[10])))
+            except ValueError:
+                raise GeometryRequestException('Section header not readable\n' + 'Guilty line:\n' + line + '\n')
+            chunk = text[header.end() + 1:headers[i + 1].start() if i + 1 < len(headers) else len(text)]
+            if chunk and not chunk.endswith('\n'):
+                chunk += '\n'  # end-of-file
+            chunks.append(chunk)
+            offsets.append(offsets[-1] + chunk.count('\n'))
+        points_text = ''.join(chunks)
+        nb_lines = offsets[-1]
+
+        # Number of values by point: distance, elevation, layer elevations (and coordinates)
+        nb_layers = 0
+        if layers and nb_lines > 0:
+            first_line = points_text[:points_text.find('\n')]
+            nb_layers = len(first_line.split()) - (5 if ref else 3)
+            if nb_layers < 0:
+                raise GeometryRequestException('Coordinates are not readable\n' + 'Guilty line:\n' + first_line + '\n')
+        nb_values = 2 + nb_layers + (2 if ref else 0)
+        try:
+            values = np.fromstring(Geometry.COURLIS_LABEL_REGEX.sub('', points_text), sep=' ')
+        except ValueError:  # unmatched data
+            values = np.array([])
+        if values.size == nb_values * nb_lines:
+            values = values.reshape(nb_lines, nb_values)
+        else:
+            values = np.array([Geometry._parse_courlis_point_line(line + '\n', nb_values, 2 + nb_layers)
+                               for line in points_text.split('\n')[:-1]]).reshape(nb_lines, nb_values)
+
+        nb_points = np.ediff1d(offsets)
+        limits = [{} for _ in nb_points]
+        if ref:
+            x, y = values[:, -2], values[:, -1]
+            # `FON` is the nearest point to the `AXE` of each section
+            section_index = np.repeat(np.arange(len(names)), nb_points)
+            axes = np.array(axes).reshape(-1, 2)
+            dist2 = (x - axes[section_index, 0]) ** 2 + (y - axes[section_index, 1]) ** 2
+            nearest = np.lexsort((dist2, section_index))[np.array(offsets[:-1])[nb_points > 0]]
+            for i, index in zip(np.flatnonzero(nb_points > 0).tolist(), nearest.tolist()):
+                limits[i]['FON'] = index - offsets[i]
+        else:
+            x, y = np.repeat(np.array(PK, dtype=float), nb_points), values[:, 0]
+        for section_limits, n in zip(limits, nb_points.tolist()):
+            if n > 0:
+                section_limits['RD'] = 0
+            if n > 1:
+                section_limits['RG'] = n - 1
+        limits = [dict(sorted(section_limits.items(), key=lambda item: item[1])) for section_limits in limits]
+
+        store = SectionStore(np.arange(1, len(names) + 1), names, PK, offsets, x, y, values[:, 1], limits,
+                             distances=values[:, 0])
+        if nb_layers > 0:
+            store.layers_elev = np.ascontiguousarray(values[:, 2:2 + nb_layers].T)
+        self._set_store(store)
+        self.layer_names = ['layer_%i' % (i + 1) for i in range(nb_layers)]
+
+    def load_shp(self):
+        """
+        Read a POINTZ shapefile (as written by `save_shp`)
+        Consecutive points with the same profile name and PK are gathered in a section.
+        Limits `RD` and `RG` are the first and the last points of each section.
+        """
+        reader = shapefile.Reader(self.filename)
+        try:
+            if reader.shapeType != POINTZ:
+                raise GeometryRequestException('Shapefile has to contain POINTZ geometries')
+            fields = [field[0] for field in reader.fields[1:]]
+            for field in ('profil', 'PK', 'dist'):
+                if field not in fields:
+                    raise GeometryRequestException('Field `%s` is missing in shapefile' % field)
+            layer_fields = [field for field in fields if field.startswith('Z_')]
+            nb_records = reader.numRecords
+
+            # Coordinates (all records have the same size, otherwise they are read one by one)
+            reader.shx.seek(0)
+            index = np.frombuffer(reader.shx.read(), dtype=SHX_DTYPE, offset=SHP_HEADER_SIZE)
+            if len(index) == nb_records and np.all(index['length'] == (POINTZ_DTYPE.itemsize - 8) // 2):
+                reader.shp.seek(0)
+                points = np.frombuffer(reader.shp.read(), dtype=POINTZ_DTYPE, offset=SHP_HEADER_SIZE,
+                                       count=nb_records)
+                x, y, z = points['x'], points['y'], points['z']
+            else:
+                shapes = reader.shapes()
+                x = np.array([shape.points[0][0] for shape in shapes])
+                y = np.array([shape.points[0][1] for shape in shapes])
+                z = np.array([shape.z[0] for shape in shapes])
+
+            # Attributes (fixed width records)
+            reader.dbf.seek(0)
+            dbf = reader.dbf.read()
+            header_length, record_length = unpack('<HH', dbf[8:12])
+            dtype = np.dtype([(field[0], 'S%i' % int(field[2])) for field in reader.fields])
+            if dtype.itemsize != record_length:
+                raise GeometryRequestException('Records of the dbf file have an unexpected length')
+            records = np.frombuffer(dbf, dtype=dtype, offset=header_length, count=nb_records)
+        finally:
+            for fileobj in (reader.shp, reader.shx, reader.dbf):
+                if fileobj is not None:
+                    fileobj.close()
+
+        # Sections are found on raw texts, which are decoded only once per section
+        raw_names, raw_PK = records['profil'], records['PK']
+        is_first = np.ones(nb_records, dtype=bool)
+        is_first[1:] = (raw_names[1:] != raw_names[:-1]) | (raw_PK[1:] != raw_PK[:-1])
+        starts = np.flatnonzero(is_first)
+        offsets = np.append(starts, nb_records)
+        names = [name.decode('utf-8').strip() for name in raw_names[starts].tolist()]
+        PK = raw_PK[starts].astype(float)
+        limits = [{'RD': 0, 'RG': n - 1} if n > 1 else {'RD': 0} for n in np.ediff1d(offsets).tolist()]
+        store = SectionStore(np.arange(1, len(starts) + 1), names, PK, offsets, x, y, z, limits,
+                             distances=records['dist'].astype(float))
+        if layer_fields:
+            store.layers_elev = np.array([records[field].astype(float) for field in layer_fields])
+        self._set_store(store)
+        self.layer_names = [field[len('Z_'):] for field in layer_fields]
+
+    def load_native(self):
+        store, layer_names = load_native(self.filename)
+        self._set_store(store)
+        self.layer_names = layer_names
+
+    def _set_store(self, store):
+        self.store = store
+        self.nb_layers = store.nb_layers()
+        self.sections = [store.section(i) for i in range(store.nb_sections)]
+
+    def _update_sections(self):
+        """Update views of sections after a change in the store"""
+        for i, section in enumerate(self.sections):
+            self.store.set_view(i, section)
+
+    def _update_layers(self):
+        """Update layer views of sections after a change of layers in the store"""
+        offsets = self.store.offsets.tolist()
+        for section, start, end in zip(self.sections, offsets[:-1], offsets[1:]):
+            section.layers_elev = None if self.store.layers_elev is None else self.store.layers_elev[:, start:end]
+
+    def set_sections(self, sections):
+        """
+        Replace all sections (the store is rebuilt from their arrays)
+        :param sections: list of sections (with the same number of layers as the geometry)
+        :type sections: [Section]
+        """
+        store = SectionStore.from_sections(sections)
+        if store.nb_layers() != self.nb_layers and store.nb_sections > 0:
+            raise GeometryRequestException('Sections have %i layers instead of %i' % (store.nb_layers(),
+                                                                                      self.nb_layers))
+        if store.nb_sections == 0 and self.nb_layers > 0:
+            store.layers_elev = np.empty((self.nb_layers, 0))
+        self.store = store
+        self.sections = list(sections)
+        self._update_sections()
+
+    def interpolate_sections(self, spacing, required_limits=REQUIRED_LIMITS):
+        """
+        Insert intermediate sections between consecutive sections (see `courlis_tools.core.section_interp`)
+        Parts of consecutive sections between their common limits are paired and x, y, z and layer elevations are
+        linearly interpolated along PK.
+        :param spacing: maximum PK spacing between two consecutive sections
+        :type spacing: float
+        :param required_limits: limits which have to be in the same order in consecutive sections (if both have them)
+        :type required_limits: [str]
+        """
+        self._set_store(interpolate_sections(self.store, spacing, required_limits))
+
+    def simplify_sections(self, tolerance, max_points=None):
+        """
+        Remove points of all sections with Douglas-Peucker (see `courlis_tools.core.simplify`)
+        Limits are kept and z and layer elevations of removed points stay within the vertical tolerance.
+        :param tolerance: maximum vertical distance between removed points and the simplified profiles
+        :type tolerance: float
+        :param max_points: maximum number of points by section (no maximum if None)
+        :type max_points: int
+        :return: error introduced in each section (maximum vertical distance)
+        :rtype: numpy 1D-array
+        """
+        store, errors = simplify_sections(self.store, tolerance, max_points)
+        self._set_store(store)
+        return errors
+
+    def resample_sections(self, max_points):
+        """
+        Resample uniformly the sections with more than `max_points` points (see `courlis_tools.core.simplify`)
+        :param max_points: maximum number of points by section (limits are kept anyway)
+        :type max_points: int
+        :return: error introduced in each section (maximum vertical distance)
+        :rtype: numpy 1D-array
+        """
+        store, errors = resample_sections(self.store, max_points)
+        self._set_store(store)
+        return errors
+
+    def check(self, required_limits=REQUIRED_LIMITS, tolerance=0.0):
+        """
+        Check layer elevations, limits and PK of all sections (see `courlis_tools.core.validation`)
+        :param required_limits: names of the limits which have to be in every section
+        :type required_limits: [str]
+        :param tolerance: elevation difference which is accepted between layers
+        :type tolerance: float
+        :return: problems found (section, section_id, point, layer, limit, rule)
+        :rtype: numpy structured array
+        """
+        return check_store(self.store, required_limits, tolerance)
+
+    def diff(self, other, match=MATCH_PK, tolerance=PK_TOLERANCE, step=None, origin=None):
+        """
+        Elevation, area and volume changes from this geometry to another one (see `courlis_tools.core.geom_diff`)
+        :param other: geometry after (e.g. a later survey or a simulated final state)
+        :type other: Geometry
+        :param match: matching of the sections: `PK` (nearest PK within the tolerance) or `name`
+        :type match: str
+        :param tolerance: maximum PK difference of matched sections
+        :type tolerance: float
+        :param step: distance between regular grid points (union of the distances of both profiles if None)
+        :type step: float
+        :param origin: name of the limit from which distances are compared (first point if None)
+        :type origin: str
+        :rtype: GeometryDiff
+        """
+        return GeometryDiff(self.store, other.store, match, tolerance, step, origin)
+
+    def get_spatial_index(self):
+        """
+        Spatial index of the points and traces of the sections
+        The index is built at the first call and rebuilt only if the store was replaced since then
+        (call `reset_spatial_index` after modifying coordinates in place).
+        :rtype: SpatialIndex
+        """
+        if self._spatial_index is None or not self._spatial_index.is_valid(self.store):
+            self._spatial_index = SpatialIndex(self.store)
+        return self._spatial_index
+
+    def reset_spatial_index(self):
+        self._spatial_index = None
+
+    def get_hydraulic_table(self, layer=None):
+        """
+        Stage-geometry tables of all sections (see `courlis_tools.core.hydraulics`)
+        Tables are built at the first call and rebuilt only if the store or its elevations were replaced since then.
+        :param layer: name or position of the layer surface (bottom if None)
+        :type layer: str or int
+        :rtype: HydraulicTable
+        """
+        if isinstance(layer, str):
+            try:
+                layer = self.layer_names.index(layer)
+            except ValueError:
+                raise GeometryRequestException('Layer %s is not found (among: %s)' % (layer, self.layer_names))
+        if layer is not None and not 0 <= layer < self.nb_layers:
+            raise GeometryRequestException('Layer #%i is not found (%i layers)' % (layer, self.nb_layers))
+        elevations = self.store.z if layer is None else self.store.layers_elev
+        cached = self._hydraulic_tables.get(layer)
+        if cached is None or cached[0] is not self.store or cached[1] is not elevations:
+            table = HydraulicTable(self.store, elevations if layer is None else elevations[layer])
+            self._hydraulic_tables[layer] = (self.store, elevations, table)
+        return self._hydraulic_tables[layer][2]
+
+    def layer_thickness(self, thickness):
+        """
+        Thickness of a layer for every point of the geometry
+        :param thickness: specification of the thickness, either:
+            - a single value (constant thickness)
+            - a tuple (PK, thickness) of two lists: thickness linearly interpolated along PK (0 outside)
+            - an array with the shape (nb_points): thickness of every point (in the order of `store`)
+        :type thickness: float or tuple or numpy 1D-array
+        :return: 1D-array with the shape (nb_points)
+        """
+        if isinstance(thickness, tuple):
+            PK, thickness = thickness
+            if len(PK) != len(thickness):
+                raise GeometryRequestException('Arrays have not the same length!')
+            if np.any(np.ediff1d(PK) < 0):
+                raise GeometryRequestException('PK are not strictly in increasing')
+            h = np.interp(self.store.PK, PK, thickness, right=0, left=0)
+            return np.repeat(h, self.store.nb_points_per_section())
+        thickness = np.asarray(thickness, dtype=float)
+        if thickness.ndim == 0:
+            return np.full(self.store.nb_points, thickness)
+        if thickness.shape != (self.store.nb_points,):
+            raise GeometryRequestException('Thickness array has a shape %s instead of (%i,)'
+                                           % (thickness.shape, self.store.nb_points))
+        return thickness
+
+    def survey_layer_thickness(self, x, y, thickness, method='linear', **kwargs):
+        """
+        Thickness of a layer for every point of the geometry interpolated from scattered survey points
+        :param x: coordinates along x axis of survey points
+        :type x: numpy 1D-array
+        :param y: coordinates along y axis of survey points
+        :type y: numpy 1D-array
+        :param thickness: layer thickness at survey points
+        :type thickness: numpy 1D-array
+        :param method: interpolation method: `nearest`, `linear` or `idw`
+        :type method: str
+        :param kwargs: options of `courlis_tools.core.interp.interpolate_scattered` (fill_value, max_distance...)
+        :return: 1D-array with the shape (nb_points)
+        """
+        return interpolate_scattered(x, y, thickness, self.store.x, self.store.y, method, **kwargs)
+
+    def add_survey_layer(self, name, x, y, thickness, method='linear', **kwargs):
+        """
+        Add a layer whose thickness is interpolated from scattered survey points (see `survey_layer_thickness`)
+        """
+        self.add_layers([(name, self.survey_layer_thickness(x, y, thickness, method, **kwargs))])
+
+    def add_layers(self, layers):
+        """
+        Add several layers at once below the existing ones
+        :param layers: list of (name, thickness) from top to bottom (see `layer_thickness` for thickness)
+        :type layers: [(str, float or tuple or numpy 1D-array)]
+        """
+        thicknesses = np.empty((len(layers), self.store.nb_points))
+        for i, (_, thickness) in enumerate(layers):
+            thicknesses[i] = self.layer_thickness(thickness)
+        self.store.add_layers(thicknesses)
+        self.layer_names.extend([name for name, _ in layers])
+        self.nb_layers += len(layers)
+        self._update_layers()
+
+    def set_layers(self, layers):
+        """
+        Replace all the layers (see `add_layers`)
+        """
+        self.store.remove_layers()
+        self.layer_names = []
+        self.nb_layers = 0
+        self.add_layers(layers)
 
     def add_constant_layer(self, name, thickness):
-        self.nb_layers += 1
-        self.layer_names.append(name)
-        for section in self.sections:
-            section.add_layer(thickness)
+        self.add_layers([(name, thickness)])
 
     def add_linear_interp_layer(self, name, PK, thickness):
-        if len(PK) != len(thickness):
-            raise GeometryRequestException('Arrays have not the same length!')
-        if np.any(np.ediff1d(PK) < 0):
-            raise GeometryRequestException('PK are not strictly in increasing')
-        self.nb_layers += 1
-        self.layer_names.append(name)
-        for section in self.sections:
-            h = np.interp(section.PK, PK, thickness, right=0, left=0)
-            section.add_layer(h)
+        self.add_layers([(name, (PK, thickness))])
+
+    def _write_sections(self, fileout, headers, point_fmts, columns, footer=''):
+        """
+        Write all sections by blocks: the text of a block of sections is built with a single `%` operation
+        :param fileout: output file (opened in text mode)
+        :type fileout: file object
+        :param headers: header text of each section
+        :type headers: [str]
+        :param point_fmts: format of all the points of each section (list) or a single format for every point
+        :type point_fmts: [str] or str
+        :param columns: values of all points to format (each array has the shape (nb_points))
+        :type columns: [numpy 1D-array]
+        :param footer: footer text of every section
+        :type footer: str
+        """
+        offsets = self.store.offsets.tolist()
+        nb_points_per_block = max(1, Geometry.NB_VALUES_PER_BLOCK // max(1, len(columns)))
+        footer = footer.replace('%', '%%')
+        first_section = 0
+        while first_section < self.store.nb_sections:
+            # Sections of the block (at least one)
+            last_section = first_section + 1
+            while last_section < self.store.nb_sections and \
+                    offsets[last_section + 1] - offsets[first_section] <= nb_points_per_block:
+                last_section += 1
+            start, end = offsets[first_section], offsets[last_section]
+
+            block_fmt = []
+            for i in range(first_section, last_section):
+                block_fmt.append(headers[i].replace('%', '%%'))
+                if isinstance(point_fmts, str):
+                    block_fmt.append(point_fmts * (offsets[i + 1] - offsets[i]))
+                else:
+                    block_fmt.append(point_fmts[i])
+                block_fmt.append(footer)
+            values = np.column_stack([column[start:end] for column in columns])
+            fileout.write(''.join(block_fmt) % tuple(values.ravel().tolist()))
+            first_section = last_section
 
     def save_ST(self, filename):
+        headers = ['     %i     0     0    %i  %s   %s\n' % (id, nb_points, PK, name)
+                   for id, nb_points, PK, name in zip(self.store.ids.tolist(),
+                                                      self.store.nb_points_per_section().tolist(),
+                                                      self.store.PK.tolist(), self.store.names.tolist())]
+        values_fmt = ' %12.4f %12.4f %12.4f '
+        section_fmts = []
+        for i, nb_points in enumerate(self.store.nb_points_per_section().tolist()):
+            # First limit of a point is kept (as in `Section.point_index_limit`)
+            labels = {}
+            for limit_name, index in self.store.section_limits(i).items():
+                if 0 <= index < nb_points:
+                    labels.setdefault(index, limit_name.replace('%', '%%'))
+            section_fmt = []
+            next_index = 0
+            for index in sorted(labels):
+                section_fmt.append((values_fmt + '\n') * (index - next_index))
+                section_fmt.append(values_fmt + labels[index] + '\n')
+                next_index = index + 1
+            section_fmt.append((values_fmt + '\n') * (nb_points - next_index))
+            section_fmts.append(''.join(section_fmt))
         with open(filename, 'w') as fileout:
-            for section in self.sections:
-                fileout.write('     %i     0     0    %i  %s   %s\n' % (section.id, section.nb_points,
-                                                                        section.PK, section.name))
-                for x, y, z, limit in section.iter_on_points():
-                    fileout.write(' %12.4f %12.4f %12.4f %s\n' % (x, y, z, limit))
-                fileout.write(Geometry.ST_SECTION_ENDING + '\n')
+            self._write_sections(fileout, headers, section_fmts, [self.store.x, self.store.y, self.store.z],
+                                 footer=Geometry.ST_SECTION_ENDING + '\n')
 
-    def save_courlis(self, filename):
+    @staticmethod
+    def courlis_format(filename):
         """
-        Save geometry in a Mascaret/Courlis file format
-        :param filename: output filename
+        :param filename: Mascaret/Courlis geometry filename
         :type filename: str
+        :return: points have coordinates (and headers have bank and `AXE` coordinates), points have layer elevations
+        :rtype: (bool, bool)
         """
         if filename.endswith('.geo'):
-            ref, layers = False, False
+            return False, False
         elif filename.endswith('.georef'):
-            ref, layers = True, False
+            return True, False
         elif filename.endswith('.geoC'):
-            ref, layers = False, True
+            return False, True
         elif filename.endswith('.georefC'):
-            ref, layers = True, True
+            return True, True
         else:
             raise GeometryRequestException('File format is not supported, only: geo, georef, geoC or georefC!')
 
+    def save_courlis(self, filename):
+        """
+        Save geometry in a Mascaret/Courlis file format
+        :param filename: output filename
+        :type filename: str
+        """
+        ref, layers = Geometry.courlis_format(filename)
         with open(filename, 'w') as fileout:
-            for section in self.sections:
-                positions_str = ''
-                if ref:
-                    # Get river_banks and `AXE` coordinates if necessary
-                    axe_point_index = section.get_limit('FON')
-                    positions_str += ' %f %f %f %f' % (section.x[0], section.y[0], section.x[-1], section.y[-1])
-                    positions_str += ' AXE %f %f' % (section.x[axe_point_index], section.y[axe_point_index])
-
-                # Write profile header
-                fileout.write('Profil Bief_0 %s %f%s\n' % (section.name, section.PK, positions_str))
-
-                # Write points and layers si necessary
-                if not ref and not layers:
-                    for dist, z in zip(section.distances, section.z):
-                        fileout.write('%f %f B\n' % (dist, z))
-                elif ref and not layers:
-                    for dist, x, y, z in zip(section.distances, section.x, section.y, section.z):
-                        fileout.write('%f %f B %f %f\n' % (dist, z, x, y))
-                elif not ref and layers:
-                    for i, (dist, z) in enumerate(zip(section.distances, section.z)):
-                        if self.nb_layers == 0:
-                            layers_str = ''
-                        else:
-                            layers_str = ' ' + ' '.join([Geometry.COURLIS_FLOAT_FMT % zl
-                                                         for zl in section.layers_elev[:, i]])
-                        fileout.write('%f %f%s B\n' % (dist, z, layers_str))
-                elif ref and layers:
-                    for i, (dist, x, y, z) in enumerate(zip(section.distances, section.x, section.y, section.z)):
-                        if self.nb_layers == 0:
-                            layers_str = ''
-                        else:
-                            layers_str = ' ' + ' '.join([Geometry.COURLIS_FLOAT_FMT % zl
-                                                         for zl in section.layers_elev[:, i]])
-                        fileout.write('%f %f%s B %f %f\n' % (dist, z, layers_str, x, y))
+            self.write_courlis(fileout, ref, layers)
 
-    def save_shp(self, filename):
-        w = shapefile.Writer(shapefile.POINTZ)
-        w.field('profil', 'C', '32')
-        w.field('PK', 'N', decimal=6)
-        w.field('dist', 'N', decimal=6)
-        for name in self.layer_names:
-            w.field('Z_' + name, 'N', decimal=6)
+    def write_courlis(self, fileout, ref, layers):
+        """
+        Write all sections in a Mascaret/Courlis file format (with the reach name in their headers)
+        :param fileout: output file (opened in text mode)
+        :type fileout: file object
+        :param ref: write coordinates of points and bank and `AXE` coordinates in headers
+        :type ref: bool
+        :param layers: write layer elevations of points
+        :type layers: bool
+        """
+        store = self.store
+        headers = []
         for section in self.sections:
-            for i, (dist, x, y, z) in enumerate(zip(section.distances, section.x, section.y, section.z)):
-                w.point(x, y, z, shapeType=shapefile.POINTZ)
-                if self.nb_layers == 0:
-                    layers_elev = []
-                else:
-                    layers_elev = section.layers_elev[:, 2]
-                w.record(section.name, section.PK, dist, *layers_elev)
-        w.save(filename)
+            positions_str = ''
+            if ref:
+                # Get river_banks and `AXE` coordinates if necessary
+                axe_point_index = section.get_limit('FON')
+                positions_str += ' %f %f %f %f' % (section.x[0], section.y[0], section.x[-1], section.y[-1])
+                positions_str += ' AXE %f %f' % (section.x[axe_point_index], section.y[axe_point_index])
+            headers.append('Profil %s %s %f%s\n' % (self.reach_name, section.name, section.PK, positions_str))
+
+        # Points and layers if necessary
+        point_fmt = '%f %f'
+        columns = [store.distances, store.z]
+        if layers and store.nb_layers() > 0:
+            point_fmt += (' ' + Geometry.COURLIS_FLOAT_FMT) * store.nb_layers()
+            columns += list(store.layers_elev)
+        point_fmt += ' B'
+        if ref:
+            point_fmt += ' %f %f'
+            columns += [store.x, store.y]
+        self._write_sections(fileout, headers, point_fmt + '\n', columns)
+
+    def save_native(self, filename):
+        """
+        Save geometry in the native binary format (see `courlis_tools.core.native_geom`)
+        :param filename: output filename (with extension `.npz`)
+        :type filename: str
+        """
+        if not filename.endswith(NATIVE_EXTENSION):
+            raise GeometryRequestException('Native geometry file has to end with `%s`' % NATIVE_EXTENSION)
+        save_native(filename, self.store, self.layer_names)
+
+    def save_shp(self, filename):
+        """
+        Save all points as POINTZ with their section, PK, distance and the elevation of each layer
+        :param filename: output filename
+        :type filename: str
+        """
+        store = self.store
+        nb_points_per_section = store.nb_points_per_section()
+        fields = [('profil', 'C', 32, 0), ('PK', 'N', 50, 6), ('dist', 'N', 50, 6)]
+        fields += [('Z_' + name, 'N', 50, 6) for name in self.layer_names]
+        columns = [np.repeat(store.names, nb_points_per_section), np.repeat(store.PK, nb_points_per_section),
+                   store.distances]
+        if store.nb_layers() > 0:
+            columns += list(store.layers_elev)
+        write_pointz(filename, store.x, store.y, store.z)
+        write_dbf(filename, fields, columns)
 
     def export_trace_shp(self, filename):
-        w = shapefile.Writer(shapefile.POLYLINEZ)
-        w.field('profil', 'C', '32')
-        w.field('PK', 'N', decimal=6)
-        for section in self.sections:
-            coord = [(x, y, z) for x, y, z in zip(section.x, section.y, section.z)]
-            w.line(parts=[coord], shapeType=shapefile.POLYLINEZ)
-            w.record(section.name, section.PK)
-        w.save(filename)
+        store = self.store
+        write_polylinez(filename, [(store.x[part], store.y[part], store.z[part])
+                                   for part in (store.section_slice(i) for i in range(store.nb_sections))])
+        write_dbf(filename, [('profil', 'C', 32, 0), ('PK', 'N', 50, 6)], [store.names, store.PK])
 
     def export_limits_shp(self, filename):
-        limits = {}
-        for section in self.sections:
-            for limit, index in section.limits.items():
-                if limit not in limits:
-                    limits[limit] = []
-                limits[limit].append((section.x[index], section.y[index]))
-
-        w = shapefile.Writer(shapefile.POLYLINEZ)
-        w.field('name', 'C', '32')
-        for limit, coord in limits.items():
-            w.line(parts=[coord], shapeType=shapefile.POLYLINEZ)
-            w.record(limit)
-        w.save(filename)
+        store = self.store
+        lines = []
+        for limit_name in store.limit_names:
+            index = store.limit_points(limit_name)
+            index = index[index != SectionStore.NO_LIMIT]
+            lines.append((store.x[index], store.y[index], np.zeros(len(index))))
+        write_polylinez(filename, lines)
+        write_dbf(filename, [('name', 'C', 32, 0)], [store.limit_names])
 
     def __iter__(self):
         return self
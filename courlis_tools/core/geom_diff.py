@@ -0,0 +1,235 @@
+"""
+Morphological changes between two geometries (e.g. an initial survey and a later survey or a simulated final state)
+
+Sections of both geometries are matched by PK (nearest PK within a tolerance) or by name. The profiles of every pair
+are compared on their common part only (distances relative to the first point or to a limit, such as `FON`), on a
+common distance grid: the union of the distances of both profiles (exact comparison of both piecewise linear
+profiles) or regular samples.
+
+Results:
+* every point of the grid: elevation before, after and delta (`after - before`)
+* every pair: area change (integral of the delta along the profile), split into deposited (positive part) and eroded
+    (negative part) areas, exactly on intervals where the delta changes sign
+* cumulative volume changes along PK (average end area method between consecutive pairs)
+
+All the pairs are processed at once: distances are shifted by pair so that the profiles of every pair are in a
+separate range of a single increasing array (interpolated with one `numpy.interp` call by value).
+"""
+import numpy as np
+
+from .section_interp import _ranges
+from .section_store import SectionStore
+from .sediment_budget import positive_integrals
+from .utils import GeometryRequestException
+from .writers.write_shp import write_dbf, write_pointz, write_polylinez
+
+
+MATCH_PK = 'PK'
+MATCH_NAME = 'name'
+PK_TOLERANCE = 1e-3  # maximum PK difference of matched sections (m)
+
+
+def match_sections(first, second, match=MATCH_PK, tolerance=PK_TOLERANCE):
+    """
+    Pairs of sections of two geometries (a section of the second geometry can be matched several times)
+    :param first: geometry of the sections before
+    :type first: SectionStore
+    :param second: geometry of the sections after
+    :type second: SectionStore
+    :param match: MATCH_PK (nearest PK within the tolerance) or MATCH_NAME (first section with the same name)
+    :type match: str
+    :param tolerance: maximum PK difference (MATCH_PK only)
+    :type tolerance: float
+    :return: positions of the matched sections in the first and in the second geometry (in the first order)
+    :rtype: (numpy 1D-array, numpy 1D-array)
+    """
+    if match == MATCH_PK:
+        if first.nb_sections == 0 or second.nb_sections == 0:
+            return np.array([], dtype=int), np.array([], dtype=int)
+        order = np.argsort(second.PK, kind='stable')
+        sorted_PK = second.PK[order]
+        right = np.clip(np.searchsorted(sorted_PK, first.PK), 0, second.nb_sections - 1)
+        left = np.maximum(right - 1, 0)
+        nearest = np.where(np.abs(sorted_PK[left] - first.PK) <= np.abs(sorted_PK[right] - first.PK), left, right)
+        matched = np.flatnonzero(np.abs(sorted_PK[nearest] - first.PK) <= tolerance)
+        return matched, order[nearest[matched]]
+    elif match == MATCH_NAME:
+        positions = {}
+        for i, name in enumerate(second.names.tolist()):
+            positions.setdefault(name, i)
+        pairs = [(i, positions[name]) for i, name in enumerate(first.names.tolist()) if name in positions]
+        if not pairs:
+            return np.array([], dtype=int), np.array([], dtype=int)
+        first_sections, second_sections = zip(*pairs)
+        return np.array(first_sections, dtype=int), np.array(second_sections, dtype=int)
+    else:
+        raise GeometryRequestException('Unknown matching `%s` (among: %s)' % (match, [MATCH_PK, MATCH_NAME]))
+
+
+def _bounds(store, sections, origin):
+    """Distances of the first and the last point of sections relative to their origin (NaN without origin)"""
+    starts, ends = store.offsets[sections], store.offsets[sections + 1] - 1
+    if origin is None:
+        origins = store.distances[starts]
+    else:
+        points = store.limit_points(origin)[sections]
+        origins = np.where(points != SectionStore.NO_LIMIT, store.distances[np.maximum(points, 0)], np.nan)
+    return store.distances[starts] - origins, store.distances[ends] - origins, origins
+
+
+class GeometryDiff:
+    """
+    Elevation changes between the matched sections of two geometries
+
+    first_sections <numpy 1D-array>: (nb_pairs) position of the sections in the first geometry
+    second_sections <numpy 1D-array>: (nb_pairs) position of the sections in the second geometry
+    names <numpy 1D-array>: (nb_pairs) names of the sections (in the first geometry)
+    PK <numpy 1D-array>: (nb_pairs) PK of the sections (in the first geometry)
+    offsets <numpy 1D-array>: (nb_pairs + 1) position of the first grid point of each pair
+    distances <numpy 1D-array>: (nb_grid_points) distance from the origin of each grid point
+    x, y <numpy 1D-array>: (nb_grid_points) coordinates of each grid point (on the first geometry)
+    z_before, z_after <numpy 1D-array>: (nb_grid_points) elevation of each grid point in both geometries
+    dz <numpy 1D-array>: (nb_grid_points) elevation change (`z_after - z_before`)
+    areas, deposited_areas, eroded_areas <numpy 1D-array>: (nb_pairs) area changes of every pair (eroded is positive)
+    volumes, deposited_volumes, eroded_volumes <numpy 1D-array>: (nb_pairs) cumulative volume changes from the first
+        pair (eroded is positive)
+    """
+    def __init__(self, first, second, match=MATCH_PK, tolerance=PK_TOLERANCE, step=None, origin=None):
+        """
+        :param first: geometry of the sections before
+        :type first: SectionStore
+        :param second: geometry of the sections after
+        :type second: SectionStore
+        :param match: MATCH_PK or MATCH_NAME (see `match_sections`)
+        :type match: str
+        :param tolerance: maximum PK difference (MATCH_PK only)
+        :type tolerance: float
+        :param step: distance between regular grid points (union of the distances of both profiles if None)
+        :type step: float
+        :param origin: name of the limit from which distances are compared (first point if None)
+        :type origin: str
+        """
+        if step is not None and step <= 0:
+            raise GeometryRequestException('Step has to be positive (%f)' % step)
+        first_sections, second_sections = match_sections(first, second, match, tolerance)
+
+        # Pairs with a common part (sections without the origin limit are ignored)
+        first_non_empty = first.nb_points_per_section()[first_sections] > 0
+        second_non_empty = second.nb_points_per_section()[second_sections] > 0
+        kept = first_non_empty & second_non_empty
+        first_sections, second_sections = first_sections[kept], second_sections[kept]
+        first_starts, first_ends, first_origins = _bounds(first, first_sections, origin)
+        second_starts, second_ends, second_origins = _bounds(second, second_sections, origin)
+        lows, highs = np.maximum(first_starts, second_starts), np.minimum(first_ends, second_ends)
+        kept = highs >= lows
+        first_sections, second_sections = first_sections[kept], second_sections[kept]
+        first_origins, second_origins = first_origins[kept], second_origins[kept]
+        lows, highs = lows[kept], highs[kept]
+        extent_lows = np.minimum(first_starts[kept], second_starts[kept])
+        extent_highs = np.maximum(first_ends[kept], second_ends[kept])
+        nb_pairs = len(first_sections)
+
+        self.first_sections, self.second_sections = first_sections, second_sections
+        self.names = first.names[first_sections]
+        self.PK = first.PK[first_sections]
+        if nb_pairs == 0:
+            self.offsets = np.zeros(1, dtype=int)
+            self.distances, self.x, self.y, self.z_before, self.z_after, self.dz = (np.array([]) for _ in range(6))
+            self.areas, self.deposited_areas, self.eroded_areas = (np.array([]) for _ in range(3))
+            self.volumes, self.deposited_volumes, self.eroded_volumes = (np.array([]) for _ in range(3))
+            return
+
+        # Profiles of both geometries on a single increasing axis (pairs are separated by a gap of 1 m)
+        shifts = np.concatenate(([0.0], np.cumsum(extent_highs - extent_lows + 1.0)))[:-1] - extent_lows
+        samples = []
+        for store, sections, origins in ((first, first_sections, first_origins),
+                                         (second, second_sections, second_origins)):
+            nb_points = store.nb_points_per_section()[sections]
+            points = _ranges(store.offsets[sections], nb_points)
+            pairs = np.repeat(np.arange(nb_pairs), nb_points)
+            samples.append((points, pairs, store.distances[points] - origins[pairs]))
+
+        # Common grid on the common part of every pair
+        if step is None:
+            grid_pairs = np.concatenate((samples[0][1], samples[1][1], np.arange(nb_pairs), np.arange(nb_pairs)))
+            grid_distances = np.concatenate((samples[0][2], samples[1][2], lows, highs))
+            inside = (grid_distances >= lows[grid_pairs]) & (grid_distances <= highs[grid_pairs])
+            grid_pairs, grid_distances = grid_pairs[inside], grid_distances[inside]
+        else:
+            nb_regular = np.floor((highs - lows) / step).astype(int) + 1
+            regular_pairs = np.repeat(np.arange(nb_pairs), nb_regular)
+            grid_pairs = np.concatenate((regular_pairs, np.arange(nb_pairs)))
+            grid_distances = np.concatenate((lows[regular_pairs] +
+                                             step * _ranges(np.zeros(nb_pairs, dtype=int), nb_regular), highs))
+        grid_keys, unique = np.unique(grid_distances + shifts[grid_pairs], return_index=True)
+        grid_pairs = grid_pairs[unique]
+        self.distances = grid_keys - shifts[grid_pairs]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(grid_pairs, minlength=nb_pairs))))
+
+        (first_points, first_pairs, first_distances), (second_points, second_pairs, second_distances) = samples
+        first_keys = first_distances + shifts[first_pairs]
+        second_keys = second_distances + shifts[second_pairs]
+        self.x = np.interp(grid_keys, first_keys, first.x[first_points])
+        self.y = np.interp(grid_keys, first_keys, first.y[first_points])
+        self.z_before = np.interp(grid_keys, first_keys, first.z[first_points])
+        self.z_after = np.interp(grid_keys, second_keys, second.z[second_points])
+        self.dz = self.z_after - self.z_before
+
+        # Area changes of every pair (on intervals between consecutive grid points of a pair)
+        intervals = np.flatnonzero(grid_pairs[:-1] == grid_pairs[1:])
+        interval_pairs = grid_pairs[intervals]
+        lengths = self.distances[intervals + 1] - self.distances[intervals]
+        dz_start, dz_end = self.dz[intervals], self.dz[intervals + 1]
+        self.areas = np.bincount(interval_pairs, (dz_start + dz_end) * lengths / 2, minlength=nb_pairs)
+        self.deposited_areas = np.bincount(interval_pairs, positive_integrals(dz_start, dz_end, lengths),
+                                           minlength=nb_pairs)
+        self.eroded_areas = np.bincount(interval_pairs, positive_integrals(-dz_start, -dz_end, lengths),
+                                        minlength=nb_pairs)
+
+        # Cumulative volume changes along PK
+        PK_lengths = np.abs(np.ediff1d(self.PK))
+        self.volumes, self.deposited_volumes, self.eroded_volumes = (
+            np.concatenate(([0.0], np.cumsum((areas[:-1] + areas[1:]) * PK_lengths / 2)))[:nb_pairs]
+            for areas in (self.areas, self.deposited_areas, self.eroded_areas))
+
+    @property
+    def nb_pairs(self):
+        return len(self.first_sections)
+
+    def total_volumes(self):
+        """
+        Volume changes between the first and the last pair
+        :return: net, deposited and eroded volumes
+        :rtype: (float, float, float)
+        """
+        if self.nb_pairs == 0:
+            return 0.0, 0.0, 0.0
+        return float(self.volumes[-1]), float(self.deposited_volumes[-1]), float(self.eroded_volumes[-1])
+
+    def save_shp(self, filename):
+        """
+        Save all grid points as POINTZ (elevation after) with their section, PK, distance and elevation change
+        :param filename: output filename
+        :type filename: str
+        """
+        nb_points = np.ediff1d(self.offsets)
+        fields = [('profil', 'C', 32, 0), ('PK', 'N', 50, 6), ('dist', 'N', 50, 6), ('Z_before', 'N', 50, 6),
+                  ('Z_after', 'N', 50, 6), ('dZ', 'N', 50, 6)]
+        write_pointz(filename, self.x, self.y, self.z_after)
+        write_dbf(filename, fields, [np.repeat(self.names, nb_points), np.repeat(self.PK, nb_points), self.distances,
+                                     self.z_before, self.z_after, self.dz])
+
+    def export_sections_shp(self, filename):
+        """
+        Save the common part of every pair as POLYLINEZ (elevation change as z) with its area and cumulative volume
+        changes
+        :param filename: output filename
+        :type filename: str
+        """
+        offsets = self.offsets.tolist()
+        write_polylinez(filename, [(self.x[start:end], self.y[start:end], self.dz[start:end])
+                                   for start, end in zip(offsets[:-1], offsets[1:])])
+        fields = [('profil', 'C', 32, 0), ('PK', 'N', 50, 6), ('area', 'N', 50, 6), ('area_dep', 'N', 50, 6),
+                  ('area_ero', 'N', 50, 6), ('vol', 'N', 50, 6), ('vol_dep', 'N', 50, 6), ('vol_ero', 'N', 50, 6)]
+        write_dbf(filename, fields, [self.names, self.PK, self.areas, self.deposited_areas, self.eroded_areas,
+                                     self.volumes, self.deposited_volumes, self.eroded_volumes])
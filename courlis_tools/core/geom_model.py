@@ -0,0 +1,143 @@
+"""
+Geometry of a model with several river reaches
+
+Every reach has its own `Geometry` (and its name is written in the headers of its sections in Mascaret/Courlis files).
+Reaches are loaded from many geometry files in parallel, on a pool of processes (parsing is CPU-bound) or of threads:
+workers return the stores of the sections and the views of the sections are rebuilt afterwards.
+All reaches are written in a single Mascaret/Courlis file in one pass (reach after reach, by blocks of sections).
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import os.path
+
+from .geom import Geometry
+from .utils import GeometryRequestException
+
+
+COURLIS_EXTENSIONS = ('.geo', '.georef', '.geoC', '.georefC')  # formats with the reach name in section headers
+
+
+def _section_reaches(filename):
+    """Reach name in the header of every section of a Mascaret/Courlis (or `georef`) file: 1D-array"""
+    with open(filename, 'r') as filein:
+        text = filein.read()
+    return np.array([header.group().split()[1] for header in Geometry.COURLIS_HEADER_REGEX.finditer(text)
+                     if header.start() == 0 or text[header.start() - 1] == '\n'], dtype=str)
+
+
+def _load_reach(filename, reach_name):
+    """Read a geometry file with a single reach (in a worker): store, layer names and reach name"""
+    geometry = Geometry(filename, reach_name)
+    if filename.endswith(COURLIS_EXTENSIONS):
+        reach_names = list(dict.fromkeys(_section_reaches(filename).tolist()))
+        if len(reach_names) > 1:
+            raise GeometryRequestException('File %s contains several river reaches (%s), read it with '
+                                           '`GeometryModel.load_courlis`' % (filename, ', '.join(reach_names)))
+    return geometry.store, geometry.layer_names, geometry.reach_name
+
+
+class GeometryModel:
+    """
+    Geometries of the river reaches of a model
+
+    reaches <{reach_name: Geometry}>: geometry of every reach (in order of addition), it can be given as is to
+        `SedimentBudget`
+    """
+    def __init__(self):
+        self.reaches = {}
+
+    @property
+    def reach_names(self):
+        return list(self.reaches.keys())
+
+    @property
+    def nb_sections(self):
+        return sum(geometry.store.nb_sections for geometry in self.reaches.values())
+
+    def add_reach(self, geometry, reach_name=None):
+        """
+        :param geometry: geometry of the reach
+        :type geometry: Geometry
+        :param reach_name: name of the reach (name of the geometry if None)
+        :type reach_name: str
+        """
+        if reach_name is not None:
+            geometry.reach_name = reach_name
+        if geometry.reach_name in self.reaches:
+            raise GeometryRequestException('River reach `%s` already exists' % geometry.reach_name)
+        self.reaches[geometry.reach_name] = geometry
+
+    def get_reach(self, reach_name):
+        try:
+            return self.reaches[reach_name]
+        except KeyError:
+            raise GeometryRequestException('River reach `%s` not found (among: %s)' % (reach_name, self.reach_names))
+
+    def load_reaches(self, filenames, reach_names=None, nb_workers=None, use_processes=True):
+        """
+        Read several geometry files in parallel (one reach by file, see `load_courlis` for a file with several reaches)
+        :param filenames: geometry files (any format supported by `Geometry`)
+        :type filenames: [str]
+        :param reach_names: name of every reach (if None: name in the first section header for Mascaret/Courlis and
+            `georef` files, otherwise filename without extension)
+        :type reach_names: [str]
+        :param nb_workers: number of workers (number of CPUs if None, files are read sequentially if 1)
+        :type nb_workers: int
+        :param use_processes: use a pool of processes (otherwise a pool of threads)
+        :type use_processes: bool
+        """
+        if reach_names is not None and len(reach_names) != len(filenames):
+            raise GeometryRequestException('%i reach names are given for %i files' % (len(reach_names),
+                                                                                      len(filenames)))
+        default_names = [os.path.splitext(os.path.basename(filename))[0] for filename in filenames]
+        if nb_workers == 1 or len(filenames) < 2:
+            results = [_load_reach(filename, name) for filename, name in zip(filenames, default_names)]
+        else:
+            executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+            with executor_class(max_workers=nb_workers) as executor:
+                futures = [executor.submit(_load_reach, filename, name)
+                           for filename, name in zip(filenames, default_names)]
+                results = [future.result() for future in futures]
+
+        names = [name for _, _, name in results] if reach_names is None else list(reach_names)
+        duplicates = sorted(set(name for name in names if names.count(name) > 1 or name in self.reaches))
+        if duplicates:
+            raise GeometryRequestException('River reaches are not unique: %s' % duplicates)
+        for filename, (store, layer_names, _), reach_name in zip(filenames, results, names):
+            self.add_reach(Geometry.from_store(store, layer_names, reach_name, filename))
+
+    def load_courlis(self, filename):
+        """
+        Read a Mascaret/Courlis geometry file with several reaches (sections are split by the reach of their header)
+        :param filename: geometry file (`geo`, `georef`, `geoC` or `georefC`)
+        :type filename: str
+        """
+        Geometry.courlis_format(filename)
+        geometry = Geometry(filename)
+        section_reaches = _section_reaches(filename)
+        reach_names = list(dict.fromkeys(section_reaches.tolist()))
+        duplicates = sorted(set(reach_names).intersection(self.reaches))
+        if duplicates:
+            raise GeometryRequestException('River reaches are not unique: %s' % duplicates)
+        for reach_name in reach_names:
+            store = geometry.store.select_sections(np.flatnonzero(section_reaches == reach_name))
+            self.add_reach(Geometry.from_store(store, geometry.layer_names, reach_name, filename))
+
+    def save_courlis(self, filename):
+        """
+        Save all reaches in a single Mascaret/Courlis file (sections are written reach after reach)
+        With layers (`geoC` and `georefC`), all reaches have to have the same layers.
+        :param filename: output filename
+        :type filename: str
+        """
+        ref, layers = Geometry.courlis_format(filename)
+        if layers:
+            layer_names = set(tuple(geometry.layer_names) for geometry in self.reaches.values())
+            nb_layers = set(geometry.nb_layers for geometry in self.reaches.values())
+            if len(layer_names) > 1 or len(nb_layers) > 1:
+                raise GeometryRequestException('River reaches have not the same layers: %s'
+                                               % {reach_name: geometry.layer_names
+                                                  for reach_name, geometry in self.reaches.items()})
+        with open(filename, 'w') as fileout:
+            for geometry in self.reaches.values():
+                geometry.write_courlis(fileout, ref, layers)
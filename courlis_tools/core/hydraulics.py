@@ -0,0 +1,201 @@
+"""
+Hydraulic geometry tables of cross-sections (wetted area, top width, wetted perimeter, hydraulic radius vs stage)
+
+The profile (distance, elevation) of a section is closed by vertical walls at its ends. For a water level h:
+* top width is the horizontal length of the profile below h
+* wetted perimeter is the length of the profile below h (with the walls)
+* wetted area is the integral of the top width from the lowest point up to h
+* hydraulic radius is the wetted area divided by the wetted perimeter
+
+Width and perimeter are piecewise linear and area is piecewise quadratic between the elevations of the points,
+so the tables are computed exactly at the sorted elevations of every section (same layout as a `SectionStore`:
+one level per point) and evaluated exactly at any level.
+
+Width and perimeter at every level are sums of ramps (sloping segments) and steps (flat segments) which start below
+this level: they are accumulated for all sections at once after a single sort of the events and the levels.
+"""
+import numpy as np
+
+from .utils import GeometryRequestException
+
+
+FLAT_TOLERANCE = 1e-6  # elevation difference under which a segment is considered as flat
+
+
+def _accumulate(section_index, event_sections, event_levels, quantities, query_levels, events_first):
+    """
+    Sum of the ramps and steps of the events below each query level (in the same section)
+    :param quantities: list of (slopes, steps) of the events for every quantity
+    :param events_first: True to include the events at the query level (right-continuous values)
+    :return: values of every quantity at each query level
+    :rtype: [numpy 1D-array]
+    """
+    nb_events, nb_queries = len(event_levels), len(query_levels)
+    sections = np.concatenate((event_sections, section_index))
+    is_query = np.concatenate((np.zeros(nb_events, dtype=bool), np.ones(nb_queries, dtype=bool)))
+    order = np.lexsort((is_query if events_first else ~is_query, np.concatenate((event_levels, query_levels)),
+                        sections))
+
+    # Sums restart at the first entry of every section
+    sorted_sections = sections[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_sections[1:] != sorted_sections[:-1]
+    first_position = np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))
+    queries = np.empty(nb_queries, dtype=int)
+    queries[order[is_query[order]] - nb_events] = np.flatnonzero(is_query[order])
+
+    def section_sums(values):
+        values = np.concatenate((values, np.zeros(nb_queries)))[order]
+        sums = np.cumsum(values)
+        return (sums - (sums - values)[first_position])[queries]
+
+    return [query_levels * section_sums(slopes) - section_sums(slopes * event_levels) + section_sums(steps)
+            for slopes, steps in quantities]
+
+
+class HydraulicTable:
+    """
+    Stage-geometry tables of all the sections of a geometry (for the bottom or a layer surface)
+
+    offsets <numpy 1D-array>: (nb_sections + 1) position of the first level of each section
+    levels <numpy 1D-array>: (nb_points) sorted elevations of the points of each section
+    areas <numpy 1D-array>: (nb_points) wetted area at each level
+    widths <numpy 1D-array>: (nb_points) top width at each level (just above it)
+    perimeters <numpy 1D-array>: (nb_points) wetted perimeter at each level (just above it)
+    width_slopes <numpy 1D-array>: (nb_points) derivative of the width between each level and the next one
+    perimeter_slopes <numpy 1D-array>: (nb_points) derivative of the perimeter between each level and the next one
+    """
+    def __init__(self, store, elevations):
+        """
+        :param store: geometry of the sections
+        :type store: SectionStore
+        :param elevations: elevations of the surface for every point (z or a layer)
+        :type elevations: numpy 1D-array
+        """
+        self.offsets = store.offsets
+        nb_points = store.nb_points_per_section()
+        section_index = store.section_index()
+        non_empty = np.flatnonzero(nb_points > 0)
+
+        # Elevations are relative to the lowest point of each section (to preserve the precision of sums)
+        self.bottoms = np.zeros(store.nb_sections)
+        if store.nb_points > 0:
+            self.bottoms[non_empty] = np.minimum.reduceat(elevations, store.offsets[:-1][non_empty])
+        z = elevations - self.bottoms[section_index]
+        order = np.lexsort((z, section_index))
+        relative_levels = z[order]
+        self.levels = elevations[order]
+
+        # Events of segments: ramps from their lowest to their highest point, or steps for flat segments
+        starts = np.flatnonzero(section_index[:-1] == section_index[1:])
+        z_low, z_high = np.minimum(z[starts], z[starts + 1]), np.maximum(z[starts], z[starts + 1])
+        lengths = np.abs(store.distances[starts + 1] - store.distances[starts])
+        slant_lengths = np.hypot(lengths, z_high - z_low)
+        flat = (z_high - z_low) <= FLAT_TOLERANCE
+        ramp = ~flat
+        heights = (z_high - z_low)[ramp]
+        event_sections = np.concatenate((section_index[starts], section_index[starts[ramp]]))
+        event_levels = np.concatenate((z_low, z_high[ramp]))
+        width_slopes = np.concatenate((np.where(flat, 0.0, lengths / np.where(flat, 1.0, z_high - z_low)),
+                                       -lengths[ramp] / heights))
+        perimeter_slopes = np.concatenate((np.where(flat, 0.0, slant_lengths / np.where(flat, 1.0, z_high - z_low)),
+                                           -slant_lengths[ramp] / heights))
+        width_steps = np.concatenate((np.where(flat, lengths, 0.0), np.zeros(len(heights))))
+        perimeter_steps = np.concatenate((np.where(flat, slant_lengths, 0.0), np.zeros(len(heights))))
+
+        # Vertical walls at both ends of every section (perimeter only)
+        ends = np.concatenate((store.offsets[:-1][non_empty], store.offsets[1:][non_empty] - 1))
+        wall_sections = np.concatenate((non_empty, non_empty))
+        event_sections = np.concatenate((event_sections, wall_sections))
+        event_levels = np.concatenate((event_levels, z[ends]))
+        width_slopes = np.concatenate((width_slopes, np.zeros(len(ends))))
+        perimeter_slopes = np.concatenate((perimeter_slopes, np.ones(len(ends))))
+        width_steps = np.concatenate((width_steps, np.zeros(len(ends))))
+        perimeter_steps = np.concatenate((perimeter_steps, np.zeros(len(ends))))
+
+        sorted_sections = section_index[order]
+        quantities = [(width_slopes, width_steps), (perimeter_slopes, perimeter_steps)]
+        self.widths, self.perimeters = _accumulate(sorted_sections, event_sections, event_levels, quantities,
+                                                   relative_levels, True)
+        left_widths, left_perimeters = _accumulate(sorted_sections, event_sections, event_levels, quantities,
+                                                   relative_levels, False)
+
+        # Slopes between consecutive levels of a section (above the highest one: constant width, walls)
+        next_in_section = np.zeros(store.nb_points, dtype=bool)
+        next_in_section[:-1] = sorted_sections[:-1] == sorted_sections[1:]
+        current = np.flatnonzero(next_in_section)
+        heights = relative_levels[current + 1] - relative_levels[current]
+        self.width_slopes = np.zeros(store.nb_points)
+        self.perimeter_slopes = np.full(store.nb_points, 2.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.width_slopes[current] = np.where(heights > 0, (left_widths[current + 1] - self.widths[current])
+                                                  / heights, 0.0)
+            self.perimeter_slopes[current] = np.where(heights > 0, (left_perimeters[current + 1] -
+                                                                    self.perimeters[current]) / heights, 0.0)
+
+        # Areas: exact integration of the width (linear between consecutive levels)
+        trapezoids = np.zeros(store.nb_points)
+        trapezoids[current + 1] = (self.widths[current] + left_widths[current + 1]) / 2 * heights
+        self.areas = np.cumsum(trapezoids)
+        if store.nb_points > 0:
+            self.areas -= np.repeat(self.areas[store.offsets[:-1][non_empty]], nb_points[non_empty])
+
+    def section_table(self, i):
+        """
+        Table of the i-th section
+        :return: levels, areas, widths, perimeters and hydraulic radii
+        :rtype: (numpy 1D-array, numpy 1D-array, numpy 1D-array, numpy 1D-array, numpy 1D-array)
+        """
+        part = slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            radii = np.where(self.perimeters[part] > 0, self.areas[part] / self.perimeters[part], 0.0)
+        return self.levels[part], self.areas[part], self.widths[part], self.perimeters[part], radii
+
+    def evaluate(self, water_levels, with_perimeters=False):
+        """
+        Hydraulic geometry of all sections for several frames at once
+        :param water_levels: water level of every section for every frame
+        :type water_levels: numpy 2D-array with the shape (nb_frames, nb_sections)
+        :param with_perimeters: True to compute also the wetted perimeters and the hydraulic radii
+        :type with_perimeters: bool
+        :return: areas and widths (and perimeters and radii), arrays with the shape (nb_frames, nb_sections)
+        :rtype: tuple
+        """
+        water_levels = np.asarray(water_levels, dtype=float)
+        nb_sections = len(self.offsets) - 1
+        if water_levels.ndim != 2 or water_levels.shape[1] != nb_sections:
+            raise GeometryRequestException('Water levels have a shape %s instead of (nb_frames, %i)'
+                                           % (water_levels.shape, nb_sections))
+        nb_points = np.ediff1d(self.offsets)
+        non_empty = nb_points > 0
+        first = self.offsets[:-1]
+        last = np.where(non_empty, self.offsets[1:] - 1, first)
+
+        # Last level below the water level (levels of a section are shifted after those of previous sections)
+        lowest = np.zeros(nb_sections)
+        highest = np.zeros(nb_sections)
+        if len(self.levels) > 0:
+            lowest[non_empty] = self.levels[first[non_empty]] - self.bottoms[non_empty]
+            highest[non_empty] = self.levels[last[non_empty]] - self.bottoms[non_empty]
+        shifts = np.concatenate(([0.0], np.cumsum(highest + 1.0)))[:-1]
+        keys = self.levels - self.bottoms[np.repeat(np.arange(nb_sections), nb_points)] + \
+            np.repeat(shifts, nb_points)
+
+        heights = water_levels - self.bottoms
+        clipped = np.clip(heights, lowest, highest) + shifts
+        index = np.searchsorted(keys, clipped.ravel(), side='right').reshape(water_levels.shape) - 1
+        wet = (heights >= lowest) & non_empty
+        if len(self.levels) == 0:
+            zeros = np.zeros(water_levels.shape)
+            return (zeros, zeros.copy(), zeros.copy(), zeros.copy()) if with_perimeters else (zeros, zeros.copy())
+        index = np.clip(index, np.minimum(first, len(self.levels) - 1), np.minimum(last, len(self.levels) - 1))
+        depths = np.where(wet, water_levels - self.levels[index], 0.0)
+        widths = np.where(wet, self.widths[index] + self.width_slopes[index] * depths, 0.0)
+        areas = np.where(wet, self.areas[index] + depths * (self.widths[index] +
+                                                            self.width_slopes[index] * depths / 2), 0.0)
+        if not with_perimeters:
+            return areas, widths
+        perimeters = np.where(wet, self.perimeters[index] + self.perimeter_slopes[index] * depths, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            radii = np.where(perimeters > 0, areas / perimeters, 0.0)
+        return areas, widths, perimeters, radii
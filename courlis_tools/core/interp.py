@@ -0,0 +1,91 @@
+"""
+Interpolation of scattered values (e.g. sediment core samples) on points
+
+Available methods:
+* `nearest`: value of the nearest survey point (KD-tree)
+* `linear`: linear interpolation on the Delaunay triangulation of the survey points
+* `idw`: inverse distance weighting of the `nb_neighbors` nearest survey points (KD-tree)
+
+Target points beyond `max_distance` from any survey point (and outside the convex hull for `linear`) get `fill_value`.
+The `linear` method requires at least 3 survey points which are not aligned.
+"""
+import numpy as np
+from scipy.interpolate import LinearNDInterpolator
+from scipy.spatial import cKDTree, QhullError
+
+from .utils import GeometryRequestException
+
+
+INTERPOLATION_METHODS = ('nearest', 'linear', 'idw')
+
+
+def interpolate_scattered(points_x, points_y, values, target_x, target_y, method='linear', fill_value=0.0,
+                          max_distance=None, nb_neighbors=8, power=2.0):
+    """
+    Interpolate scattered values on target points
+    :param points_x: coordinates along x axis of survey points
+    :type points_x: numpy 1D-array
+    :param points_y: coordinates along y axis of survey points
+    :type points_y: numpy 1D-array
+    :param values: values at survey points
+    :type values: numpy 1D-array
+    :param target_x: coordinates along x axis of target points
+    :type target_x: numpy 1D-array
+    :param target_y: coordinates along y axis of target points
+    :type target_y: numpy 1D-array
+    :param method: interpolation method (among `INTERPOLATION_METHODS`)
+    :type method: str
+    :param fill_value: value of target points which could not be interpolated
+    :type fill_value: float
+    :param max_distance: maximum distance to the nearest survey point (no limit if None)
+    :type max_distance: float
+    :param nb_neighbors: number of survey points used by `idw` method
+    :type nb_neighbors: int
+    :param power: power of distances for `idw` method
+    :type power: float
+    :return: 1D-array with the shape (nb_target_points)
+    """
+    points = np.column_stack((points_x, points_y)).astype(float)
+    values = np.asarray(values, dtype=float)
+    targets = np.column_stack((target_x, target_y)).astype(float)
+    if len(points) != len(values):
+        raise GeometryRequestException('Arrays have not the same length!')
+    if method not in INTERPOLATION_METHODS:
+        raise GeometryRequestException('Interpolation method `%s` is not supported (among: %s)'
+                                       % (method, INTERPOLATION_METHODS))
+    if len(points) == 0:
+        raise GeometryRequestException('No survey point to interpolate')
+
+    # Coordinates are centered to preserve the precision of the triangulation and of the distances
+    origin = points.mean(axis=0)
+    points = points - origin
+    targets = targets - origin
+
+    if method == 'linear':
+        try:
+            interpolator = LinearNDInterpolator(points, values, fill_value=fill_value)
+        except QhullError as e:
+            raise GeometryRequestException('Survey points can not be triangulated for linear interpolation (%i points, '
+                                           'at least 3 points which are not aligned are required), try `nearest` or '
+                                           '`idw` method\n%s' % (len(points), str(e).split('\n')[0]))
+        result = interpolator(targets)
+        if max_distance is not None:
+            distances, _ = cKDTree(points).query(targets, k=1, workers=-1)
+            result[distances > max_distance] = fill_value
+        return result
+
+    nb_neighbors = 1 if method == 'nearest' else min(nb_neighbors, len(points))
+    distances, index = cKDTree(points).query(targets, k=nb_neighbors, workers=-1)
+    if nb_neighbors == 1:
+        result = values[index.reshape(-1)]
+        nearest_distances = distances.reshape(-1)
+    else:
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / distances ** power
+        exact = np.isinf(weights)
+        weights[exact.any(axis=1)] = exact[exact.any(axis=1)]  # a target point on a survey point takes its value
+        result = np.sum(weights * values[index], axis=1) / np.sum(weights, axis=1)
+        nearest_distances = distances[:, 0]
+    if max_distance is not None:
+        result[nearest_distances > max_distance] = fill_value
+    return result
@@ -0,0 +1,111 @@
+"""
+Native binary geometry format (*.npz)
+
+The file is an uncompressed numpy archive (readable with `numpy.load`) which contains the arrays of a `SectionStore`:
+* `version`: format version (`FORMAT_VERSION`)
+* `ids`, `names`, `PK`: (nb_sections) profile identifiers, names and distances along the hydraulic axis
+* `offsets`: (nb_sections + 1) position of the first point of each section (last value is nb_points)
+* `x`, `y`, `z`, `distances`: (nb_points) point coordinates and cumulative distances along each profile
+* `limit_names`: (nb_limit_types) names of the limits
+* `limits`: (nb_sections, nb_limit_types) point numbering of limits in their section (-1 if absent)
+* `layer_names`: (nb_layers) names of the sediment layers
+* `layers_elev`: (nb_layers, nb_points) layer elevations
+
+Members are stored without compression, so they are memory-mapped (copy-on-write) instead of being read:
+loading a large model only reads the headers and the pages which are used afterwards.
+"""
+import numpy as np
+from struct import unpack
+import zipfile
+
+from .section_store import SectionStore
+from .utils import GeometryRequestException
+
+
+FORMAT_VERSION = 1
+NATIVE_EXTENSION = '.npz'
+ZIP_LOCAL_HEADER_SIZE = 30
+
+
+def save_native(filename, store, layer_names):
+    """
+    :param filename: output filename
+    :type filename: str
+    :param store: geometry of the sections
+    :type store: SectionStore
+    :param layer_names: names of the sediment layers
+    :type layer_names: [str]
+    """
+    layers_elev = store.layers_elev if store.layers_elev is not None else np.empty((0, store.nb_points))
+    if len(layer_names) != layers_elev.shape[0]:
+        raise GeometryRequestException('Number of layer names (%i) differs from number of layers (%i)'
+                                       % (len(layer_names), layers_elev.shape[0]))
+    np.savez(filename, version=np.array(FORMAT_VERSION), ids=store.ids, names=store.names, PK=store.PK,
+             offsets=store.offsets, x=store.x, y=store.y, z=store.z, distances=store.distances,
+             limit_names=np.array(store.limit_names, dtype=str), limits=store.limits,
+             layer_names=np.array(layer_names, dtype=str), layers_elev=layers_elev)
+
+
+def _read_member(filein, filename, info):
+    """Memory-map an uncompressed member of a numpy archive (or read it if it can not be mapped)"""
+    if info.compress_type == zipfile.ZIP_STORED:
+        filein.seek(info.header_offset)
+        local_header = filein.read(ZIP_LOCAL_HEADER_SIZE)
+        name_length, extra_length = unpack('<2H', local_header[26:30])
+        filein.seek(info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length)
+        version = np.lib.format.read_magic(filein)
+        if version in ((1, 0), (2, 0)):
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(filein)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(filein)
+            if not dtype.hasobject:
+                if np.prod(shape, dtype=int) == 0:
+                    return np.empty(shape, dtype=dtype)
+                return np.memmap(filename, dtype=dtype, mode='c', offset=filein.tell(), shape=shape,
+                                 order='F' if fortran_order else 'C')
+    return None
+
+
+def load_native(filename):
+    """
+    :param filename: path to the native geometry file
+    :type filename: str
+    :return: geometry of the sections and names of the sediment layers
+    :rtype: (SectionStore, [str])
+    """
+    arrays = {}
+    try:
+        with zipfile.ZipFile(filename) as archive, open(filename, 'rb') as filein:
+            for info in archive.infolist():
+                name = info.filename[:-len('.npy')]
+                array = _read_member(filein, filename, info)
+                if array is None:
+                    with archive.open(info) as member:
+                        array = np.lib.format.read_array(member, allow_pickle=False)
+                arrays[name] = array
+    except (zipfile.BadZipFile, ValueError) as e:
+        raise GeometryRequestException('File is not a native geometry file: %s' % e)
+
+    try:
+        version = int(arrays['version'])
+        if version != FORMAT_VERSION:
+            raise GeometryRequestException('Format version %i is not supported (only version %i)'
+                                           % (version, FORMAT_VERSION))
+        store = SectionStore(arrays['ids'], arrays['names'], arrays['PK'], arrays['offsets'],
+                             arrays['x'], arrays['y'], arrays['z'], distances=arrays['distances'])
+        store.limit_names = arrays['limit_names'].tolist()
+        store.limits = np.asarray(arrays['limits'])
+        layer_names = arrays['layer_names'].tolist()
+        layers_elev = arrays['layers_elev']
+    except KeyError as e:
+        raise GeometryRequestException('Array %s is missing in native geometry file' % e)
+    if store.limits.shape != (store.nb_sections, len(store.limit_names)):
+        raise GeometryRequestException('Limits have a shape %s instead of (%i, %i)'
+                                       % (store.limits.shape, store.nb_sections, len(store.limit_names)))
+    if layers_elev.shape != (len(layer_names), store.nb_points):
+        raise GeometryRequestException('Layers have a shape %s instead of (%i, %i)'
+                                       % (layers_elev.shape, len(layer_names), store.nb_points))
+    if layer_names:
+        store.layers_elev = layers_elev
+    return store, layer_names
@@ -0,0 +1,103 @@
+"""
+Binary sidecar cache of parsed result files
+
+The cache of `result.opt` is stored in the folder `result.opt.cache` which contains:
+* `header.json`: cache version, size and modification time of the source file, variables, model and times
+* `values_<i>.npy`: values of the i-th river reach (3D-array with the shape (nb_frames, nb_sections, nb_variables))
+
+The cache is ignored as soon as the size or the modification time of the source file differs.
+The values are reopened as read-only memory-mapped arrays, so they are shared between processes and only the
+pages which are used are read.
+"""
+import json
+import numpy as np
+import os
+
+from courlis_tools.core.res_plong import ResLongProfil
+from courlis_tools.core.utils import CourlisException
+
+
+CACHE_EXTENSION = '.cache'
+CACHE_VERSION = 2
+HEADER_NAME = 'header.json'
+
+
+def cache_folder(filename):
+    return filename + CACHE_EXTENSION
+
+
+def source_signature(filename):
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _values_path(folder, i_reach):
+    return os.path.join(folder, 'values_%i.npy' % i_reach)
+
+
+def load_cache(filename):
+    """
+    Load results from the cache of a source file
+    :param filename: path to the source file
+    :type filename: str
+    :return: results or None if there is no valid cache
+    :rtype: ResLongProfil
+    """
+    folder = cache_folder(filename)
+    try:
+        with open(os.path.join(folder, HEADER_NAME), 'r', encoding='utf-8') as filein:
+            header = json.load(filein)
+        if header['version'] != CACHE_VERSION or header['source'] != source_signature(filename):
+            return None
+        res_plong = ResLongProfil()
+        for varname, abbr, unit, precision in header['variables']:
+            res_plong.add_variable(varname, abbr, unit, precision)
+        values = {}
+        for i_reach, (reach_name, sections) in enumerate(header['model']):
+            res_plong.add_reach(reach_name)
+            for pk in sections:
+                res_plong.add_section(reach_name, pk)
+            values[reach_name] = np.load(_values_path(folder, i_reach), mmap_mode='r')
+        res_plong.load_frames(header['times'], values)
+    except (OSError, ValueError, KeyError, CourlisException):
+        return None
+    return res_plong
+
+
+def _replace_file(path, write_function):
+    """Write a file atomically (a file which is already memory-mapped by another process is left untouched)"""
+    tmp_path = '%s.%i.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as fileout:
+        write_function(fileout)
+    os.replace(tmp_path, path)
+
+
+def save_cache(filename, res_plong):
+    """
+    Write the cache of a source file
+    Failures are ignored (e.g. read-only folder): the source file will simply be parsed again next time.
+    :param filename: path to the source file
+    :type filename: str
+    :param res_plong: results read from the source file
+    :type res_plong: ResLongProfil
+    """
+    folder = cache_folder(filename)
+    header = {
+        'version': CACHE_VERSION,
+        'variables': list(zip(res_plong.variable_names, res_plong.variable_abbrs, res_plong.variable_units,
+                              res_plong.variable_precisions)),
+        'model': [[reach_name, [float(pk) for pk in sections]] for reach_name, sections in res_plong.model.items()],
+        'times': [float(time) for time in res_plong.time_serie],
+    }
+    try:
+        header['source'] = source_signature(filename)
+        os.makedirs(folder, exist_ok=True)
+        header_path = os.path.join(folder, HEADER_NAME)
+        if os.path.exists(header_path):
+            os.remove(header_path)  # invalidate the previous cache before overwriting its values
+        for i_reach, reach_name in enumerate(res_plong.model.keys()):
+            values = res_plong.get_values(reach_name)
+            _replace_file(_values_path(folder, i_reach), lambda fileout: np.save(fileout, values))
+        _replace_file(header_path, lambda fileout: fileout.write(json.dumps(header).encode('utf-8')))
+    except (OSError, CourlisException):
+        pass
@@ -0,0 +1,316 @@
+"""
+Lecture d'un fichier listing Courlis (*.listingcourlis)
+
+Fortran unformatted sequential file (binary) whose records have the same length and only contain floats:
+* For each frame, a record per section with:
+    * time
+    * section number
+    * pk
+    * a value per variable (see `LISTING_VARIABLES`, the discharge is computed from velocity and wetted area)
+* After each frame (except the first one), a block of records with the time and a marker:
+    * 999
+    * 1999 for each layer (followed by the layer number)
+    * 2999
+    * 3999
+
+Ce fichier binaire est lu directement (sans conversion en `opt`) : la précision des valeurs est conservée.
+`ListingIndex` permet un accès direct à un pas de temps ou à une section (sans lire tout le fichier).
+"""
+import numpy as np
+import os.path
+import scipy.io as spio
+
+from courlis_tools.core.parsers.cache import cache_folder, source_signature
+from courlis_tools.core.res_plong import ResLongProfil
+from courlis_tools.core.utils import CourlisException
+
+
+FORTRAN_MARKER_DTYPE = np.dtype('u4')  # record markers of scipy.io.FortranFile (default header_dtype)
+LAYER_MARKER = 1999
+REACH_NAME = '1'  # default unique river reach name
+LISTING_VARIABLES = [  # name, abbreviation, unit and precision
+    ('Cote de l eau', 'Z', 'm', 3),
+    ('Cote du fond', 'ZREF', 'm', 4),
+    ('Vitesse mineure', 'VMIN', 'm/s', 4),
+    ('Section mouillee mineure', 'E1', 'm2', 2),
+    ('Concentration en vase', 'CVas', 'g/l', 4),
+    ('Concentration en sable', 'CSbl', 'g/l', 4),
+    ('Depot cumule', 'DepT', 'T', 3),
+    ('Variation de surface cumulee', 'Vsur', 'm2', 3),
+    ('Flux massique de vase', 'FlVs', 'kg/m/s', 3),
+    ('Flux massique de sable', 'FlSb', 'kg/m/s', 3),
+    ('Contrainte au fond maximale', 'THMx', 'N/m2', 3),
+    ('Contrainte moyenne', 'THMy', 'N/m2', 3),
+    ('Contrainte effective moyenne', 'TEMy', 'N/m2', 3),
+    ('Concentration dequilibre moy', 'CeqM', 'g/l', 3),
+    ('Debit', 'Q', 'm3/s', 1),
+]
+NB_RECORD_VALUES = 2 + len(LISTING_VARIABLES)  # time, section number, pk and variables (except discharge)
+
+
+def record_dtype(nb_values):
+    """Fortran record (with its leading and trailing markers) containing `nb_values` floats"""
+    return np.dtype([('head', FORTRAN_MARKER_DTYPE), ('values', float, (nb_values,)), ('tail', FORTRAN_MARKER_DTYPE)])
+
+
+def _first_record_length(filename):
+    try:
+        with spio.FortranFile(filename, 'r') as f:
+            return f.read_reals(float).size
+    except (TypeError, ValueError) as e:
+        raise CourlisException('First record is not readable\n%s' % e)
+
+
+def _check_markers(records):
+    record_size = records.dtype['values'].itemsize
+    return np.all(records['head'] == record_size) and np.all(records['tail'] == record_size)
+
+
+def read_records(filename):
+    """
+    Read all the records of a Fortran unformatted sequential file containing floats
+    If the records have the same length, the whole file is read at once (the number of records is deduced from the
+    file size), otherwise the records are read one by one.
+    A truncated file (partial last record) raises a `CourlisException`.
+    :param filename: path to the binary file
+    :type filename: str
+    :return: 2D-array with the shape (nb_records, nb_values)
+    """
+    nb_values = _first_record_length(filename)
+    dtype = record_dtype(nb_values)
+    if os.path.getsize(filename) % dtype.itemsize == 0:
+        records = np.fromfile(filename, dtype=dtype)
+        if _check_markers(records):
+            return records['values']
+
+    res = []
+    try:
+        with spio.FortranFile(filename, 'r') as f:
+            while True:
+                res.append(f.read_reals(float))
+    except spio.FortranEOFError:  # end of file at a record boundary
+        pass
+    except (spio.FortranFormattingError, ValueError) as e:
+        raise CourlisException('Record n°%i is truncated or corrupted\n%s' % (len(res) + 1, e))
+    if any(len(values) != nb_values for values in res):
+        raise CourlisException('Records have not the same length')
+    return np.array(res)
+
+
+def frame_structure(times):
+    """
+    Frames are the successive sequences of records with the same time: the first frame contains a record per section
+    and the other ones are followed by a block of records
+    :param times: time of each record
+    :type times: numpy 1D-array
+    :return: first record of each frame, number of sections and number of records of a block
+    :rtype: (numpy 1D-array, int, int)
+    """
+    frame_starts = np.flatnonzero(np.ediff1d(times, to_begin=1.0) != 0)
+    frame_sizes = np.diff(np.append(frame_starts, len(times)))
+    nb_sections = int(frame_sizes[0])
+    block_size = int(frame_sizes[1]) - nb_sections if len(frame_starts) > 1 else 0
+    wrong_frames = np.flatnonzero(frame_sizes[1:] != nb_sections + block_size)
+    if block_size < 0 or wrong_frames.size > 0:
+        i = wrong_frames[0] + 1 if wrong_frames.size > 0 else 1
+        raise CourlisException('Unexpected number of records at time %f: %i instead of %i'
+                               % (times[frame_starts[i]], frame_sizes[i], nb_sections + block_size))
+    return frame_starts, nb_sections, block_size
+
+
+class ReadListingFile:
+    """
+    nb_sections <int>: number of sections
+    nb_layers <int>: number of sediment layers (number of records 1999 in a block)
+    block_markers <numpy 1D-array>: (block_size) marker of each record of a block
+    block_records <numpy 3D-array>: (nb_frames, block_size, NB_RECORD_VALUES) records of the block following each
+        frame (not-a-number for the first frame which has no block)
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.res_plong = ResLongProfil()
+        self.nb_sections = 0
+        self.nb_layers = 0
+        self.block_markers = np.array([])
+        self.block_records = None
+
+    def __enter__(self):
+        self._read_data()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def _read_data(self):
+        records = read_records(self.filename)
+        if records.shape[0] == 0:
+            raise CourlisException('No record found')
+        if records.shape[1] != NB_RECORD_VALUES:
+            raise CourlisException('Number of values per record not coherent: %i instead of %i'
+                                   % (records.shape[1], NB_RECORD_VALUES))
+
+        times = records[:, 0]
+        frame_starts, self.nb_sections, block_size = frame_structure(times)
+        nb_frames = len(frame_starts)
+
+        sections = records[frame_starts[:, np.newaxis] + np.arange(self.nb_sections)]
+        pks = sections[0, :, 2]
+        wrong_pks = sections[:, :, 2] != pks
+        if wrong_pks.any():
+            i_frame, i_section = np.argwhere(wrong_pks)[0]
+            raise CourlisException('Unexpected PK at time %f: %f (instead of %f)'
+                                   % (times[frame_starts[i_frame]], sections[i_frame, i_section, 2], pks[i_section]))
+
+        self.block_records = np.full((nb_frames, block_size, NB_RECORD_VALUES), np.nan)
+        if nb_frames > 1:
+            self.block_records[1:] = records[frame_starts[1:, np.newaxis] + self.nb_sections + np.arange(block_size)]
+            self.block_markers = self.block_records[1, :, 1]
+            if np.any(self.block_records[1:, :, 1] != self.block_markers):
+                raise CourlisException('Records following the frames are not always the same')
+        self.nb_layers = int(np.count_nonzero(self.block_markers == LAYER_MARKER))
+
+        for name, abbr, unit, precision in LISTING_VARIABLES:
+            self.res_plong.add_variable(name, abbr, unit, precision)
+        self.res_plong.add_reach(REACH_NAME)
+        for pk in pks.tolist():
+            self.res_plong.add_section(REACH_NAME, pk)
+        values = np.empty((nb_frames, self.nb_sections, len(LISTING_VARIABLES)))
+        values[:, :, :-1] = sections[:, :, 3:]
+        values[:, :, -1] = sections[:, :, 5] * sections[:, :, 6]  # discharge
+        self.res_plong.load_frames(times[frame_starts].tolist(), {REACH_NAME: values})
+
+    def get_layer_values(self):
+        """
+        Values of the records 1999 (after the time, the marker and the layer number)
+        :return: 3D-array with the shape (nb_frames, nb_layers, NB_RECORD_VALUES - 3)
+        """
+        return self.block_records[:, self.block_markers == LAYER_MARKER, 3:]
+
+
+class ListingIndex:
+    """
+    Random access to the frames, blocks and sections of a Courlis listing file (records must have the same length)
+
+    The records are scanned once and the index is stored in the cache folder of the listing file (see
+    `courlis_tools.core.parsers.cache`): it is built again only if the listing file has changed.
+    Records are then read with `seek` (a frame or a block) or through a memory-mapped file (a section for all frames).
+
+    nb_frames <int>: number of frames
+    nb_values <int>: number of floats per record
+    record_size <int>: size of a record in bytes (including Fortran markers)
+    nb_sections <int>: number of sections
+    block_size <int>: number of records of a block
+    times <numpy 1D-array>: (nb_frames) time of each frame
+    frame_offsets <numpy 1D-array>: (nb_frames) byte offset of the first section record of each frame
+    block_offsets <numpy 1D-array>: (nb_frames) byte offset of the first record of the block following each frame
+        (-1 for the first frame)
+    """
+
+    INDEX_NAME = 'listing_index.npz'
+    INDEX_VERSION = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.nb_values = 0
+        self.record_size = 0
+        self.nb_sections = 0
+        self.block_size = 0
+        self.times = np.array([])
+        self.frame_offsets = np.array([], dtype=np.int64)
+        self.block_offsets = np.array([], dtype=np.int64)
+        if not self._load():
+            self._build()
+            self._save()
+        self.nb_frames = len(self.times)
+
+    def _index_path(self):
+        return os.path.join(cache_folder(self.filename), ListingIndex.INDEX_NAME)
+
+    def _load(self):
+        try:
+            with np.load(self._index_path()) as index:
+                if index['version'] != ListingIndex.INDEX_VERSION or \
+                        index['source'].tolist() != list(source_signature(self.filename).values()):
+                    return False
+                self.nb_values, self.nb_sections, self.block_size = index['sizes'].tolist()
+                self.times, self.frame_offsets, self.block_offsets = \
+                    index['times'], index['frame_offsets'], index['block_offsets']
+        except (OSError, KeyError, ValueError):
+            return False
+        self.record_size = record_dtype(self.nb_values).itemsize
+        return True
+
+    def _save(self):
+        """Failures are ignored (e.g. read-only folder): the index will simply be built again next time"""
+        try:
+            os.makedirs(cache_folder(self.filename), exist_ok=True)
+            tmp_path = '%s.%i.tmp' % (self._index_path(), os.getpid())
+            with open(tmp_path, 'wb') as fileout:
+                np.savez(fileout, version=ListingIndex.INDEX_VERSION,
+                         source=list(source_signature(self.filename).values()),
+                         sizes=[self.nb_values, self.nb_sections, self.block_size],
+                         times=self.times, frame_offsets=self.frame_offsets, block_offsets=self.block_offsets)
+            os.replace(tmp_path, self._index_path())
+        except OSError:
+            pass
+
+    def _build(self):
+        self.nb_values = _first_record_length(self.filename)
+        dtype = record_dtype(self.nb_values)
+        self.record_size = dtype.itemsize
+        if os.path.getsize(self.filename) % self.record_size != 0:
+            raise CourlisException('Records have not the same length')
+        records = np.memmap(self.filename, dtype=dtype, mode='r')
+        if not _check_markers(records):
+            raise CourlisException('Records have not the same length')
+        times = np.array(records['values'][:, 0])
+        frame_starts, self.nb_sections, self.block_size = frame_structure(times)
+        self.times = times[frame_starts]
+        self.frame_offsets = frame_starts.astype(np.int64) * self.record_size
+        self.block_offsets = self.frame_offsets + self.nb_sections * self.record_size
+        self.block_offsets[0] = -1
+
+    def _read_records(self, offset, nb_records):
+        with open(self.filename, 'rb') as filein:
+            filein.seek(offset)
+            return np.fromfile(filein, dtype=record_dtype(self.nb_values), count=nb_records)['values']
+
+    def _check_frame(self, i_frame):
+        if not 0 <= i_frame < self.nb_frames:
+            raise CourlisException('Frame %i not found (among %i frames)' % (i_frame, self.nb_frames))
+
+    def read_frame(self, i_frame):
+        """
+        :return: records of the sections at a given frame: 2D-array with the shape (nb_sections, nb_values)
+        """
+        self._check_frame(i_frame)
+        return self._read_records(self.frame_offsets[i_frame], self.nb_sections)
+
+    def read_block(self, i_frame):
+        """
+        :return: records of the block following a given frame: 2D-array with the shape (block_size, nb_values)
+        """
+        self._check_frame(i_frame)
+        if self.block_offsets[i_frame] < 0:
+            return np.empty((0, self.nb_values))
+        return self._read_records(self.block_offsets[i_frame], self.block_size)
+
+    def read_section(self, i_section):
+        """
+        :param i_section: position of the section (starting from 0)
+        :return: records of a section for all frames: 2D-array with the shape (nb_frames, nb_values)
+        """
+        if not 0 <= i_section < self.nb_sections:
+            raise CourlisException('Section %i not found (among %i sections)' % (i_section, self.nb_sections))
+        records = np.memmap(self.filename, dtype=record_dtype(self.nb_values), mode='r')
+        return np.array(records['values'][self.frame_offsets // self.record_size + i_section])
+
+
+if __name__ == '__main__':
+    try:
+        with ReadListingFile('../../examples/results/result.listingcourlis') as listing:
+            print(listing.res_plong.summary())
+            print("~> Blocks: %i layers (markers: %s)" % (listing.nb_layers, listing.block_markers))
+    except CourlisException as e:
+        print(e)
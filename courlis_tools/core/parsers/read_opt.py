@@ -25,52 +25,86 @@ En pratique il y a 3 fichiers qui contiennent des résultats de type profil en l
 
 Ces fichiers sont lus séparément car ils contiennent des temps différents en général...
 """
+from itertools import islice
 import numpy as np
+import warnings
 
+from courlis_tools.core.parsers.cache import load_cache, save_cache
 from courlis_tools.core.res_plong import ResLongProfil
 from courlis_tools.core.utils import CourlisException
 
 
 class ReadOptFile:
+    """
+    The table of results is parsed in bulk (all the cells are converted at once and the frames, reaches and
+    sections are deduced from the columns). If the table is not fully numeric or some rows are malformed,
+    it is read again line by line to report the guilty line.
+
+    Huge files can be read frame by frame with `iter_frames` (only one frame is kept in memory).
+    Parsed results are stored in a binary sidecar cache (see `courlis_tools.core.parsers.cache`) unless `use_cache`
+    is False.
+    """
 
     ENCODINGS = ['utf-8', 'cp1252', 'latin-1']
+    NB_HEADER_COLUMNS = 4  # time, reach, id_profil and pk
 
-    def __init__(self, filename):
+    def __init__(self, filename, use_cache=True):
         self.filename = filename
+        self.use_cache = use_cache
         self.res_plong = ResLongProfil()
         self.file = None  # will be opened when called using `with` statement
-        self.lines = []
+        self.lines = []  # lines read so far (all the results are only split in lines if they are read line by line)
         self.current_line_id = 0
+        self.current_line = ''
 
     def error(self, message, show_line=True):
         error_message = message + '\n'
         if show_line:
             error_message += 'Guilty line n°%i:\n' % self.current_line_id
-            error_message += self.lines[self.current_line_id - 1].rstrip('\n')
+            error_message += self.current_line.rstrip('\n')
         raise CourlisException(error_message)
 
-    def __enter__(self):
+    def _open(self, read_function):
         for i, encoding in enumerate(ReadOptFile.ENCODINGS):
             try:
                 self.file = open(self.filename, 'r', encoding=encoding)
-                self.lines = self.file.readlines()
+                read_function()
                 break
             except UnicodeDecodeError as e:
-                if i == len(self.filename) - 1:
+                self.file.close()
+                if i == len(ReadOptFile.ENCODINGS) - 1:
                     raise CourlisException("Encoding not supported\n%s" % e)
-        self._read_data()
+                self.res_plong = ResLongProfil()
+                self.lines = []
+                self.current_line_id = 0
+
+    def __enter__(self):
+        if self.use_cache:
+            res_plong = load_cache(self.filename)
+            if res_plong is not None:
+                self.res_plong = res_plong
+                return self
+        self._open(self._read_data)
+        if self.use_cache:
+            save_cache(self.filename, self.res_plong)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.file.close()
+        if self.file is not None:
+            self.file.close()
         return False
 
     def _read_line(self):
         self.current_line_id += 1
-        return self.lines[self.current_line_id - 1].rstrip('\n')
+        if self.current_line_id > len(self.lines):
+            line = self.file.readline()
+            if not line:
+                raise IndexError
+            self.lines.append(line)
+        self.current_line = self.lines[self.current_line_id - 1]
+        return self.current_line.rstrip('\n')
 
-    def _read_line_resultat(self):
-        row = self._read_line()
+    def _parse_line_resultat(self, row):
         try:
             time_str, bief_name, _, pk_str, values_str = row.split(';', maxsplit=4)
         except ValueError:
@@ -87,7 +121,10 @@ class ReadOptFile:
             self.error('Number of values not coherent: %i instead of %i' % (len(values), self.res_plong.nb_variables))
         return time, bief_name.strip(), section_pk, values
 
-    def _read_data(self):
+    def _read_line_resultat(self):
+        return self._parse_line_resultat(self._read_line())
+
+    def _read_header(self):
         # Skip comments before variable definition
         row = self._read_line()
         while row != '[variables]':
@@ -97,19 +134,127 @@ class ReadOptFile:
         row = self._read_line()
         while row != '[resultats]':
             try:
-                name, abbr, unit, _ = row.split(';')
+                name, abbr, unit, precision = row.split(';')
+                precision = int(precision)
             except ValueError:
                 self.error('Variable description is not readable')
-            self.res_plong.add_variable(name.strip('\"'))
+            self.res_plong.add_variable(name.strip('\"'), abbr.strip('\"'), unit.strip('\"'), precision)
             row = self._read_line()
 
-        # Read results
+    def _read_data(self):
         try:
-            self.read_first_frame()
-            self.read_other_frames()
+            self._read_header()
+
+            # Read results
+            results = self.file.read()
+            if not self.read_all_frames(results):
+                self.lines.extend(results.splitlines(True))
+                self.read_first_frame()
+                self.read_other_frames()
         except IndexError:
             self.error('End of file reached suddently!', show_line=False)
 
+    def _error_in_rows(self, rows, row_index, message):
+        """Raise an error on a row of the results (`rows` are the lines following the current line)"""
+        self.current_line_id += row_index + 1
+        self.current_line = rows[row_index]
+        self.error(message)
+
+    def _parse_rows(self, text, nb_rows):
+        """
+        Convert rows of results to a 2D-array with the shape (nb_rows, nb_columns)
+        :param text: rows of results (without trailing whitespaces)
+        :type text: str
+        :return: None if some cells are not numeric or the number of columns is not constant
+        """
+        nb_columns = ReadOptFile.NB_HEADER_COLUMNS + self.res_plong.nb_variables
+        if text.count(';') != nb_rows * (nb_columns - 1):
+            return None
+        try:
+            with warnings.catch_warnings():  # older numpy versions only warn if the string is not read to its end
+                warnings.simplefilter('ignore', DeprecationWarning)
+                table = np.fromstring(text.replace('\n', ';'), sep=';')
+        except ValueError:
+            return None
+        if table.size != nb_rows * nb_columns:
+            return None
+        return table.reshape(nb_rows, nb_columns)
+
+    def _define_model(self, rows, pks):
+        """
+        Add reaches and sections to the model from the rows of the first frame
+        Reaches are the successive sequences of rows with the same reach name
+        :return: list of (reach_name, first_row, last_row + 1)
+        """
+        reach_names = [row.split(';', maxsplit=2)[1].strip() for row in rows]
+        reach_starts = [i for i, reach_name in enumerate(reach_names) if i == 0 or reach_name != reach_names[i - 1]]
+        reach_ends = reach_starts[1:] + [len(rows)]
+        reaches = []
+        for start, end in zip(reach_starts, reach_ends):
+            reach_name = reach_names[start]
+            if reach_name in self.res_plong.model:
+                self._error_in_rows(rows, start, 'River reach `%s` is defined twice' % reach_name)
+            self.res_plong.add_reach(reach_name)
+            for pk in pks[start:end].tolist():
+                self.res_plong.add_section(reach_name, pk)
+            reaches.append((reach_name, start, end))
+        return reaches
+
+    @staticmethod
+    def _check_frames(table, nb_rows_frame, model_pks):
+        """
+        Check that time is constant in each frame and that PKs are the ones of the model
+        :return: (row index, error message) for the first wrong row, None if all rows are correct
+        """
+        times, pks = table[:, 0], table[:, 3]
+        row_ids = np.arange(table.shape[0])
+        pos_in_frame = row_ids % nb_rows_frame
+        wrong_time = times != times[row_ids - pos_in_frame]
+        wrong_row = wrong_time | (pks != model_pks[pos_in_frame])
+        if not wrong_row.any():
+            return None
+        i = np.argmax(wrong_row)
+        if wrong_time[i]:
+            return i, 'Unexpected time: %f (instead of %f)' % (times[i], times[i - pos_in_frame[i]])
+        return i, 'Unexpected PK: %f (instead of %f)' % (pks[i], model_pks[pos_in_frame[i]])
+
+    def read_all_frames(self, results):
+        """
+        Read the table of results in bulk
+        :param results: content of the file after the line `[resultats]`
+        :type results: str
+        :return: False if the table can not be parsed in bulk (it has to be read line by line)
+        :rtype: bool
+        """
+        results = results.rstrip()
+        if not results:
+            raise IndexError
+        nb_rows = results.count('\n') + 1
+        table = self._parse_rows(results, nb_rows)
+        if table is None:
+            return False
+        times = table[:, 0]
+
+        # The first frame defines the model
+        nb_rows_frame = np.argmax(times != times[0]) or nb_rows
+        first_frame_end = -1
+        for _ in range(nb_rows_frame):
+            first_frame_end = results.find('\n', first_frame_end + 1)
+        first_rows = results[:first_frame_end if first_frame_end >= 0 else None].split('\n')
+        wrong_row = self._check_frames(table, nb_rows_frame, table[:nb_rows_frame, 3])
+        if wrong_row is not None:
+            self._error_in_rows(results.splitlines(), *wrong_row)
+        nb_frames, nb_remaining_rows = divmod(nb_rows, nb_rows_frame)
+        if nb_remaining_rows != 0:
+            raise IndexError
+        reaches = self._define_model(first_rows, table[:nb_rows_frame, 3])
+
+        values = table.reshape(nb_frames, nb_rows_frame, table.shape[1])
+        self.res_plong.add_frames(times[::nb_rows_frame].tolist(),
+                                  {reach_name: values[:, start:end, ReadOptFile.NB_HEADER_COLUMNS:]
+                                   for reach_name, start, end in reaches})
+        return True
+
     def read_first_frame(self):
         time, reach_name, pk, values = self._read_line_resultat()
         first_time = time
@@ -148,6 +293,95 @@ class ReadOptFile:
             except IndexError:
                 break
 
+    def _read_frame_table(self, rows):
+        """Convert the rows of a frame, reading them one by one if they can not be parsed in bulk"""
+        table = self._parse_rows(''.join(rows).rstrip(), len(rows))
+        if table is None:
+            table = np.empty((len(rows), ReadOptFile.NB_HEADER_COLUMNS + self.res_plong.nb_variables))
+            for i, row in enumerate(rows):
+                self.current_line_id += 1
+                self.current_line = row
+                time, _, pk, values = self._parse_line_resultat(row.rstrip('\n'))
+                table[i, 0], table[i, 3], table[i, ReadOptFile.NB_HEADER_COLUMNS:] = time, pk, values
+            self.current_line_id -= len(rows)
+        return table
+
+    @staticmethod
+    def _row_time(row):
+        try:
+            return float(row.split(';', maxsplit=1)[0])
+        except ValueError:
+            return None  # will be reported while converting the frame
+
+    def _iter_results(self):
+        # The first frame (which defines the model) ends when the time changes
+        rows = [self.file.readline()]
+        first_time = ReadOptFile._row_time(rows[0])
+        next_row = None
+        if first_time is not None:
+            for row in self.file:
+                time = ReadOptFile._row_time(row)
+                if time is not None and time != first_time:
+                    next_row = row
+                    break
+                rows.append(row)
+        while rows and not rows[-1].strip():
+            rows.pop()
+        if not rows:
+            raise IndexError
+        nb_rows_frame = len(rows)
+        table = self._read_frame_table(rows)
+        wrong_row = self._check_frames(table, nb_rows_frame, table[:, 3])
+        if wrong_row is not None:
+            self._error_in_rows(rows, *wrong_row)
+        reaches = self._define_model(rows, table[:, 3])
+        model_pks = table[:, 3].copy()
+
+        while True:
+            self.current_line_id += nb_rows_frame
+            yield float(table[0, 0]), {reach_name: table[start:end, ReadOptFile.NB_HEADER_COLUMNS:]
+                                       for reach_name, start, end in reaches}
+            if next_row is None:
+                break
+            rows = [next_row] + list(islice(self.file, nb_rows_frame))
+            next_row = rows.pop() if len(rows) > nb_rows_frame else None
+            if not ''.join(rows).strip():
+                break
+            if len(rows) < nb_rows_frame:
+                raise IndexError
+            table = self._read_frame_table(rows)
+            wrong_row = self._check_frames(table, nb_rows_frame, model_pks)
+            if wrong_row is not None:
+                self._error_in_rows(rows, *wrong_row)
+
+    def iter_frames(self):
+        """
+        Read the file frame by frame, without keeping its whole content in memory
+        The model and variables are defined in `res_plong` but the frames are not added to it.
+
+        :return: generator of (time, values) where values is a dict with reach names as keys and value is
+            a 2D-numpy array with the shape (nb_sections, nb_variables)
+        """
+        try:
+            self._open(self._read_header)
+            yield from self._iter_results()
+        except IndexError:
+            self.error('End of file reached suddently!', show_line=False)
+        except UnicodeDecodeError as e:
+            raise CourlisException("Encoding not supported\n%s" % e)
+        finally:
+            if self.file is not None:
+                self.file.close()
+
+
+def iter_frames(filename):
+    """
+    Iterate on the frames of an Opthyca file with a bounded memory (see `ReadOptFile.iter_frames`)
+    :param filename: path to the `opt` file
+    :type filename: str
+    """
+    return ReadOptFile(filename).iter_frames()
+
 
 if __name__ == '__main__':
     try:
@@ -156,6 +390,6 @@ if __name__ == '__main__':
             for i, time in enumerate(opt.res_plong.time_serie):
                 print("~> Frame %i: %f s" % (i, time))
                 for reach_name in opt.res_plong.model.keys():
-                    print("    - Reach: %s: shape=%s" % (reach_name, opt.res_plong.data[time][reach_name].shape))
+                    print("    - Reach: %s: shape=%s" % (reach_name, opt.res_plong.get_frame(time, reach_name).shape))
     except CourlisException as e:
         print(e)
@@ -13,6 +13,7 @@ Lecture d'un fichier de profil en long Courlis (*.plong)
 """
 import numpy as np
 
+from courlis_tools.core.parsers.cache import load_cache, save_cache
 from courlis_tools.core.res_plong import ResLongProfil
 from courlis_tools.core.utils import CourlisException
 
@@ -24,8 +25,9 @@ class ReadPlongFile:
 
     ENCODINGS = ['utf-8', 'cp1252', 'latin-1']
 
-    def __init__(self, filename):
+    def __init__(self, filename, use_cache=True):
         self.filename = filename
+        self.use_cache = use_cache
         self.res_plong = ResLongProfil()
         self.file = None  # will be opened when called using `with` statement
         self.lines = []
@@ -41,19 +43,30 @@ class ReadPlongFile:
         raise CourlisException(error_message)
 
     def __enter__(self):
+        if self.use_cache:
+            res_plong = load_cache(self.filename)
+            if res_plong is not None:
+                self.res_plong = res_plong
+                self.nb_sections = len(res_plong.model[REACH_NAME])
+                self.nb_layers = res_plong.nb_variables - 2
+                return self
         for i, encoding in enumerate(ReadPlongFile.ENCODINGS):
             try:
                 self.file = open(self.filename, 'r', encoding=encoding)
                 self.lines = self.file.readlines()
                 break
             except UnicodeDecodeError as e:
-                if i == len(self.filename) - 1:
+                self.file.close()
+                if i == len(ReadPlongFile.ENCODINGS) - 1:
                     raise CourlisException("Encoding not supported\n%s" % e)
         self._read_data()
+        if self.use_cache:
+            save_cache(self.filename, self.res_plong)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.file.close()
+        if self.file is not None:
+            self.file.close()
         return False
 
     def _read_line(self):
@@ -109,7 +122,7 @@ class ReadPlongFile:
                         var_name = 'Z_rb'
                     else:
                         var_name = 'Z_%i' % j
-                    self.res_plong.add_variable(var_name)
+                    self.res_plong.add_variable(var_name, unit='m', precision=2)
             self.res_plong.add_section(REACH_NAME, pk)
             all_values.append(values)
         self.res_plong.add_frame(time, {REACH_NAME: np.array(all_values)})
@@ -138,6 +151,6 @@ if __name__ == '__main__':
             for i, time in enumerate(plong.res_plong.time_serie):
                 print("~> Frame %i: %f s" % (i, time))
                 for reach_name in plong.res_plong.model.keys():
-                    print("    - Reach: %s: shape=%s" % (reach_name, plong.res_plong.data[time][reach_name].shape))
+                    print("    - Reach: %s: shape=%s" % (reach_name, plong.res_plong.get_frame(time, reach_name).shape))
     except CourlisException as e:
         print(e)
@@ -4,16 +4,29 @@ from courlis_tools.core.utils import CourlisException
 
 
 class ResLongProfil:
+    """
+    Results on a longitudinal profile (for one or several river reaches)
+
+    Values of each reach are stored in a single contiguous 3D-numpy array with the shape
+    (allocated_frames, nb_sections, nb_variables) which grows geometrically when frames are added.
+    Only the `nb_frames` first frames are meaningful, the accessors below return views (no copy).
+    """
+
+    INITIAL_NB_FRAMES = 16
 
     def __init__(self):
         self.variable_names = []
+        self.variable_abbrs = []
+        self.variable_units = []
+        self.variable_precisions = []  # number of decimals
         self.nb_variables = 0
         self.time_serie = []
         self.nb_frames = 0
         self.model = {}
-        # dict with variable names as keys, subdict with reach names as keys and
-        #   value is a 2D-numpy array with the shape (nb_sections, nb_variables)
-        self.data = {}
+        # dict with reach names as keys and value is a 3D-numpy array with the shape
+        #   (allocated_frames, nb_sections, nb_variables)
+        self.values = {}
+        self.time_index = {}  # position of each time in `time_serie`
 
     def add_reach(self, reach_name):
         self.model[reach_name] = []
@@ -21,33 +34,143 @@ class ResLongProfil:
     def add_section(self, reach_name, pk):
         self.model[reach_name].append(pk)
 
-    def add_variable(self, varname):
+    def add_variable(self, varname, abbr=None, unit='', precision=3):
         if varname in self.variable_names:
             raise CourlisException('Variable `%s` already exists' % varname)
         self.variable_names.append(varname)
+        self.variable_abbrs.append(varname if abbr is None else abbr)
+        self.variable_units.append(unit)
+        self.variable_precisions.append(precision)
         self.nb_variables += 1
 
+    def nb_allocated_frames(self):
+        if not self.values:
+            return 0
+        return min(array.shape[0] for array in self.values.values())
+
+    def allocate(self, nb_frames):
+        """
+        Reserve storage for at least `nb_frames` frames (model and variables have to be defined)
+        :param nb_frames: number of frames to store
+        :type nb_frames: int
+        """
+        for reach_name, sections in self.model.items():
+            array = self.values.get(reach_name)
+            if array is None:
+                self.values[reach_name] = np.empty((nb_frames, len(sections), self.nb_variables))
+            elif array.shape[0] < nb_frames:
+                new_array = np.empty((nb_frames, len(sections), self.nb_variables))
+                new_array[:self.nb_frames] = array[:self.nb_frames]
+                self.values[reach_name] = new_array
+
     def add_frame(self, time, values):
-        if time in self.time_serie:
-            raise CourlisException('Time %f already exists' % time)
-        self.data[time] = values
-        self.time_serie.append(time)
-        self.nb_frames += 1
+        """
+        :param time: time of the frame
+        :type time: float
+        :param values: dict with reach names as keys and value is a 2D-array with the shape (nb_sections, nb_variables)
+        :type values: dict
+        """
+        self.add_frames([time], {reach_name: np.asarray(array)[np.newaxis] for reach_name, array in values.items()})
 
-    def get_variable_with_time(self, time, reach_name, varname):
-        pos_var = self.variable_names.index(varname)
-        return self.data[time][reach_name][:, pos_var]
+    def add_frames(self, times, values):
+        """
+        :param times: times of the frames
+        :type times: [float]
+        :param values: dict with reach names as keys and value is a 3D-array with the shape
+            (len(times), nb_sections, nb_variables)
+        :type values: dict
+        """
+        new_time_index = {}
+        for time in times:
+            if time in self.time_index or time in new_time_index:
+                raise CourlisException('Time %f already exists' % time)
+            new_time_index[time] = self.nb_frames + len(new_time_index)
+        nb_new_frames = len(new_time_index)
+        nb_allocated_frames = self.nb_allocated_frames()
+        if self.nb_frames + nb_new_frames > nb_allocated_frames:
+            # Geometric growth (amortized constant time by frame, whatever the number of frames of each call)
+            self.allocate(max(self.nb_frames + nb_new_frames, 2 * nb_allocated_frames,
+                              ResLongProfil.INITIAL_NB_FRAMES))
+        for reach_name, array in self.values.items():
+            try:
+                array[self.nb_frames:self.nb_frames + nb_new_frames] = values[reach_name]
+            except KeyError:
+                raise CourlisException('River reach `%s` is missing' % reach_name)
+            except ValueError as e:
+                raise CourlisException('Values of reach `%s` are not coherent: %s' % (reach_name, e))
+        self.time_index.update(new_time_index)
+        self.time_serie.extend(times)
+        self.nb_frames += nb_new_frames
 
-    def get_variable_with_section(self, reach_name, section, varname):
-        pos_var = self.variable_names.index(varname)
+    def load_frames(self, times, values):
+        """
+        Set all the frames at once without copying the arrays (they can be memory-mapped)
+        :param times: times of the frames
+        :type times: [float]
+        :param values: dict with reach names as keys and value is a 3D-array with the shape
+            (len(times), nb_sections, nb_variables)
+        :type values: dict
+        """
+        if self.nb_frames != 0:
+            raise CourlisException('Frames can only be loaded in an empty result')
+        self.values = {}
+        for reach_name, sections in self.model.items():
+            try:
+                array = values[reach_name]
+            except KeyError:
+                raise CourlisException('River reach `%s` is missing' % reach_name)
+            if array.shape != (len(times), len(sections), self.nb_variables):
+                raise CourlisException('Values of reach `%s` are not coherent: shape %s' % (reach_name, array.shape))
+            self.values[reach_name] = array
+        self.time_serie = list(times)
+        self.time_index = {time: i for i, time in enumerate(self.time_serie)}
+        if len(self.time_index) != len(self.time_serie):
+            raise CourlisException('Times are not unique')
+        self.nb_frames = len(self.time_serie)
+
+    def get_values(self, reach_name):
+        """Values of all variables: 3D-array with the shape (nb_frames, nb_sections, nb_variables)"""
+        try:
+            return self.values[reach_name][:self.nb_frames]
+        except KeyError:
+            raise CourlisException('River reach `%s` not found (among: %s)' % (reach_name, list(self.model.keys())))
+
+    def _pos_variable(self, varname):
         try:
-            pos_section = self.model[reach_name].index(section)
+            return self.variable_names.index(varname)
         except ValueError:
+            raise CourlisException('Variable `%s` not found (among: %s)' % (varname, self.variable_names))
+
+    def _pos_time(self, time):
+        try:
+            return self.time_index[time]
+        except KeyError:
+            raise CourlisException('Time %f not found' % time)
+
+    def _pos_section(self, reach_name, section):
+        try:
+            return self.model[reach_name].index(section)
+        except KeyError:
             raise CourlisException('River reach `%s` not found (among: %s)' % (reach_name, list(self.model.keys())))
-        result = []
-        for time in self.time_serie:
-            result.append(self.data[time][reach_name][pos_section, pos_var])
-        return np.array(result)
+        except ValueError:
+            raise CourlisException('Section at PK %f not found in river reach `%s`' % (section, reach_name))
+
+    def get_frame(self, time, reach_name):
+        """Values of all variables at a given time: 2D-array with the shape (nb_sections, nb_variables)"""
+        return self.get_values(reach_name)[self._pos_time(time)]
+
+    def get_variable_with_time(self, time, reach_name, varname):
+        """Values of a variable at a given time: 1D-array with the shape (nb_sections)"""
+        return self.get_values(reach_name)[self._pos_time(time), :, self._pos_variable(varname)]
+
+    def get_variable_with_section(self, reach_name, section, varname):
+        """Values of a variable at a given section: 1D-array with the shape (nb_frames)"""
+        pos_section = self._pos_section(reach_name, section)
+        return self.get_values(reach_name)[:, pos_section, self._pos_variable(varname)]
+
+    def get_variable_field(self, reach_name, varname):
+        """Values of a variable for all frames and sections: 2D-array with the shape (nb_frames, nb_sections)"""
+        return self.get_values(reach_name)[:, :, self._pos_variable(varname)]
 
     def summary(self):
         txt = '~> Model\n'
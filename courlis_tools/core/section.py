@@ -2,6 +2,7 @@ from math import sqrt
 import numpy as np
 
 from .utils import GeometryRequestException
+from .validation import check_layer_elevations, make_report, NO_VALUE
 
 
 class Section:
@@ -18,8 +19,13 @@ class Section:
     nb_points <int>: number of points
     limits <{limit_name: point_numbering}>: position of limits
     layer_elev <numpy 2D-array>: (nb_layers, nb_points)
+
+    A section of a geometry is a view on its `SectionStore` (see `SectionStore.set_view`): its id, name, PK and limits
+    are read from and written to the store, its points and layers can not be replaced (edit the geometry instead).
     """
     def __init__(self, id, name, PK):
+        self._store = None  # store of which the section is a view
+        self._index = None  # position of the section in its store
         self.id = id
         self.name = name
         self.PK = PK
@@ -32,18 +38,87 @@ class Section:
         self.limits = {}
         self.layers_elev = None
 
+    @property
+    def id(self):
+        return self._id if self._store is None else int(self._store.ids[self._index])
+
+    @id.setter
+    def id(self, id):
+        if self._store is not None:
+            self._store.ids[self._index] = id
+        self._id = id
+
+    @property
+    def name(self):
+        return self._name if self._store is None else str(self._store.names[self._index])
+
+    @name.setter
+    def name(self, name):
+        if self._store is not None:
+            self._store.set_name(self._index, name)
+        self._name = name
+
+    @property
+    def PK(self):
+        return self._PK if self._store is None else float(self._store.PK[self._index])
+
+    @PK.setter
+    def PK(self, PK):
+        if self._store is not None:
+            self._store.PK[self._index] = PK
+        self._PK = PK
+
+    @property
+    def limits(self):
+        """Position of limits {limit_name: point_numbering} (a mapping which writes in the store for a view)"""
+        return self._limits if self._store is None else self._store.limits_view(self._index)
+
+    @limits.setter
+    def limits(self, limits):
+        if self._store is not None:
+            self._store.set_section_limits(self._index, limits)
+        self._limits = limits
+
+    def _check_not_view(self):
+        if self._store is not None:
+            raise GeometryRequestException('%s is a view on the sections of a geometry: its points and layers can not '
+                                           'be replaced (use `Geometry.add_layers` or `Geometry.set_sections`)' % self)
+
     def set_points_from_trans(self, dist_array, z_array):
         if len(dist_array) != len(z_array):
             raise GeometryRequestException('Arrays have not the same length')
-        self.allocate(len(dist_array))
-        for i, (dist, z) in enumerate(zip(dist_array, z_array)):
-            if i == 0:
-                limit = 'RD'
-            elif i == (self.nb_points - 1):
-                limit = 'RG'
-            else:
-                limit = None
-            self.set_point(i, self.PK, dist, z, limit)
+        nb_points = len(dist_array)
+        limits = {}
+        if nb_points > 0:
+            limits['RD'] = 0
+        if nb_points > 1:
+            limits['RG'] = nb_points - 1
+        self.set_points(np.full(nb_points, float(self.PK)), np.asarray(dist_array, dtype=float),
+                        np.asarray(z_array, dtype=float), limits)
+
+    def set_points(self, x, y, z, limits=None):
+        """
+        Set all points at once (arrays are not copied) and compute the cumulative distances
+        :param x: point coordinates along x axis
+        :type x: numpy 1D-array
+        :param y: point coordinates along y axis
+        :type y: numpy 1D-array
+        :param z: point elevations
+        :type z: numpy 1D-array
+        :param limits: position of limits
+        :type limits: {limit_name: point_numbering}
+        """
+        self._check_not_view()
+        if not len(x) == len(y) == len(z):
+            raise GeometryRequestException('Arrays have not the same length')
+        self.x = x
+        self.y = y
+        self.z = z
+        self.nb_points = len(x)
+        self.limits = {} if limits is None else limits
+        self.distances = np.zeros(self.nb_points)
+        if self.nb_points > 1:
+            np.cumsum(np.sqrt(np.ediff1d(x) ** 2 + np.ediff1d(y) ** 2), out=self.distances[1:])
 
     def get_limit(self, limit_name):
         try:
@@ -58,6 +133,7 @@ class Section:
         return None
 
     def allocate(self, nb_points):
+        self._check_not_view()
         self.x = np.empty(nb_points)
         self.y = np.empty(nb_points)
         self.z = np.empty(nb_points)
@@ -77,6 +153,7 @@ class Section:
                                 sqrt((self.x[i] - self.x[i - 1])**2 + (self.y[i] - self.y[i - 1])**2)
 
     def add_layer(self, thickness):
+        self._check_not_view()
         if self.layers_elev is None:
             self.layers_elev = np.empty((1, self.nb_points))
             self.layers_elev[0, :] = self.z - thickness
@@ -103,8 +180,16 @@ class Section:
         """
         return list(set(self.limits.keys()).intersection(other.limits.keys()))
 
-    def check_elevations(self):
-        pass  #TODO
+    def check_elevations(self, tolerance=0.0):
+        """
+        Check that layers are below the bottom and do not cross each other
+        :param tolerance: elevation difference which is accepted
+        :type tolerance: float
+        :return: problems found (see `courlis_tools.core.validation`), section position is unknown (NO_VALUE)
+        :rtype: numpy structured array
+        """
+        points, layers, rules = check_layer_elevations(self.z, self.layers_elev, tolerance)
+        return make_report(np.full(len(points), NO_VALUE), np.full(len(points), self.id), points, layers, rule=rules)
 
     def __repr__(self):
         return 'Section #%i (%s) at PK %f' % (self.id, self.name, self.PK)
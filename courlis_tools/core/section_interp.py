@@ -0,0 +1,244 @@
+"""
+Interpolation of intermediate cross-sections between consecutive profiles (mesh densification)
+
+Every pair of consecutive sections is split into parts by their common limits (banks, channel axis...), in the same
+order in both sections. A point of a section is parametrized by `u = k + t`, where `k` is the number of its part and
+`t` its normalized distance along this part. The intermediate sections of a pair share a common grid of `u` (union of
+the parameters of both sections), on which x, y, z and layer elevations are linearly blended according to PK.
+
+All the pairs are processed at once: the parameters are shifted by `pair * stride` so that the samples of every
+pair are in a separate range of a single increasing array, which is interpolated with one `numpy.interp` call by
+value (x, y, z and every layer).
+"""
+import numpy as np
+
+from .section_store import SectionStore
+from .utils import GeometryRequestException
+from .validation import REQUIRED_LIMITS
+
+
+INTERP_NAME_FMT = '%s_%i'  # name of an intermediate section (upstream section name, number after it)
+
+
+def _ranges(starts, lengths):
+    """Concatenation of the ranges [start, start + length[ (1D-array)"""
+    lengths = np.asarray(lengths, dtype=int)
+    ends = np.cumsum(lengths)
+    return np.repeat(np.asarray(starts, dtype=int) - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+def _pair_breaks(store, first, second):
+    """
+    Common limits of pairs of sections, kept only if they are in the same order in both sections
+    :param first: position of the first sections of the pairs
+    :param second: position of the second sections of the pairs
+    :return: point numbering of the kept limits (sorted, padded with NO_LIMIT) in the first and second sections,
+        position of the limit names for each of them
+    :rtype: (numpy 2D-array, numpy 2D-array, numpy 2D-array) with the shape (nb_pairs, nb_limit_types)
+    """
+    nb_pairs, nb_limit_types = len(first), len(store.limit_names)
+    first_limits, second_limits = store.limits[first], store.limits[second]
+    common = (first_limits != SectionStore.NO_LIMIT) & (second_limits != SectionStore.NO_LIMIT)
+    order = np.argsort(np.where(common, first_limits, np.iinfo(int).max), axis=1, kind='stable')
+    rows = np.arange(nb_pairs)[:, np.newaxis]
+    common, first_limits, second_limits = common[rows, order], first_limits[rows, order], second_limits[rows, order]
+
+    # Largest set of limits which are strictly increasing in both sections (longest increasing subsequence)
+    lengths = np.zeros((nb_pairs, nb_limit_types), dtype=int)
+    previous = np.full((nb_pairs, nb_limit_types), -1)
+    for j in range(nb_limit_types):
+        for i in range(j):
+            longer = common[:, i] & (first_limits[:, i] < first_limits[:, j]) & \
+                (second_limits[:, i] < second_limits[:, j]) & (lengths[:, i] > lengths[:, j] - 1)
+            previous[:, j] = np.where(longer, i, previous[:, j])
+            lengths[:, j] = np.where(longer, lengths[:, i] + 1, lengths[:, j])
+        lengths[:, j] = np.where(common[:, j], np.maximum(lengths[:, j], 1), 0)
+    kept = np.zeros((nb_pairs, nb_limit_types), dtype=bool)
+    current = np.argmax(lengths, axis=1) if nb_limit_types > 0 else np.full(nb_pairs, -1)
+    current[lengths[np.arange(nb_pairs), current] == 0] = -1
+    for _ in range(nb_limit_types):
+        valid = np.flatnonzero(current >= 0)
+        kept[valid, current[valid]] = True
+        current[valid] = previous[valid, current[valid]]
+
+    # Kept limits are moved at the beginning of the rows
+    compact = np.argsort(~kept, axis=1, kind='stable')
+    kept = kept[rows, compact]
+    breaks = []
+    for limits in (first_limits, second_limits):
+        breaks.append(np.where(kept, limits[rows, compact], SectionStore.NO_LIMIT))
+    names = np.where(kept, order[rows, compact], SectionStore.NO_LIMIT)
+    return breaks[0], breaks[1], names
+
+
+def _parametrize(store, sections, breaks, stride):
+    """
+    Samples (shifted parameter and position of the point) of sections split by their breaks
+    Parameters of the points are completed by the bounds of every part (so that empty parts are kept).
+    :param sections: position of the section of each pair
+    :param breaks: point numbering of the limits of each pair (sorted, padded with NO_LIMIT)
+    :return: shifted parameters (increasing) and global position of the points
+    :rtype: (numpy 1D-array, numpy 1D-array)
+    """
+    nb_pairs = len(sections)
+    nb_points = store.nb_points_per_section()[sections]
+    starts = store.offsets[sections]
+    nb_breaks = np.sum(breaks != SectionStore.NO_LIMIT, axis=1)
+
+    # Bounds of parts: first point, limits and last point (padded with the last point)
+    bounds = np.empty((nb_pairs, breaks.shape[1] + 2), dtype=int)
+    bounds[:, 0] = 0
+    bounds[:, 1:-1] = np.where(breaks != SectionStore.NO_LIMIT, breaks, (nb_points - 1)[:, np.newaxis])
+    bounds[:, -1] = nb_points - 1
+    bounds_distances = store.distances[starts[:, np.newaxis] + bounds]
+
+    pair = np.repeat(np.arange(nb_pairs), nb_points)
+    points = _ranges(starts, nb_points)
+    local = points - starts[pair]
+    part = np.sum(np.where(breaks[pair] != SectionStore.NO_LIMIT, breaks[pair], np.iinfo(int).max)
+                  <= local[:, np.newaxis], axis=1)
+    start_distances = bounds_distances[pair, part]
+    part_lengths = bounds_distances[pair, part + 1] - start_distances
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(part_lengths > 0, (store.distances[points] - start_distances) / part_lengths, 0.0)
+
+    bound_mask = np.arange(bounds.shape[1])[np.newaxis, :] <= (nb_breaks + 1)[:, np.newaxis]
+    bound_pairs, bound_parts = np.nonzero(bound_mask)
+    params = np.concatenate((pair * stride + part + np.clip(t, 0.0, 1.0),
+                             bound_pairs * stride + bound_parts.astype(float)))
+    positions = np.concatenate((points, starts[bound_pairs] + bounds[bound_pairs, bound_parts]))
+    order = np.argsort(params, kind='stable')
+    return params[order], positions[order]
+
+
+def _check_pair_breaks(store, first, second, break_names, required_limits):
+    """
+    Check that the required limits which are common to both sections of every pair are kept
+    :raises GeometryRequestException: if a required limit is dropped because of the order of the limits
+    """
+    required = [j for j, limit_name in enumerate(store.limit_names) if limit_name in required_limits]
+    common = (store.limits[first] != SectionStore.NO_LIMIT) & (store.limits[second] != SectionStore.NO_LIMIT)
+    kept = np.zeros(common.shape, dtype=bool)
+    kept_pairs, kept_breaks = np.nonzero(break_names != SectionStore.NO_LIMIT)
+    kept[kept_pairs, break_names[kept_pairs, kept_breaks]] = True
+    dropped = common[:, required] & ~kept[:, required]
+    wrong_pairs = np.flatnonzero(dropped.any(axis=1))
+    if wrong_pairs.size > 0:
+        required_names = np.array(store.limit_names)[required]
+        raise GeometryRequestException('Limits are not in the same order in consecutive sections, these limits can not '
+                                       'be paired: %s' % ', '.join('%s and %s (%s)' % (
+                                           store.names[first[i]], store.names[second[i]],
+                                           ', '.join(required_names[dropped[i]])) for i in wrong_pairs))
+
+
+def interpolate_sections(store, spacing, required_limits=REQUIRED_LIMITS):
+    """
+    Insert intermediate sections between consecutive sections
+    :param store: geometry of the sections (sorted along the hydraulic axis)
+    :type store: SectionStore
+    :param spacing: maximum PK spacing between two consecutive sections
+    :type spacing: float
+    :param required_limits: limits which have to be paired when they are in both sections of a pair (an error is
+        raised if they are not in the same order), the other common limits are only kept if their order allows it
+    :type required_limits: [str]
+    :return: geometry with original and intermediate sections (profile identifiers are renumbered from 1),
+        or the same geometry if no section has to be inserted
+    :rtype: SectionStore
+    """
+    if spacing <= 0:
+        raise GeometryRequestException('Spacing has to be positive (%f)' % spacing)
+    nb_points = store.nb_points_per_section()
+    values = np.vstack([store.x, store.y, store.z] +
+                       ([] if store.layers_elev is None else list(store.layers_elev)))
+
+    # Pairs of consecutive sections and number of intermediate sections of each pair
+    first = np.arange(max(store.nb_sections - 1, 0))
+    second = first + 1
+    delta_PK = store.PK[second] - store.PK[first]
+    nb_interp = np.ceil(np.abs(delta_PK) / spacing - 1e-9).astype(int) - 1
+    nb_interp[(nb_points[first] == 0) | (nb_points[second] == 0) | (nb_interp < 0)] = 0
+    pairs = np.flatnonzero(nb_interp > 0)
+    if len(pairs) == 0:
+        return store
+
+    # Common grid of every pair and values of both sections on it
+    first_breaks, second_breaks, break_names = _pair_breaks(store, first[pairs], second[pairs])
+    _check_pair_breaks(store, first[pairs], second[pairs], break_names, required_limits)
+    stride = len(store.limit_names) + 3
+    first_params, first_positions = _parametrize(store, first[pairs], first_breaks, stride)
+    second_params, second_positions = _parametrize(store, second[pairs], second_breaks, stride)
+    grid = np.unique(np.concatenate((first_params, second_params)))
+    grid_pairs = (grid // stride).astype(int)
+    first_values = np.array([np.interp(grid, first_params, row[first_positions]) for row in values])
+    first_values = first_values.reshape(len(values), len(grid))
+    second_values = np.array([np.interp(grid, second_params, row[second_positions]) for row in values])
+    second_values = second_values.reshape(len(values), len(grid))
+
+    # Parts which are empty in both sections (e.g. limit on the first point) would duplicate points
+    duplicate = np.zeros(len(grid), dtype=bool)
+    duplicate[1:] = (grid_pairs[1:] == grid_pairs[:-1]) & \
+        np.all(first_values[:, 1:] == first_values[:, :-1], axis=0) & \
+        np.all(second_values[:, 1:] == second_values[:, :-1], axis=0)
+    grid_index = np.cumsum(~duplicate) - 1
+    grid_pairs, first_values, second_values = grid_pairs[~duplicate], first_values[:, ~duplicate], \
+        second_values[:, ~duplicate]
+    nb_grid_points = len(grid_pairs)
+    grid_offsets = np.concatenate(([0], np.cumsum(np.bincount(grid_pairs, minlength=len(pairs)))))
+
+    # Limits on the grids (bound k + 1 of a pair is its k-th limit)
+    grid_limits = np.full((len(pairs), len(store.limit_names)), SectionStore.NO_LIMIT, dtype=int)
+    kept_pairs, kept = np.nonzero(break_names != SectionStore.NO_LIMIT)
+    grid_limits[kept_pairs, break_names[kept_pairs, kept]] = \
+        grid_index[np.searchsorted(grid, kept_pairs * stride + kept + 1.0)] - grid_offsets[kept_pairs]
+
+    # Output sections: each original section followed by the intermediate sections of its pair
+    pair_nb_interp = nb_interp[pairs]
+    interp_pairs = np.repeat(np.arange(len(pairs)), pair_nb_interp)
+    interp_numbers = _ranges(np.ones(len(pairs), dtype=int), pair_nb_interp)
+    weights = interp_numbers / (pair_nb_interp[interp_pairs] + 1.0)
+    upstream = first[pairs][interp_pairs]
+    nb_sections = store.nb_sections + len(interp_pairs)
+    is_original = np.zeros(nb_sections, dtype=bool)
+    is_original[np.arange(store.nb_sections) + np.concatenate(([0], np.cumsum(nb_interp)))[:store.nb_sections]] = True
+    new = ~is_original
+
+    # Source of the points of every output section in a pool of values: [originals | first grids | second grids]
+    pool = np.hstack((values, first_values, second_values))
+    source_first = np.empty(nb_sections, dtype=int)
+    source_second = np.empty(nb_sections, dtype=int)
+    lengths = np.empty(nb_sections, dtype=int)
+    section_weights = np.zeros(nb_sections)
+    source_first[is_original] = source_second[is_original] = store.offsets[:-1]
+    lengths[is_original] = nb_points
+    source_first[new] = store.nb_points + grid_offsets[interp_pairs]
+    source_second[new] = store.nb_points + nb_grid_points + grid_offsets[interp_pairs]
+    lengths[new] = np.ediff1d(grid_offsets)[interp_pairs]
+    section_weights[new] = weights
+
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    local = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+    point_weights = np.repeat(section_weights, lengths)
+    first_points = np.repeat(source_first, lengths) + local
+    second_points = np.repeat(source_second, lengths) + local
+    new_values = np.empty((len(values), offsets[-1]))
+    for row, new_row in zip(pool, new_values):
+        np.add(row[first_points] * (1.0 - point_weights), row[second_points] * point_weights, out=new_row)
+
+    PK = np.empty(nb_sections)
+    PK[is_original] = store.PK
+    PK[new] = store.PK[upstream] + weights * delta_PK[upstream]
+    names = np.empty(nb_sections, dtype=object)
+    names[is_original] = store.names
+    names[new] = [INTERP_NAME_FMT % (name, number)
+                  for name, number in zip(store.names[upstream].tolist(), interp_numbers.tolist())]
+    limits = np.empty((nb_sections, len(store.limit_names)), dtype=int)
+    limits[is_original] = store.limits
+    limits[new] = grid_limits[interp_pairs]
+
+    result = SectionStore(np.arange(1, nb_sections + 1), names.tolist(), PK, offsets,
+                          new_values[0], new_values[1], new_values[2])
+    result.limit_names = list(store.limit_names)
+    result.limits = limits
+    if store.layers_elev is not None:
+        result.layers_elev = np.ascontiguousarray(new_values[3:])
+    return result
@@ -0,0 +1,309 @@
+"""
+Array-backed storage of all the cross-sections of a model
+
+Points of every section are concatenated in flat contiguous arrays (compressed sparse row layout): the points of the
+i-th section are in the slice `offsets[i]:offsets[i + 1]`. `Section` objects are built as views on these arrays, so
+whole-model operations (layers, exports, checks...) can be done with single vectorized operations on the store.
+"""
+from collections.abc import MutableMapping
+import numpy as np
+
+from .section import Section
+from .utils import GeometryRequestException
+
+
+class SectionLimits(MutableMapping):
+    """Position of limits of a section of a store {limit_name: point_numbering}: changes are written in the store"""
+
+    def __init__(self, store, i):
+        self.store = store
+        self.i = i
+
+    def __getitem__(self, limit_name):
+        try:
+            index = int(self.store.limits[self.i, self.store.limit_names.index(limit_name)])
+        except ValueError:
+            raise KeyError(limit_name)
+        if index == SectionStore.NO_LIMIT:
+            raise KeyError(limit_name)
+        return index
+
+    def __setitem__(self, limit_name, index):
+        self.store.set_section_limit(self.i, limit_name, index)
+
+    def __delitem__(self, limit_name):
+        self[limit_name]  # KeyError if absent
+        self.store.set_section_limit(self.i, limit_name, SectionStore.NO_LIMIT)
+
+    def __iter__(self):
+        return iter(self.store.section_limits(self.i))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.store.limits[self.i] != SectionStore.NO_LIMIT))
+
+    def __repr__(self):
+        return repr(self.store.section_limits(self.i))
+
+
+class SectionStore:
+    """
+    Geometry of all the cross-sections of a model
+
+    nb_sections <int>: number of sections
+    nb_points <int>: total number of points
+    ids <numpy 1D-array>: (nb_sections) profile identifiers
+    names <numpy 1D-array>: (nb_sections) profile names
+    PK <numpy 1D-array>: (nb_sections) distances along the hydraulic axis
+    offsets <numpy 1D-array>: (nb_sections + 1) position of the first point of each section (last value is nb_points)
+    x <numpy 1D-array>: (nb_points) point coordinates along x axis
+    y <numpy 1D-array>: (nb_points) point coordinates along y axis
+    z <numpy 1D-array>: (nb_points) point elevations
+    distances <numpy 1D-array>: (nb_points) cumulative distance from first point along each profile
+    limit_names <[str]>: (nb_limit_types) names of the limits (in order of first appearance)
+    limits <numpy 2D-array>: (nb_sections, nb_limit_types) point numbering of limits in their section (NO_LIMIT if absent)
+    layers_elev <numpy 2D-array>: (nb_layers, nb_points) or None
+    """
+    NO_LIMIT = -1
+
+    def __init__(self, ids, names, PK, offsets, x, y, z, limits=None, distances=None):
+        """
+        :param ids: profile identifiers
+        :type ids: [int]
+        :param names: profile names
+        :type names: [str]
+        :param PK: distances along the hydraulic axis
+        :type PK: [float]
+        :param offsets: position of the first point of each section followed by the total number of points
+        :type offsets: [int]
+        :param x: point coordinates along x axis of all sections
+        :type x: numpy 1D-array
+        :param y: point coordinates along y axis of all sections
+        :type y: numpy 1D-array
+        :param z: point elevations of all sections
+        :type z: numpy 1D-array
+        :param limits: position of limits of each section
+        :type limits: [{limit_name: point_numbering}]
+        :param distances: cumulative distances along each profile (computed if None)
+        :type distances: numpy 1D-array
+        """
+        self.ids = np.array(ids, dtype=int)
+        self.names = np.array(names, dtype=str)
+        self.PK = np.array(PK, dtype=float)
+        self.offsets = np.array(offsets, dtype=int)
+        self.nb_sections = len(self.ids)
+        if len(self.names) != self.nb_sections or len(self.PK) != self.nb_sections or \
+                len(self.offsets) != self.nb_sections + 1:
+            raise GeometryRequestException('Arrays of sections have not the same length')
+        if self.offsets[0] != 0 or np.any(np.ediff1d(self.offsets) < 0):
+            raise GeometryRequestException('Offsets of sections are not increasing from 0')
+
+        self.x = np.ascontiguousarray(x, dtype=float)
+        self.y = np.ascontiguousarray(y, dtype=float)
+        self.z = np.ascontiguousarray(z, dtype=float)
+        self.nb_points = int(self.offsets[-1])
+        if not len(self.x) == len(self.y) == len(self.z) == self.nb_points:
+            raise GeometryRequestException('Arrays of points have not the expected length (%i)' % self.nb_points)
+        if distances is None:
+            self.distances = np.zeros(self.nb_points)
+            self._compute_distances()
+        else:
+            self.distances = np.ascontiguousarray(distances, dtype=float)
+            if len(self.distances) != self.nb_points:
+                raise GeometryRequestException('Arrays of points have not the expected length (%i)' % self.nb_points)
+
+        self.limit_names = []
+        self.limits = np.full((self.nb_sections, 0), SectionStore.NO_LIMIT, dtype=int)
+        if limits is not None:
+            self.set_limits(limits)
+        self.layers_elev = None
+
+    @staticmethod
+    def from_sections(sections):
+        """
+        Build a store from sections (arrays are copied)
+        :param sections: list of sections
+        :type sections: [Section]
+        :rtype: SectionStore
+        """
+        nb_points = [section.nb_points for section in sections]
+        offsets = np.concatenate(([0], np.cumsum(nb_points, dtype=int)))
+
+        def concatenate(arrays):
+            return np.concatenate(arrays) if arrays else np.array([])
+
+        store = SectionStore([section.id for section in sections], [section.name for section in sections],
+                             [section.PK for section in sections], offsets,
+                             concatenate([section.x for section in sections]),
+                             concatenate([section.y for section in sections]),
+                             concatenate([section.z for section in sections]),
+                             [section.limits for section in sections])
+        nb_layers = set(section.nb_layers() for section in sections)
+        if len(nb_layers) > 1:
+            raise GeometryRequestException('Sections have not the same number of layers')
+        if sections and nb_layers.pop() > 0:
+            store.layers_elev = np.concatenate([section.layers_elev for section in sections], axis=1)
+        return store
+
+    def _compute_distances(self):
+        """Cumulative distances are computed from segment lengths of the whole model and accumulated by section"""
+        if self.nb_points < 2:
+            return
+        lengths = np.sqrt(np.ediff1d(self.x) ** 2 + np.ediff1d(self.y) ** 2)
+        for start, end in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist()):
+            if end - start > 1:
+                np.cumsum(lengths[start:end - 1], out=self.distances[start + 1:end])
+
+    def set_limits(self, limits):
+        """
+        :param limits: position of limits of each section
+        :type limits: [{limit_name: point_numbering}]
+        """
+        if len(limits) != self.nb_sections:
+            raise GeometryRequestException('Limits are not given for every section')
+        limit_names = []
+        for section_limits in limits:
+            for limit_name in section_limits:
+                if limit_name not in limit_names:
+                    limit_names.append(limit_name)
+        table = np.full((self.nb_sections, len(limit_names)), SectionStore.NO_LIMIT, dtype=int)
+        for i, section_limits in enumerate(limits):
+            for limit_name, index in section_limits.items():
+                table[i, limit_names.index(limit_name)] = index
+        self.limit_names = limit_names
+        self.limits = table
+
+    def set_section_limits(self, i, limits):
+        """
+        Replace the limits of the i-th section
+        :param limits: position of limits
+        :type limits: {limit_name: point_numbering}
+        """
+        limits = dict(limits)  # copied first (it may be a view on the limits of this section)
+        self.limits[i] = SectionStore.NO_LIMIT
+        for limit_name, index in limits.items():
+            self.set_section_limit(i, limit_name, index)
+
+    def set_section_limit(self, i, limit_name, index):
+        """Set the position of a limit in the i-th section (NO_LIMIT to remove it), a new limit name is appended"""
+        if limit_name not in self.limit_names:
+            self.limit_names.append(limit_name)
+            self.limits = np.column_stack((self.limits, np.full(self.nb_sections, SectionStore.NO_LIMIT, dtype=int)))
+        self.limits[i, self.limit_names.index(limit_name)] = index
+
+    def limits_view(self, i):
+        """
+        :return: limits of the i-th section (changes are written in the store)
+        :rtype: SectionLimits
+        """
+        return SectionLimits(self, i)
+
+    def set_name(self, i, name):
+        """Rename the i-th section (names are stored as fixed-length strings which are widened if necessary)"""
+        name = np.array(name, dtype=str)
+        if name.dtype.itemsize > self.names.dtype.itemsize:
+            self.names = self.names.astype(name.dtype)
+        self.names[i] = name
+
+    def nb_points_per_section(self):
+        return np.ediff1d(self.offsets)
+
+    def section_index(self):
+        """Position of the section of every point: 1D-array with the shape (nb_points)"""
+        return np.repeat(np.arange(self.nb_sections), self.nb_points_per_section())
+
+    def section_slice(self, i):
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def section_limits(self, i):
+        """Position of limits of the i-th section: {limit_name: point_numbering} (sorted by point numbering)"""
+        return dict(sorted(((limit_name, index) for limit_name, index in zip(self.limit_names, self.limits[i].tolist())
+                            if index != SectionStore.NO_LIMIT), key=lambda item: item[1]))
+
+    def limit_points(self, limit_name):
+        """
+        Global position of the points of a limit
+        :return: 1D-array with the shape (nb_sections) (NO_LIMIT for sections without this limit)
+        """
+        try:
+            local_index = self.limits[:, self.limit_names.index(limit_name)]
+        except ValueError:
+            raise GeometryRequestException('Limit %s is not found (among: %s)' % (limit_name, self.limit_names))
+        return np.where(local_index == SectionStore.NO_LIMIT, SectionStore.NO_LIMIT, self.offsets[:-1] + local_index)
+
+    def nb_layers(self):
+        if self.layers_elev is None:
+            return 0
+        else:
+            return self.layers_elev.shape[0]
+
+    def add_layer(self, thickness):
+        """
+        Add a layer below the lowest one (or below the bottom)
+        :param thickness: layer thickness (a single value or one per point)
+        :type thickness: float or numpy 1D-array
+        """
+        self.add_layers(np.broadcast_to(thickness, (1, self.nb_points)))
+
+    def add_layers(self, thicknesses):
+        """
+        Add several layers at once below the lowest one (or below the bottom)
+        Elevations of all layers are computed in a single preallocated array.
+        :param thicknesses: thickness of the new layers (from top to bottom) for every point
+        :type thicknesses: numpy 2D-array with the shape (nb_new_layers, nb_points)
+        """
+        thicknesses = np.asarray(thicknesses, dtype=float)
+        if thicknesses.ndim != 2 or thicknesses.shape[1] != self.nb_points:
+            raise GeometryRequestException('Thicknesses have a shape %s instead of (nb_layers, %i)'
+                                           % (thicknesses.shape, self.nb_points))
+        nb_layers = self.nb_layers()
+        layers_elev = np.empty((nb_layers + thicknesses.shape[0], self.nb_points))
+        if nb_layers > 0:
+            layers_elev[:nb_layers] = self.layers_elev
+        for i, thickness in enumerate(thicknesses, start=nb_layers):
+            np.subtract(self.z if i == 0 else layers_elev[i - 1], thickness, out=layers_elev[i])
+        self.layers_elev = layers_elev
+
+    def select_sections(self, sections):
+        """
+        Store with a subset of the sections (arrays are copied)
+        :param sections: position of the selected sections
+        :type sections: numpy 1D-array
+        :rtype: SectionStore
+        """
+        sections = np.asarray(sections, dtype=int)
+        nb_points = self.nb_points_per_section()[sections]
+        offsets = np.concatenate(([0], np.cumsum(nb_points)))
+        points = np.repeat(self.offsets[sections] - offsets[:-1], nb_points) + np.arange(offsets[-1])
+        store = SectionStore(self.ids[sections], self.names[sections], self.PK[sections], offsets, self.x[points],
+                             self.y[points], self.z[points], distances=self.distances[points])
+        store.limit_names = list(self.limit_names)
+        store.limits = self.limits[sections]
+        if self.layers_elev is not None:
+            store.layers_elev = self.layers_elev[:, points]
+        return store
+
+    def remove_layers(self):
+        self.layers_elev = None
+
+    def set_view(self, i, section):
+        """
+        Point the arrays of a section on the i-th section of the store (no copy)
+        Its id, name, PK and limits are then read from and written to the store.
+        """
+        part = self.section_slice(i)
+        section._store, section._index = self, i
+        section.x = self.x[part]
+        section.y = self.y[part]
+        section.z = self.z[part]
+        section.distances = self.distances[part]
+        section.nb_points = part.stop - part.start
+        section.layers_elev = None if self.layers_elev is None else self.layers_elev[:, part]
+
+    def section(self, i):
+        """
+        :return: view on the i-th section
+        :rtype: Section
+        """
+        section = Section(int(self.ids[i]), str(self.names[i]), float(self.PK[i]))
+        self.set_view(i, section)
+        return section
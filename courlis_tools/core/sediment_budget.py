@@ -0,0 +1,267 @@
+"""
+Sediment volume budget of Courlis results (volume of every layer, deposited and eroded volumes)
+
+Layers are described by the elevation variables of the results (see `read_plong`): `Z_1` (top of the first layer),
+..., `Z_n` and `Z_rb` (rigid bed). The thickness of the layer i is `Z_i - Z_{i+1}` (`Z_n - Z_rb` for the last one).
+
+The width of every result section comes from the geometry of its reach (linearly interpolated along PK, constant
+beyond the first and last geometry sections):
+* `banks`: distance along the profile between the banks (`RD` and `RG` limits, or ends of the section)
+* `wetted`: top width of the bottom profile at the water level (`Z_water`) of every frame
+Without geometry, the width is 1 m (volumes per meter of width). Geometries of a multi-reach model are given to the
+result reaches by name or by PK range (see `match_geometries`).
+
+Volumes are integrated along PK with the trapezoidal rule. The thickness change of a layer since the first frame
+(multiplied by the width) is split into deposition (positive part) and erosion (negative part) which are integrated
+exactly on every interval between two sections (the change is linear on it, so it can contain both).
+
+All frames, sections and layers of a reach are computed at once at the first request and volumes accumulated along PK
+are cached: volumes of a reach or of a PK range are then read without any computation on the frames.
+"""
+import csv
+import numpy as np
+
+from .utils import CourlisException
+
+
+WIDTH_BANKS = 'banks'
+WIDTH_WETTED = 'wetted'
+BANK_LIMITS = ('RD', 'RG')
+DEFAULT_WIDTH = 1.0  # width of the sections of a reach without geometry (m)
+
+
+def layer_variables(variable_names):
+    """
+    Elevation variables of the top and the bottom of every sediment layer
+    :param variable_names: names of the result variables
+    :type variable_names: [str]
+    :return: name, top variable and bottom variable of every layer (empty if `Z_1` or `Z_rb` is missing)
+    :rtype: [(str, str, str)]
+    """
+    if 'Z_1' not in variable_names or 'Z_rb' not in variable_names:
+        return []
+    nb_layers = 1
+    while 'Z_%i' % (nb_layers + 1) in variable_names:
+        nb_layers += 1
+    return [('Layer %i' % i, 'Z_%i' % i, 'Z_%i' % (i + 1) if i < nb_layers else 'Z_rb')
+            for i in range(1, nb_layers + 1)]
+
+
+def match_geometries(res, geometries):
+    """
+    Geometry of the result reaches: a geometry is given to the reach with the same name, otherwise to the only
+    remaining reach whose PK range overlaps the PK range of its sections (reaches left have no geometry)
+    :param res: results
+    :type res: ResLongProfil
+    :param geometries: geometry of every reach of a model (e.g. `GeometryModel.reaches`)
+    :type geometries: {reach_name: Geometry}
+    :return: geometry of the matched result reaches
+    :rtype: {reach_name: Geometry}
+    """
+    matches = {reach_name: geometry for reach_name, geometry in geometries.items() if reach_name in res.model}
+    for reach_name, geometry in geometries.items():
+        if reach_name in res.model or geometry.store.nb_sections == 0:
+            continue
+        pk_min, pk_max = geometry.store.PK.min(), geometry.store.PK.max()
+        overlapping = [name for name, sections in res.model.items()
+                       if name not in matches and name not in geometries and sections
+                       and min(sections) <= pk_max and max(sections) >= pk_min]
+        if len(overlapping) == 1:
+            matches[overlapping[0]] = geometry
+    return matches
+
+
+def bank_widths(store, limits=BANK_LIMITS):
+    """
+    Distance along the profile between two limits of every section (between its ends if one of them is missing)
+    :param store: geometry of the sections
+    :type store: SectionStore
+    :param limits: names of both limits
+    :type limits: (str, str)
+    :rtype: numpy 1D-array
+    """
+    non_empty = store.nb_points_per_section() > 0
+    first = np.where(non_empty, store.offsets[:-1], 0)
+    last = np.where(non_empty, store.offsets[1:] - 1, 0)
+    if all(limit_name in store.limit_names for limit_name in limits):
+        right_bank, left_bank = (store.limit_points(limit_name) for limit_name in limits)
+        defined = (right_bank != store.NO_LIMIT) & (left_bank != store.NO_LIMIT)
+        first, last = np.where(defined, right_bank, first), np.where(defined, left_bank, last)
+    if store.nb_points == 0:
+        return np.zeros(store.nb_sections)
+    return np.where(non_empty, np.abs(store.distances[last] - store.distances[first]), 0.0)
+
+
+def _interp_weights(x_from, x_to):
+    """
+    Linear interpolation from increasing abscissas to other ones (constant values outside)
+    :return: left and right positions in `x_from` of every abscissa of `x_to` and weights of the right ones
+    :rtype: (numpy 1D-array, numpy 1D-array, numpy 1D-array)
+    """
+    x_to = np.asarray(x_to, dtype=float)
+    if len(x_from) < 2:
+        zeros = np.zeros(len(x_to), dtype=int)
+        return zeros, zeros.copy(), np.zeros(len(x_to))
+    right = np.clip(np.searchsorted(x_from, x_to, side='right'), 1, len(x_from) - 1)
+    left = right - 1
+    spans = x_from[right] - x_from[left]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weights = np.where(spans > 0, (x_to - x_from[left]) / spans, 0.0)
+    return left, right, np.clip(weights, 0.0, 1.0)
+
+
+def positive_integrals(first, second, lengths):
+    """Integrals of the positive part of linear functions from `first` to `second` over `lengths` (broadcast)"""
+    positive_first, positive_second = np.maximum(first, 0.0), np.maximum(second, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        crossing = (positive_first ** 2 + positive_second ** 2) / (np.abs(first) + np.abs(second))
+    return np.where(first * second >= 0, positive_first + positive_second, crossing) * lengths / 2
+
+
+def _cumulate(intervals):
+    """Cumulative sums along the sections of integrals on intervals (a leading 0 is added for the first section)"""
+    nb_frames, nb_intervals, nb_layers = intervals.shape
+    sums = np.zeros((nb_frames, nb_intervals + 1, nb_layers))
+    np.cumsum(intervals, axis=1, out=sums[:, 1:])
+    return sums
+
+
+class SedimentBudget:
+    """
+    Volumes of the sediment layers of all reaches of a result (computed for a reach at its first request, then cached)
+
+    res <ResLongProfil>: results with the layer elevations
+    layers <[(str, str, str)]>: name, top variable and bottom variable of every layer
+    layer_names <[str]>: (nb_layers)
+    geometries <{reach_name: Geometry}>: geometry of the reaches (other reaches have a width of DEFAULT_WIDTH)
+    width_mode <str>: WIDTH_BANKS or WIDTH_WETTED
+    """
+    def __init__(self, res, geometries=None, width_mode=WIDTH_BANKS):
+        """
+        :param res: results with the layer elevations (`Z_1`, ..., `Z_rb`)
+        :type res: ResLongProfil
+        :param geometries: geometry of the reaches
+        :type geometries: {reach_name: Geometry}
+        :param width_mode: width of the sections (WIDTH_BANKS or WIDTH_WETTED)
+        :type width_mode: str
+        """
+        self.res = res
+        self.layers = layer_variables(res.variable_names)
+        if not self.layers:
+            raise CourlisException('No sediment layer found (variables Z_1, ..., Z_rb are required among: %s)'
+                                   % res.variable_names)
+        self.layer_names = [layer_name for layer_name, _, _ in self.layers]
+        if width_mode not in (WIDTH_BANKS, WIDTH_WETTED):
+            raise CourlisException('Unknown width mode `%s` (among: %s)' % (width_mode, [WIDTH_BANKS, WIDTH_WETTED]))
+        if width_mode == WIDTH_WETTED and 'Z_water' not in res.variable_names:
+            raise CourlisException('Variable `Z_water` is required to compute wetted widths')
+        self.width_mode = width_mode
+        self.geometries = {} if geometries is None else dict(geometries)
+        for reach_name in self.geometries:
+            if reach_name not in res.model:
+                raise CourlisException('River reach `%s` not found (among: %s)' % (reach_name, list(res.model.keys())))
+        self._budgets = {}  # {reach_name: (nb_frames, PK, volumes, deposits, erosions)}
+
+    def _widths(self, reach_name, PK, values):
+        """Widths of the sections (sorted by PK): 2D-array with the shape (1 or nb_frames, nb_sections)"""
+        geometry = self.geometries.get(reach_name)
+        if geometry is None:
+            return np.full((1, len(PK)), DEFAULT_WIDTH)
+        store = geometry.store
+        geometry_order = np.argsort(store.PK, kind='stable')
+        if self.width_mode == WIDTH_BANKS:
+            geometry_widths = bank_widths(store)[np.newaxis, geometry_order]
+        else:
+            water_levels = values[:, :, self.res.variable_names.index('Z_water')]
+            left, right, weights = _interp_weights(PK, store.PK)
+            water_levels = water_levels[:, left] * (1.0 - weights) + water_levels[:, right] * weights
+            _, geometry_widths = geometry.get_hydraulic_table().evaluate(water_levels)
+            geometry_widths = geometry_widths[:, geometry_order]
+        left, right, weights = _interp_weights(store.PK[geometry_order], PK)
+        return geometry_widths[:, left] * (1.0 - weights) + geometry_widths[:, right] * weights
+
+    def _budget(self, reach_name):
+        """Cumulative volumes of a reach along PK (computed if the number of frames has changed)"""
+        cached = self._budgets.get(reach_name)
+        if cached is not None and cached[0] == self.res.nb_frames:
+            return cached[1:]
+        values = self.res.get_values(reach_name)
+        PK = np.array(self.res.model[reach_name], dtype=float)
+        order = np.argsort(PK, kind='stable')
+        PK, values = PK[order], values[:, order]
+        if np.any(np.ediff1d(PK) == 0):
+            raise CourlisException('Several sections of river reach `%s` have the same PK' % reach_name)
+
+        positions = [self.res.variable_names.index(top) for _, top, _ in self.layers]
+        positions.append(self.res.variable_names.index(self.layers[-1][2]))
+        elevations = values[:, :, positions]
+        widths = self._widths(reach_name, PK, values)[:, :, np.newaxis]
+        thicknesses = elevations[:, :, :-1] - elevations[:, :, 1:]
+        areas = thicknesses * widths
+        changes = (thicknesses - thicknesses[:1]) * widths
+
+        lengths = np.ediff1d(PK)[np.newaxis, :, np.newaxis]
+        volumes = _cumulate((areas[:, :-1] + areas[:, 1:]) * lengths / 2)
+        deposits = _cumulate(positive_integrals(changes[:, :-1], changes[:, 1:], lengths))
+        erosions = _cumulate(positive_integrals(-changes[:, :-1], -changes[:, 1:], lengths))
+        self._budgets[reach_name] = (self.res.nb_frames, PK, volumes, deposits, erosions)
+        return PK, volumes, deposits, erosions
+
+    def compute(self):
+        """Compute (and cache) the volumes of all reaches"""
+        for reach_name in self.res.model:
+            self._budget(reach_name)
+
+    def get_budget(self, reach_name=None, pk_min=None, pk_max=None):
+        """
+        Volumes of every layer for every frame, between two PK (linearly interpolated inside an interval)
+        :param reach_name: name of the river reach (sum of all reaches if None)
+        :type reach_name: str
+        :param pk_min: lower PK (first section if None)
+        :type pk_min: float
+        :param pk_max: upper PK (last section if None)
+        :type pk_max: float
+        :return: volumes, deposited volumes and eroded volumes (positive) since the first frame (m³)
+        :rtype: (numpy 2D-array, numpy 2D-array, numpy 2D-array) with the shape (nb_frames, nb_layers)
+        """
+        if pk_min is not None and pk_max is not None and pk_min > pk_max:
+            raise CourlisException('PK range is not valid: %f > %f' % (pk_min, pk_max))
+        reach_names = list(self.res.model.keys()) if reach_name is None else [reach_name]
+        totals = [np.zeros((self.res.nb_frames, len(self.layers))) for _ in range(3)]
+        for name in reach_names:
+            PK, *cumulatives = self._budget(name)
+            if len(PK) == 0:
+                continue
+            bounds = [PK[0] if pk_min is None else pk_min, PK[-1] if pk_max is None else pk_max]
+            left, right, weights = _interp_weights(PK, np.clip(bounds, PK[0], PK[-1]))
+            weights = weights[np.newaxis, :, np.newaxis]
+            for total, cumulative in zip(totals, cumulatives):
+                at_bounds = cumulative[:, left] * (1.0 - weights) + cumulative[:, right] * weights
+                total += at_bounds[:, 1] - at_bounds[:, 0]
+        return tuple(totals)
+
+    def get_net_changes(self, reach_name=None, pk_min=None, pk_max=None):
+        """Deposited minus eroded volumes since the first frame: 2D-array with the shape (nb_frames, nb_layers)"""
+        _, deposits, erosions = self.get_budget(reach_name, pk_min, pk_max)
+        return deposits - erosions
+
+    def write_csv(self, filename, pk_ranges=None):
+        """
+        Write the volumes of every reach, PK range, frame and layer
+        :param filename: path of the CSV file
+        :type filename: str
+        :param pk_ranges: PK ranges (pk_min, pk_max) to report in addition to the whole reaches
+        :type pk_ranges: [(float, float)]
+        """
+        with open(filename, 'w', newline='') as fileout:
+            writer = csv.writer(fileout, delimiter=';')
+            writer.writerow(['reach', 'pk_min', 'pk_max', 'time', 'layer', 'volume', 'deposited', 'eroded', 'net'])
+            for reach_name, sections in self.res.model.items():
+                if not sections:
+                    continue
+                for pk_min, pk_max in [(min(sections), max(sections))] + list(pk_ranges or []):
+                    volumes, deposits, erosions = self.get_budget(reach_name, pk_min, pk_max)
+                    for time, frame_values in zip(self.res.time_serie, zip(volumes, deposits, erosions)):
+                        for layer_name, volume, deposit, erosion in zip(self.layer_names, *frame_values):
+                            writer.writerow([reach_name, pk_min, pk_max, time, layer_name, volume, deposit, erosion,
+                                             deposit - erosion])
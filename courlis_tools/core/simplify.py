@@ -0,0 +1,213 @@
+"""
+Simplification of cross-section profiles (to reduce the number of points of every section)
+
+Available methods:
+* `simplify_sections`: Douglas-Peucker on (distance, elevation): a point is removed only if the bottom and every layer
+    elevation are within a vertical tolerance of the simplified profile
+* `resample_sections`: uniform resampling along the profile with a maximum number of points
+
+Limit points are always kept. Both methods process all sections at once (no loop on sections) and return the error
+they introduce: the maximum vertical distance between the original points and the simplified profile of each section.
+"""
+import numpy as np
+
+from .section_store import SectionStore
+from .utils import GeometryRequestException
+
+
+def _values(store):
+    """Values which are preserved: z and layer elevations (2D-array with the shape (1 + nb_layers, nb_points))"""
+    return np.vstack([store.z] + ([] if store.layers_elev is None else list(store.layers_elev)))
+
+
+def _section_keys(store):
+    """
+    Distances shifted by section so that the profiles of all sections follow each other on a single increasing axis
+    :return: shifted distance of every point and shift of every section
+    :rtype: (numpy 1D-array, numpy 1D-array)
+    """
+    nb_points = store.nb_points_per_section()
+    non_empty = nb_points > 0
+    first, last = np.zeros(store.nb_sections), np.zeros(store.nb_sections)
+    first[non_empty] = store.distances[store.offsets[:-1][non_empty]]
+    last[non_empty] = store.distances[store.offsets[1:][non_empty] - 1]
+    shifts = np.concatenate(([0.0], np.cumsum(last - first + 1.0)))[:-1] - first
+    return store.distances + np.repeat(shifts, nb_points), shifts
+
+
+def _limit_mask(store):
+    """Points which are limits or ends of their section"""
+    nb_points = store.nb_points_per_section()
+    mask = np.zeros(store.nb_points, dtype=bool)
+    mask[store.offsets[:-1][nb_points > 0]] = True
+    mask[store.offsets[1:][nb_points > 0] - 1] = True
+    for limit_name in store.limit_names:
+        points = store.limit_points(limit_name)
+        mask[points[points != SectionStore.NO_LIMIT]] = True
+    return mask
+
+
+def _section_errors(store, point_errors):
+    """Maximum error of the points of each section (1D-array with the shape (nb_sections))"""
+    errors = np.zeros(store.nb_sections)
+    non_empty = store.nb_points_per_section() > 0
+    if store.nb_points > 0:
+        errors[non_empty] = np.maximum.reduceat(point_errors, store.offsets[:-1][non_empty])
+    return errors
+
+
+def _chord_errors(store, values, kept):
+    """
+    Vertical distance of every point to the chord between the kept points around it (0 for kept points)
+    :return: error and position of the previous kept point of every point
+    :rtype: (numpy 1D-array, numpy 1D-array)
+    """
+    index = np.arange(store.nb_points)
+    previous = np.maximum.accumulate(np.where(kept, index, 0))
+    following = np.minimum.accumulate(np.where(kept, index, store.nb_points)[::-1])[::-1]
+    distances = store.distances
+    spans = distances[following] - distances[previous]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weights = np.where(spans > 0, (distances - distances[previous]) / spans, 0.0)
+    point_errors = np.zeros(store.nb_points)
+    for row in values:
+        chord = row[previous] + weights * (row[following] - row[previous])
+        np.maximum(point_errors, np.abs(row - chord), out=point_errors)
+    point_errors[kept] = 0.0
+    return point_errors, previous
+
+
+def _subset(store, kept):
+    """Store with the kept points (limits are renumbered and cumulative distances are kept)"""
+    section_index = store.section_index()
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(section_index[kept], minlength=store.nb_sections))))
+    new_index = np.cumsum(kept) - 1
+    result = SectionStore(store.ids, store.names, store.PK, offsets, store.x[kept], store.y[kept], store.z[kept],
+                          distances=store.distances[kept])
+    result.limit_names = list(store.limit_names)
+    result.limits = np.full(store.limits.shape, SectionStore.NO_LIMIT, dtype=int)
+    for j, limit_name in enumerate(store.limit_names):
+        points = store.limit_points(limit_name)
+        has_limit = points != SectionStore.NO_LIMIT
+        result.limits[has_limit, j] = new_index[points[has_limit]] - offsets[:-1][has_limit]
+    if store.layers_elev is not None:
+        result.layers_elev = store.layers_elev[:, kept]
+    return result
+
+
+def simplify_sections(store, tolerance, max_points=None):
+    """
+    Douglas-Peucker simplification of all the profiles at once
+    Each iteration splits every segment of the simplified profiles (between two kept points) at its worst point, if
+    its vertical distance (for z or any layer) to the segment exceeds the tolerance.
+    :param store: geometry of the sections
+    :type store: SectionStore
+    :param tolerance: maximum vertical distance between removed points and the simplified profile
+    :type tolerance: float
+    :param max_points: maximum number of points by section (limits are kept anyway), no maximum if None
+    :type max_points: int
+    :return: simplified geometry and error of each section
+    :rtype: (SectionStore, numpy 1D-array)
+    """
+    if tolerance < 0:
+        raise GeometryRequestException('Tolerance has to be positive (%f)' % tolerance)
+    values = _values(store)
+    section_index = store.section_index()
+    kept = _limit_mask(store)
+
+    while True:
+        point_errors, previous = _chord_errors(store, values, kept)
+
+        # Worst point of every segment exceeding the tolerance
+        candidates = np.flatnonzero(point_errors > tolerance)
+        if len(candidates) == 0:
+            break
+        candidates = candidates[np.lexsort((-point_errors[candidates], previous[candidates]))]
+        is_worst = np.ones(len(candidates), dtype=bool)
+        is_worst[1:] = previous[candidates[1:]] != previous[candidates[:-1]]
+        candidates = candidates[is_worst]
+
+        if max_points is not None:
+            # Points are added by decreasing error as long as their section is below the maximum
+            candidates = candidates[np.lexsort((-point_errors[candidates], section_index[candidates]))]
+            sections = section_index[candidates]
+            first = np.ones(len(candidates), dtype=bool)
+            first[1:] = sections[1:] != sections[:-1]
+            first_position = np.maximum.accumulate(np.where(first, np.arange(len(candidates)), 0))
+            rank = np.arange(len(candidates)) - first_position
+            nb_kept = np.bincount(section_index[kept], minlength=store.nb_sections)
+            candidates = candidates[rank < max_points - nb_kept[sections]]
+            if len(candidates) == 0:
+                break
+        kept[candidates] = True
+
+    point_errors, _ = _chord_errors(store, values, kept)
+    return _subset(store, kept), _section_errors(store, point_errors)
+
+
+def resample_sections(store, max_points):
+    """
+    Uniform resampling of the profiles with more than `max_points` points
+    Limit points are kept and the other points are interpolated at regular distances along the profile, so that every
+    resampled section has at most `max_points` points (or its number of limits if it is greater).
+    :param store: geometry of the sections
+    :type store: SectionStore
+    :param max_points: maximum number of points by section
+    :type max_points: int
+    :return: resampled geometry and error of each section
+    :rtype: (SectionStore, numpy 1D-array)
+    """
+    if max_points < 2:
+        raise GeometryRequestException('Maximum number of points has to be at least 2 (%i)' % max_points)
+    values = np.vstack((store.x, store.y, _values(store)))
+    section_index = store.section_index()
+    keys, shifts = _section_keys(store)
+    nb_points = store.nb_points_per_section()
+
+    # Sections which are not resampled keep all their points (as limits)
+    resampled = nb_points > max_points
+    is_limit = _limit_mask(store) | ~resampled[section_index]
+    limit_points = np.flatnonzero(is_limit)
+    nb_limits = np.bincount(section_index[is_limit], minlength=store.nb_sections)
+
+    # Regular samples between both ends (which are already limits)
+    nb_regular = np.where(resampled, np.maximum(max_points - nb_limits + 2, 2), 0)
+    sections = np.repeat(np.arange(store.nb_sections), nb_regular)
+    local = np.arange(np.sum(nb_regular)) - np.repeat(np.cumsum(nb_regular) - nb_regular, nb_regular)
+    first_keys = keys[store.offsets[:-1][sections]]
+    last_keys = keys[store.offsets[1:][sections] - 1]
+    regular_keys = first_keys + (last_keys - first_keys) * local / (nb_regular[sections] - 1.0)
+    is_inside = (local > 0) & (local < nb_regular[sections] - 1)
+    is_inside[is_inside] = ~np.isin(regular_keys[is_inside], keys[is_limit])
+    regular_keys, sections = regular_keys[is_inside], sections[is_inside]
+
+    # Limits keep their original values, regular samples are interpolated
+    new_keys = np.concatenate((keys[is_limit], regular_keys))
+    new_sections = np.concatenate((section_index[is_limit], sections))
+    sources = np.concatenate((limit_points, np.full(len(regular_keys), -1)))
+    order = np.lexsort((new_keys, new_sections))
+    new_keys, new_sections, sources = new_keys[order], new_sections[order], sources[order]
+    regular = sources < 0
+    new_values = values[:, sources]
+    for row, new_row in zip(values, new_values):
+        new_row[regular] = np.interp(new_keys[regular], keys, row)
+    new_distances = np.where(regular, new_keys - shifts[new_sections], store.distances[sources])
+
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(new_sections, minlength=store.nb_sections))))
+    result = SectionStore(store.ids, store.names, store.PK, offsets, new_values[0], new_values[1], new_values[2],
+                          distances=new_distances)
+    result.limit_names = list(store.limit_names)
+    result.limits = np.full(store.limits.shape, SectionStore.NO_LIMIT, dtype=int)
+    new_index = np.full(store.nb_points, SectionStore.NO_LIMIT)
+    new_index[sources[~regular]] = np.flatnonzero(~regular)
+    for j, limit_name in enumerate(store.limit_names):
+        points = store.limit_points(limit_name)
+        has_limit = points != SectionStore.NO_LIMIT
+        result.limits[has_limit, j] = new_index[points[has_limit]] - offsets[:-1][has_limit]
+    if store.layers_elev is not None:
+        result.layers_elev = np.ascontiguousarray(new_values[3:])
+
+    point_errors = np.zeros(store.nb_points)
+    for row, new_row in zip(values[2:], new_values[2:]):
+        np.maximum(point_errors, np.abs(row - np.interp(keys, new_keys, new_row)), out=point_errors)
+    return result, _section_errors(store, point_errors)
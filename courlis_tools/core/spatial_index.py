@@ -0,0 +1,222 @@
+"""
+Spatial index over the points and the traces of the cross-sections
+
+KD-trees are built from a `SectionStore`:
+* a tree of the points (x, y)
+* trees of the middles of the trace segments (between consecutive points of a section), one by class of length
+
+The nearest segment of a location is first searched among the segments with the nearest middles, then, in every
+class, among the segments whose middle is closer than this first distance plus half of the longest segment of the
+class, which guarantees that it is found. Classes prevent a few long segments from widening the search everywhere.
+All queries are batched: they take arrays of locations and return arrays.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .utils import GeometryRequestException
+
+
+NB_NEAREST_SEGMENTS = 4  # number of segments by class for the first guess of the nearest section
+NB_LENGTH_CLASSES = 8  # number of classes of segment lengths (lengths of a class are within a factor 2)
+NB_LOCATIONS_PER_BLOCK = 1024  # number of locations searched at once in a radius (to bound memory)
+BBOX_MARGIN = 1e-6  # margin of the search around bounding boxes (points on their edges are kept)
+
+
+class SpatialIndex:
+    """
+    Spatial index of a SectionStore (coordinates of the store are not supposed to change after the construction)
+
+    store <SectionStore>: indexed geometry
+    section_index <numpy 1D-array>: (nb_points) position of the section of every point
+    segment_starts <numpy 1D-array>: (nb_segments) position of the first point of every segment
+    """
+    def __init__(self, store):
+        self.store = store
+        self.section_index = store.section_index()
+        self.point_tree = cKDTree(np.column_stack((store.x, store.y))) if store.nb_points > 0 else None
+
+        self.segment_starts = np.flatnonzero(self.section_index[:-1] == self.section_index[1:])
+        start, end = self.segment_starts, self.segment_starts + 1
+        middles = np.column_stack(((store.x[start] + store.x[end]) / 2, (store.y[start] + store.y[end]) / 2))
+        half_lengths = np.hypot(store.x[end] - store.x[start], store.y[end] - store.y[start]) / 2
+        self.segment_groups = []  # list of (position of segments, tree of their middles, maximum half length)
+        if len(half_lengths) > 0:
+            _, classes = np.frexp(half_lengths)
+            classes = np.maximum(classes, classes.max() - NB_LENGTH_CLASSES + 1)
+            for length_class in np.unique(classes):
+                segments = np.flatnonzero(classes == length_class)
+                self.segment_groups.append((segments, cKDTree(middles[segments]), half_lengths[segments].max()))
+
+        self._coordinates = (store.x, store.y)
+
+    def is_valid(self, store):
+        """Check if the index was built for this store (and its current coordinate arrays)"""
+        return self.store is store and self._coordinates[0] is store.x and self._coordinates[1] is store.y
+
+    @staticmethod
+    def _locations(x, y):
+        return np.column_stack((np.atleast_1d(x), np.atleast_1d(y))).astype(float)
+
+    def _check_not_empty(self):
+        if self.point_tree is None:
+            raise GeometryRequestException('Geometry has no point')
+
+    def nearest_points(self, x, y):
+        """
+        Nearest point of each location
+        :param x: coordinates along x axis of the locations
+        :type x: numpy 1D-array
+        :param y: coordinates along y axis of the locations
+        :type y: numpy 1D-array
+        :return: position of the nearest points in the store, position of their sections and distances
+        :rtype: (numpy 1D-array, numpy 1D-array, numpy 1D-array)
+        """
+        self._check_not_empty()
+        distances, index = self.point_tree.query(SpatialIndex._locations(x, y), workers=-1)
+        return index, self.section_index[index], distances
+
+    def project_on_segments(self, x, y, segments):
+        """
+        Orthogonal projection of locations on segments (clipped at their ends)
+        :param segments: position of the segments (one per location)
+        :return: distances to the segments, coordinates of the projections and abscissas along the profiles
+        :rtype: (numpy 1D-array, numpy 1D-array, numpy 1D-array, numpy 1D-array)
+        """
+        store = self.store
+        start = self.segment_starts[segments]
+        end = start + 1
+        dx, dy = store.x[end] - store.x[start], store.y[end] - store.y[start]
+        length2 = dx ** 2 + dy ** 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = ((x - store.x[start]) * dx + (y - store.y[start]) * dy) / length2
+        t = np.clip(np.nan_to_num(t, nan=0.0, posinf=0.0, neginf=0.0), 0.0, 1.0)
+        proj_x, proj_y = store.x[start] + t * dx, store.y[start] + t * dy
+        abscissas = store.distances[start] + t * (store.distances[end] - store.distances[start])
+        return np.hypot(x - proj_x, y - proj_y), proj_x, proj_y, abscissas
+
+    def nearest_sections(self, x, y):
+        """
+        Nearest section trace of each location (to snap locations on profiles)
+        :param x: coordinates along x axis of the locations
+        :type x: numpy 1D-array
+        :param y: coordinates along y axis of the locations
+        :type y: numpy 1D-array
+        :return: position of the sections, distances to their traces, coordinates of the projections on the traces
+            and abscissas of the projections along the profiles
+        :rtype: (numpy 1D-array, numpy 1D-array, numpy 1D-array, numpy 1D-array, numpy 1D-array)
+        """
+        locations = SpatialIndex._locations(x, y)
+        point_index, sections, distances = self.nearest_points(locations[:, 0], locations[:, 1])
+        nearest = (sections, distances, self.store.x[point_index].copy(), self.store.y[point_index].copy(),
+                   self.store.distances[point_index].copy())
+        nb_locations = len(locations)
+
+        # First guess among the segments with the nearest middles
+        farthest_neighbors = []
+        for segments, tree, _ in self.segment_groups:
+            nb_neighbors = min(NB_NEAREST_SEGMENTS, len(segments))
+            middle_distances, neighbors = tree.query(locations, k=nb_neighbors, workers=-1)
+            neighbors = neighbors.reshape(nb_locations, nb_neighbors)
+            self._update_nearest(locations, np.repeat(np.arange(nb_locations), nb_neighbors),
+                                 segments[neighbors.reshape(-1)], nearest)
+            farthest_neighbors.append(middle_distances.reshape(nb_locations, nb_neighbors)[:, -1])
+
+        # A segment whose middle is farther may still be nearer (by up to its half length)
+        for (segments, tree, half_length), farthest in zip(self.segment_groups, farthest_neighbors):
+            if len(segments) <= NB_NEAREST_SEGMENTS:
+                continue
+            radius = distances + half_length * (1 + 1e-9)
+            remaining = np.flatnonzero(farthest < radius)
+            for start in range(0, len(remaining), NB_LOCATIONS_PER_BLOCK):
+                block = remaining[start:start + NB_LOCATIONS_PER_BLOCK]
+                candidates = tree.query_ball_point(locations[block], radius[block], workers=-1)
+                nb_candidates = [len(neighbors) for neighbors in candidates]
+                if sum(nb_candidates) > 0:
+                    neighbors = np.concatenate([neighbors for neighbors in candidates if neighbors]).astype(int)
+                    self._update_nearest(locations, np.repeat(block, nb_candidates), segments[neighbors], nearest)
+        return nearest
+
+    def _update_nearest(self, locations, location_index, segments, nearest):
+        """
+        Replace the nearest sections of locations by the candidate segments which are nearer
+        :param location_index: position of the location of every candidate (sorted)
+        :param segments: position of the candidate segments
+        :param nearest: tuple of arrays returned by `nearest_sections` (modified in place)
+        """
+        sections, distances, proj_x, proj_y, abscissas = nearest
+        seg_distances, seg_x, seg_y, seg_abscissas = self.project_on_segments(
+            locations[location_index, 0], locations[location_index, 1], segments)
+
+        # Nearest candidate of each location (first one after sorting by location and distance)
+        order = np.lexsort((seg_distances, location_index))
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = location_index[order[1:]] != location_index[order[:-1]]
+        best = order[is_first]
+        located = location_index[best]
+        better = seg_distances[best] < distances[located]
+        best, located = best[better], located[better]
+        sections[located] = self.section_index[self.segment_starts[segments[best]]]
+        distances[located] = seg_distances[best]
+        proj_x[located], proj_y[located] = seg_x[best], seg_y[best]
+        abscissas[located] = seg_abscissas[best]
+
+    def points_in_bbox(self, xmin, ymin, xmax, ymax):
+        """
+        :return: position of the points inside the bounding box (sorted)
+        :rtype: numpy 1D-array
+        """
+        return self.points_in_bboxes([(xmin, ymin, xmax, ymax)])[0]
+
+    def points_in_bboxes(self, bboxes):
+        """
+        :param bboxes: list of bounding boxes (xmin, ymin, xmax, ymax)
+        :type bboxes: [tuple]
+        :return: position of the points inside each bounding box (sorted)
+        :rtype: [numpy 1D-array]
+        """
+        if self.point_tree is None:
+            return [np.array([], dtype=int) for _ in bboxes]
+        bboxes = np.array(bboxes, dtype=float).reshape(-1, 4)
+        centers = (bboxes[:, :2] + bboxes[:, 2:]) / 2
+        radius = np.max(bboxes[:, 2:] - bboxes[:, :2], axis=1) / 2 * (1 + 1e-9) + BBOX_MARGIN
+        results = []
+        # Candidates are in the square around the box (Chebyshev distance)
+        for (xmin, ymin, xmax, ymax), candidates in zip(bboxes, self.point_tree.query_ball_point(
+                centers, radius, p=np.inf, workers=-1)):
+            candidates = np.array(candidates, dtype=int)
+            x, y = self.store.x[candidates], self.store.y[candidates]
+            results.append(np.sort(candidates[(x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)]))
+        return results
+
+    def sections_in_bbox(self, xmin, ymin, xmax, ymax):
+        """
+        Sections with at least one point inside the bounding box or whose trace crosses it
+        :return: position of the sections (sorted)
+        :rtype: numpy 1D-array
+        """
+        sections = set(self.section_index[self.points_in_bbox(xmin, ymin, xmax, ymax)].tolist())
+        center = ((xmin + xmax) / 2, (ymin + ymax) / 2)
+        for segments, tree, half_length in self.segment_groups:
+            radius = (np.hypot(xmax - xmin, ymax - ymin) / 2 + half_length) * (1 + 1e-9) + BBOX_MARGIN
+            start = self.segment_starts[segments[np.array(tree.query_ball_point(center, radius), dtype=int)]]
+            crossing = SpatialIndex._segments_cross_bbox(self.store.x[start], self.store.y[start],
+                                                         self.store.x[start + 1], self.store.y[start + 1],
+                                                         xmin, ymin, xmax, ymax)
+            sections.update(self.section_index[start[crossing]].tolist())
+        return np.array(sorted(sections), dtype=int)
+
+    @staticmethod
+    def _segments_cross_bbox(x0, y0, x1, y1, xmin, ymin, xmax, ymax):
+        """Liang-Barsky clipping of segments by a box (vectorized)"""
+        dx, dy = x1 - x0, y1 - y0
+        t_min = np.zeros(len(x0))
+        t_max = np.ones(len(x0))
+        crossing = np.ones(len(x0), dtype=bool)
+        for p, q in ((-dx, x0 - xmin), (dx, xmax - x0), (-dy, y0 - ymin), (dy, ymax - y0)):
+            parallel = p == 0
+            crossing &= ~(parallel & (q < 0))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                r = q / p
+            t_min = np.where(~parallel & (p < 0), np.maximum(t_min, r), t_min)
+            t_max = np.where(~parallel & (p > 0), np.minimum(t_max, r), t_max)
+        return crossing & (t_min <= t_max)
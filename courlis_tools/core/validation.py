@@ -0,0 +1,129 @@
+"""
+Validation of a whole geometry with vectorized checks (no exception is raised, all the problems are reported)
+
+Rules:
+* `layer_above_bottom`: a layer elevation is above the bottom elevation (z)
+* `layers_crossing`: a layer elevation is above the elevation of the layer above it
+* `missing_limit`: a required limit is absent from a section
+* `limit_outside`: a limit is not a point of its section
+* `limits_order`: the channel axis (FON) is not between the banks (RD and RG), or both banks are on the same point
+* `PK_order`: PK is not strictly monotonic from a section to the next one (in the direction of the whole reach)
+
+The report is a numpy structured array (`REPORT_DTYPE`) with one row per problem, sorted by section and point.
+"""
+import numpy as np
+
+
+RULE_LAYER_ABOVE_BOTTOM = 'layer_above_bottom'
+RULE_LAYERS_CROSSING = 'layers_crossing'
+RULE_MISSING_LIMIT = 'missing_limit'
+RULE_LIMIT_OUTSIDE = 'limit_outside'
+RULE_LIMITS_ORDER = 'limits_order'
+RULE_PK_ORDER = 'PK_order'
+
+REQUIRED_LIMITS = ('RD', 'FON', 'RG')
+NO_VALUE = -1  # value of the fields which do not apply to a rule
+
+REPORT_DTYPE = np.dtype([('section', int),  # position of the section in the geometry
+                         ('section_id', int),  # profile identifier
+                         ('point', int),  # point numbering in the section
+                         ('layer', int),  # layer position (from top to bottom)
+                         ('limit', 'U16'),  # limit name
+                         ('rule', 'U32')])  # rule violated
+
+
+def make_report(sections, section_ids, points=None, layers=None, limit='', rule=''):
+    """
+    :param sections: position of the sections of the problems
+    :type sections: numpy 1D-array
+    :param section_ids: profile identifiers of the problems
+    :type section_ids: numpy 1D-array
+    :param points: point numbering of the problems (NO_VALUE if None)
+    :param layers: layer position of the problems (NO_VALUE if None)
+    :param limit: limit name of the problems (one for all or an array)
+    :param rule: rule violated (one for all or an array)
+    :rtype: numpy structured array (REPORT_DTYPE)
+    """
+    report = np.empty(len(sections), dtype=REPORT_DTYPE)
+    report['section'] = sections
+    report['section_id'] = section_ids
+    report['point'] = NO_VALUE if points is None else points
+    report['layer'] = NO_VALUE if layers is None else layers
+    report['limit'] = limit
+    report['rule'] = rule
+    return report
+
+
+def check_layer_elevations(z, layers_elev, tolerance=0.0):
+    """
+    Points where a layer is above the bottom or above the previous layer
+    :param z: bottom elevations
+    :type z: numpy 1D-array
+    :param layers_elev: layer elevations (or None)
+    :type layers_elev: numpy 2D-array with the shape (nb_layers, nb_points)
+    :param tolerance: elevation difference which is accepted
+    :type tolerance: float
+    :return: position of points, position of layers and rules violated
+    :rtype: (numpy 1D-array, numpy 1D-array, numpy 1D-array)
+    """
+    if layers_elev is None or layers_elev.shape[0] == 0:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([], dtype=REPORT_DTYPE['rule'])
+    layers, points = np.nonzero(layers_elev > z + tolerance)
+    crossing_layers, crossing_points = np.nonzero(layers_elev[1:] > layers_elev[:-1] + tolerance)
+    rules = np.repeat(np.array([RULE_LAYER_ABOVE_BOTTOM, RULE_LAYERS_CROSSING], dtype=REPORT_DTYPE['rule']),
+                      [len(points), len(crossing_points)])
+    return np.concatenate((points, crossing_points)), np.concatenate((layers, crossing_layers + 1)), rules
+
+
+def _sort(report):
+    return report[np.lexsort((report['layer'], report['point'], report['section']))]
+
+
+def check_store(store, required_limits=REQUIRED_LIMITS, tolerance=0.0):
+    """
+    Check all the sections of a geometry
+    :param store: geometry of the sections
+    :type store: SectionStore
+    :param required_limits: names of the limits which have to be in every section
+    :type required_limits: [str]
+    :param tolerance: elevation difference which is accepted between layers
+    :type tolerance: float
+    :return: problems found (sorted by section and point)
+    :rtype: numpy structured array (REPORT_DTYPE)
+    """
+    reports = []
+    section_index = store.section_index()
+    starts = store.offsets[:-1]
+    nb_points = store.nb_points_per_section()
+
+    # Layer elevations (global point positions are converted into point numbering)
+    points, layers, rules = check_layer_elevations(store.z, store.layers_elev, tolerance)
+    sections = section_index[points]
+    reports.append(make_report(sections, store.ids[sections], points - starts[sections], layers, rule=rules))
+
+    # Limits
+    limits = {}
+    for j, limit_name in enumerate(store.limit_names):
+        limits[limit_name] = store.limits[:, j]
+        outside = np.flatnonzero((store.limits[:, j] != store.NO_LIMIT) &
+                                 ((store.limits[:, j] < 0) | (store.limits[:, j] >= nb_points)))
+        reports.append(make_report(outside, store.ids[outside], store.limits[outside, j], limit=limit_name,
+                                   rule=RULE_LIMIT_OUTSIDE))
+    for limit_name in required_limits:
+        missing = np.arange(store.nb_sections) if limit_name not in limits else \
+            np.flatnonzero(limits[limit_name] == store.NO_LIMIT)
+        reports.append(make_report(missing, store.ids[missing], limit=limit_name, rule=RULE_MISSING_LIMIT))
+    if all(limit_name in limits for limit_name in ('RD', 'FON', 'RG')):
+        right_bank, axis, left_bank = limits['RD'], limits['FON'], limits['RG']
+        defined = (right_bank != store.NO_LIMIT) & (axis != store.NO_LIMIT) & (left_bank != store.NO_LIMIT)
+        between = (np.minimum(right_bank, left_bank) <= axis) & (axis <= np.maximum(right_bank, left_bank))
+        wrong = np.flatnonzero(defined & (~between | (right_bank == left_bank)))
+        reports.append(make_report(wrong, store.ids[wrong], axis[wrong], limit='FON', rule=RULE_LIMITS_ORDER))
+
+    # PK
+    if store.nb_sections > 1:
+        direction = 1.0 if store.PK[-1] >= store.PK[0] else -1.0
+        wrong = np.flatnonzero(np.ediff1d(store.PK) * direction <= 0) + 1
+        reports.append(make_report(wrong, store.ids[wrong], rule=RULE_PK_ORDER))
+
+    return _sort(np.concatenate(reports))
@@ -0,0 +1,70 @@
+"""
+Ecriture d'un fichier Opthyca (*.opt)
+
+See `courlis_tools.core.parsers.read_opt` for the description of the file format.
+Every cell of the table of results is written with the format `FLOAT_FMT` (a numeric reach name is written as a float).
+
+Rows are formatted by blocks of frames: a single `%` operation converts all the values of a block and the resulting
+text is written at once.
+"""
+import numpy as np
+
+from courlis_tools.core.utils import CourlisException
+
+
+FLOAT_FMT = '%16.8f'
+NB_VALUES_PER_BLOCK = 2 ** 20  # approximative number of values formatted at once
+
+
+def _reach_cell(reach_name):
+    try:
+        return FLOAT_FMT % float(reach_name)
+    except ValueError:
+        return reach_name.replace('%', '%%')
+
+
+def write_opt(res_plong, filename):
+    """
+    Write results in an Opthyca file
+    Profile identifiers are the position of the sections in the model (starting from 1).
+    :param res_plong: results to write
+    :type res_plong: ResLongProfil
+    :param filename: path to the output file
+    :type filename: str
+    """
+    if res_plong.nb_frames == 0:
+        raise CourlisException('No frame to write')
+
+    # Rows of a frame are formatted from a 2D-array with the shape (nb_sections, nb_columns) whose columns are:
+    #   time, profile identifier, pk and variables (reach name is directly in the format)
+    nb_sections = sum(len(sections) for sections in res_plong.model.values())
+    nb_columns = 3 + res_plong.nb_variables
+    values_fmt = ';'.join([FLOAT_FMT] * (nb_columns - 1)) + '\n'
+    frame_fmt = ''
+    reach_rows = []
+    first_row = 0
+    for reach_name, sections in res_plong.model.items():
+        frame_fmt += (FLOAT_FMT + ';' + _reach_cell(reach_name) + ';' + values_fmt) * len(sections)
+        reach_rows.append((reach_name, slice(first_row, first_row + len(sections))))
+        first_row += len(sections)
+
+    nb_frames_per_block = max(1, NB_VALUES_PER_BLOCK // max(1, nb_sections * nb_columns))
+    block = np.empty((min(nb_frames_per_block, res_plong.nb_frames), nb_sections, nb_columns))
+    block[:, :, 1] = np.arange(1, nb_sections + 1)
+    for reach_name, rows in reach_rows:
+        block[:, rows, 2] = res_plong.model[reach_name]
+
+    with open(filename, 'w') as fileout:
+        fileout.write('[variables]\n')
+        for name, abbr, unit, precision in zip(res_plong.variable_names, res_plong.variable_abbrs,
+                                               res_plong.variable_units, res_plong.variable_precisions):
+            fileout.write('"%s";"%s";"%s";%i\n' % (name, abbr, unit, precision))
+        fileout.write('[resultats]\n')
+
+        for start in range(0, res_plong.nb_frames, nb_frames_per_block):
+            end = min(start + nb_frames_per_block, res_plong.nb_frames)
+            nb_frames = end - start
+            block[:nb_frames, :, 0] = np.array(res_plong.time_serie[start:end])[:, np.newaxis]
+            for reach_name, rows in reach_rows:
+                block[:nb_frames, rows, 3:] = res_plong.get_values(reach_name)[start:end]
+            fileout.write((frame_fmt * nb_frames) % tuple(block[:nb_frames].ravel().tolist()))
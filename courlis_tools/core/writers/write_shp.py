@@ -0,0 +1,186 @@
+"""
+Ecriture de shapefiles (*.shp, *.shx et *.dbf) en bloc
+
+Records are packed in numpy structured arrays and written at once, instead of being added one by one through
+pyshp. Files are identical to those written by `shapefile.Writer` (pyshp 1.x), except the date of the dbf header:
+* shp/shx: main file header, then records with a big-endian header (record number, content length in 16-bit words)
+* dbf: dBase III header with field descriptors, then fixed-width text records
+Only the geometries used by `courlis_tools` are supported: POINTZ and POLYLINEZ (with a single part per record).
+"""
+import numpy as np
+import os.path
+from struct import pack
+import time
+
+from courlis_tools.core.utils import GeometryRequestException
+
+
+SHP_FILE_CODE = 9994
+SHP_VERSION = 1000
+SHP_HEADER_SIZE = 100
+POINTZ = 11
+POLYLINEZ = 13
+NB_VALUES_PER_BLOCK = 2 ** 20  # approximative number of values formatted at once
+
+POINTZ_DTYPE = np.dtype([('number', '>i4'), ('length', '>i4'), ('shape_type', '<i4'),
+                         ('x', '<f8'), ('y', '<f8'), ('z', '<f8'), ('m', '<f8')])
+SHX_DTYPE = np.dtype([('offset', '>i4'), ('length', '>i4')])
+
+
+def _bbox(x, y):
+    if len(x) == 0:
+        return [0.0] * 4
+    return [x.min(), y.min(), x.max(), y.max()]
+
+
+def _zbox(z):
+    if len(z) == 0:
+        return [0.0] * 2
+    return [z.min(), z.max()]
+
+
+def _file_header(shape_type, length, bbox, zbox):
+    """
+    :param length: file length in bytes
+    """
+    return pack('>6i', SHP_FILE_CODE, 0, 0, 0, 0, 0) + pack('>i', length // 2) + \
+        pack('<2i', SHP_VERSION, shape_type) + pack('<4d', *bbox) + pack('<4d', *zbox, 0.0, 0.0)
+
+
+def _write_shp_shx(filename, shape_type, contents, bbox, zbox):
+    """
+    Write a shp file and its shx index
+    :param contents: content of every record (without record header)
+    :type contents: [bytes] or numpy structured array (with record headers)
+    """
+    root = os.path.splitext(filename)[0]
+    if isinstance(contents, np.ndarray):
+        nb_records = len(contents)
+        lengths = np.full(nb_records, contents.dtype.itemsize - 8)
+        body = contents
+    else:
+        nb_records = len(contents)
+        lengths = np.array([len(content) for content in contents], dtype=int)
+        body = b''.join(pack('>2i', i + 1, length // 2) + content
+                        for i, (length, content) in enumerate(zip(lengths.tolist(), contents)))
+    offsets = SHP_HEADER_SIZE + np.concatenate(([0], np.cumsum(lengths + 8)))
+
+    with open(root + '.shp', 'wb') as fileout:
+        fileout.write(_file_header(shape_type, int(offsets[-1]), bbox, zbox))
+        fileout.write(body.tobytes() if isinstance(body, np.ndarray) else body)
+
+    index = np.empty(nb_records, dtype=SHX_DTYPE)
+    index['offset'] = offsets[:-1] // 2
+    index['length'] = lengths // 2
+    with open(root + '.shx', 'wb') as fileout:
+        fileout.write(_file_header(shape_type, SHP_HEADER_SIZE + 8 * nb_records, bbox, zbox))
+        fileout.write(index.tobytes())
+
+
+def write_pointz(filename, x, y, z):
+    """
+    Write POINTZ geometries (shp and shx files)
+    :param filename: path to the shapefile (extension is replaced)
+    :type filename: str
+    :param x: point coordinates along x axis
+    :type x: numpy 1D-array
+    :param y: point coordinates along y axis
+    :type y: numpy 1D-array
+    :param z: point elevations
+    :type z: numpy 1D-array
+    """
+    records = np.empty(len(x), dtype=POINTZ_DTYPE)
+    records['number'] = np.arange(1, len(x) + 1)
+    records['length'] = (POINTZ_DTYPE.itemsize - 8) // 2
+    records['shape_type'] = POINTZ
+    records['x'] = x
+    records['y'] = y
+    records['z'] = z
+    records['m'] = 0.0
+    _write_shp_shx(filename, POINTZ, records, _bbox(records['x'], records['y']), _zbox(records['z']))
+
+
+def write_polylinez(filename, lines):
+    """
+    Write POLYLINEZ geometries with a single part (shp and shx files)
+    :param filename: path to the shapefile (extension is replaced)
+    :type filename: str
+    :param lines: list of (x, y, z) coordinates (1D-arrays) of each polyline
+    :type lines: [tuple]
+    """
+    contents = []
+    for x, y, z in lines:
+        x, y, z = (np.asarray(array, dtype='<f8') for array in (x, y, z))
+        nb_points = len(x)
+        contents.append(pack('<i', POLYLINEZ) + pack('<4d', *_bbox(x, y)) + pack('<3i', 1, nb_points, 0) +
+                        np.column_stack((x, y)).tobytes() + pack('<2d', *_zbox(z)) + z.tobytes() +
+                        pack('<2d', 0.0, 0.0) + np.zeros(nb_points, dtype='<f8').tobytes())
+    if lines:
+        all_x, all_y, all_z = (np.concatenate([np.asarray(line[i], dtype=float) for line in lines]) for i in range(3))
+    else:
+        all_x = all_y = all_z = np.array([])
+    _write_shp_shx(filename, POLYLINEZ, contents, _bbox(all_x, all_y), _zbox(all_z))
+
+
+def _format_column(values, size, decimal):
+    """
+    Right justified numbers (with `decimal` decimals) as a 1D-array of fixed width byte strings
+    Values are formatted by blocks with a single `%` operation.
+    """
+    if decimal == 0:
+        value_fmt, values = '%%%id' % size, np.asarray(values).astype(int)
+    else:
+        value_fmt, values = '%%%i.%if' % (size, decimal), np.asarray(values, dtype=float)
+    array = np.empty(len(values), dtype='S%i' % size)
+    for start in range(0, len(values), NB_VALUES_PER_BLOCK):
+        block = values[start:start + NB_VALUES_PER_BLOCK].tolist()
+        text = (value_fmt * len(block)) % tuple(block)
+        if len(text) != size * len(block):
+            raise GeometryRequestException('Values are too large for a field of size %i' % size)
+        array[start:start + len(block)] = np.frombuffer(text.encode('ascii'), dtype='S%i' % size)
+    return array
+
+
+def _text_column(values, size):
+    """Left justified texts as a 1D-array of fixed width byte strings (texts are encoded only once)"""
+    unique_values, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    texts = np.array([value[:size].ljust(size).encode('utf-8') for value in unique_values.tolist()],
+                     dtype='S%i' % size)
+    return texts[inverse.reshape(-1)]
+
+
+def write_dbf(filename, fields, columns):
+    """
+    Write attributes (dbf file)
+    :param filename: path to the shapefile (extension is replaced)
+    :type filename: str
+    :param fields: list of (name, field_type, size, decimal) with field_type `C` (text) or `N` (numeric)
+    :type fields: [tuple]
+    :param columns: values of each field (text or numbers, one value by record)
+    :type columns: [list or numpy 1D-array]
+    """
+    nb_records = len(columns[0]) if columns else 0
+    dtype = np.dtype([('deletion', 'S1')] + [('field_%i' % i, 'S%i' % int(size))
+                                              for i, (_, _, size, _) in enumerate(fields)])
+    records = np.empty(nb_records, dtype=dtype)
+    records['deletion'] = b' '
+    for i, ((name, field_type, size, decimal), column) in enumerate(zip(fields, columns)):
+        size = int(size)
+        if len(column) != nb_records:
+            raise GeometryRequestException('Field `%s` has %i values instead of %i' % (name, len(column), nb_records))
+        if field_type == 'N':
+            records['field_%i' % i] = _format_column(column, size, decimal)
+        elif field_type == 'C':
+            records['field_%i' % i] = _text_column(column, size)
+        else:
+            raise GeometryRequestException('Field type `%s` is not supported' % field_type)
+
+    year, month, day = time.localtime()[:3]
+    with open(os.path.splitext(filename)[0] + '.dbf', 'wb') as fileout:
+        fileout.write(pack('<BBBBLHH20x', 3, year - 1900, month, day, nb_records, len(fields) * 32 + 33,
+                           dtype.itemsize))
+        for name, field_type, size, decimal in fields:
+            name = name.replace(' ', '_').encode('utf-8').ljust(11).replace(b' ', b'\x00')
+            fileout.write(pack('<11sc4xBB14x', name, field_type.encode('utf-8'), int(size), decimal))
+        fileout.write(b'\r')
+        fileout.write(records.tobytes())
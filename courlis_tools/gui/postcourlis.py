@@ -10,11 +10,15 @@ from PyQt5.QtWidgets import QApplication, QAction, QFileDialog, QLabel, \
     QMainWindow, QMessageBox, QTabWidget, QWidget
 import sys
 
+from courlis_tools.core.geom_model import GeometryModel
+from courlis_tools.core.parsers.read_listing import ReadListingFile
 from courlis_tools.core.parsers.read_opt import ReadOptFile
 from courlis_tools.core.parsers.read_plong import ReadPlongFile
-from courlis_tools.core.utils import CourlisException
+from courlis_tools.core.sediment_budget import layer_variables, match_geometries, SedimentBudget
+from courlis_tools.core.utils import CourlisException, GeometryRequestException
 from courlis_tools.gui.plot_plong import LongitudinalProfileViewer
 from courlis_tools.gui.plot_temp import TemporalProfileViewer
+from courlis_tools.gui.plot_vol import VolumeTemporalViewer
 
 
 DEFAULT_TIME_UNIT = 'sec'
@@ -25,6 +29,8 @@ class PostCourlisWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.data = None
+        self.geometry = None  # geometry of the reaches (GeometryModel to compute widths of sediment volumes)
+        self.budget = None
         self.time_unit = DEFAULT_TIME_UNIT
 
         self.setWindowTitle('Post Courlis')
@@ -38,11 +44,13 @@ class PostCourlisWindow(QMainWindow):
 
         self.plong_viewer = LongitudinalProfileViewer(self)
         self.temp_viewer = TemporalProfileViewer(self)
+        self.vol_viewer = VolumeTemporalViewer(self)
 
         self.viewers_list = []
         self.tabs = QTabWidget()
         self.add_viewer(self.plong_viewer, "Longitudinal Profile")
         self.add_viewer(self.temp_viewer, "Temporal Profile")
+        self.add_viewer(self.vol_viewer, "Sediment Volumes")
         self.setCentralWidget(self.tabs)
 
     def add_viewer(self, widget, label):
@@ -52,7 +60,8 @@ class PostCourlisWindow(QMainWindow):
     def load_file(self, filename=None):
         if filename is None:
             filename, _ = QFileDialog.getOpenFileName(self, 'Open a data file', '',
-                'Opthyca files (*.opt);;Longitudinal profiles (*.plong);;All Files (*.*)',
+                'Opthyca files (*.opt);;Longitudinal profiles (*.plong);;Courlis listings (*.listingcourlis);;'
+                'All Files (*.*)',
                 options=QFileDialog.Options() | QFileDialog.ExistingFile)
             if not filename:
                 return
@@ -64,8 +73,11 @@ class PostCourlisWindow(QMainWindow):
             elif filename.endswith('.plong'):
                 with ReadPlongFile(filename) as plong:
                     self.data = plong.res_plong
+            elif filename.endswith('.listingcourlis'):
+                with ReadListingFile(filename) as listing:
+                    self.data = listing.res_plong
             else:
-                QMessageBox.critical(self, 'Error', "Unsupported file format (only *.opt or *.plong)",
+                QMessageBox.critical(self, 'Error', "Unsupported file format (only *.opt, *.plong or *.listingcourlis)",
                                      QMessageBox.Ok)
                 return
         except CourlisException as e:
@@ -81,13 +93,50 @@ class PostCourlisWindow(QMainWindow):
                                  QMessageBox.Ok)
             return
 
+        self.update_budget()
+        self.status_text.setText("Loaded " + filename)
+
+    def update_budget(self):
+        """Compute sediment volumes (if results have layers) and refresh all viewers"""
+        self.budget = None
+        try:
+            if layer_variables(self.data.variable_names):
+                self.budget = SedimentBudget(self.data, None if self.geometry is None else
+                                             match_geometries(self.data, self.geometry.reaches))
+                self.budget.compute()
+        except (CourlisException, GeometryRequestException) as e:
+            self.budget = None
+            QMessageBox.critical(self, 'Error', "Error while computing sediment volumes\n%s" % e, QMessageBox.Ok)
+
         for tag in self.viewers_list:
             tag.fill_reach_list()
             tag.fill_variables_list()
             tag.fill_secondary_list()
             tag.set_default_selection()
 
-        self.status_text.setText("Loaded " + filename)
+    def load_geometry(self, filename=None):
+        if filename is None:
+            filename, _ = QFileDialog.getOpenFileName(self, 'Open a geometry file', '',
+                'Geometry files (*.ST *.geo *.georef *.geoC *.georefC *.shp *.npz);;All Files (*.*)',
+                options=QFileDialog.Options() | QFileDialog.ExistingFile)
+            if not filename:
+                return
+        try:
+            geometry = GeometryModel()
+            if filename.endswith(('.geo', '.georef', '.geoC', '.georefC')):
+                geometry.load_courlis(filename)  # all reaches of the file
+            else:
+                geometry.load_reaches([filename], nb_workers=1)
+        except (GeometryRequestException, NotImplementedError) as e:
+            QMessageBox.critical(self, 'Error', "Error while reading geometry file\n%s" % e, QMessageBox.Ok)
+            return
+        self.geometry = geometry
+        status = "Loaded geometry " + filename
+        if self.data is not None:
+            self.update_budget()
+            status += " (widths of reaches: %s)" % (', '.join(match_geometries(self.data, geometry.reaches)) or
+                                                    'none, volumes per meter')
+        self.status_text.setText(status)
 
     def create_status_bar(self):
         self.status_text.setText("Please load a data file")
@@ -97,8 +146,10 @@ class PostCourlisWindow(QMainWindow):
         menu_file = self.menuBar().addMenu("&File")
         load_action = self.create_action("&Load file", slot=functools.partial(self.load_file, None),
                                          shortcut="Ctrl+O", tip="Load a file")
+        load_geometry_action = self.create_action("Load &geometry", slot=functools.partial(self.load_geometry, None),
+                                                  shortcut="Ctrl+G", tip="Load a geometry (widths of sediment volumes)")
         quit_action = self.create_action("&Quit", slot=self.close, shortcut="Ctrl+Q", tip="Close the application")
-        self.add_actions(menu_file, (load_action, None, quit_action))
+        self.add_actions(menu_file, (load_action, load_geometry_action, None, quit_action))
 
         menu_help = self.menuBar().addMenu("&Help")
         about_action = self.create_action("&About", slot=self.on_about, shortcut='F1', tip='About the tool')
@@ -0,0 +1,40 @@
+import os.path
+import pytest
+import shutil
+
+from courlis_tools.core.geom import Geometry
+
+
+EXAMPLES_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'courlis_tools', 'examples')
+
+
+@pytest.fixture
+def geom_folder():
+    """Folder of the example geometry files"""
+    return os.path.join(EXAMPLES_FOLDER, 'geom_converter')
+
+
+@pytest.fixture
+def results_folder():
+    """Folder of the example result files"""
+    return os.path.join(EXAMPLES_FOLDER, 'results')
+
+
+@pytest.fixture
+def bief_1(geom_folder):
+    """Geometry of 41 sections with the limits RD, FON and RG (PK decreasing)"""
+    return Geometry(os.path.join(geom_folder, 'Bief_1.ST'))
+
+
+@pytest.fixture
+def sevenne(geom_folder):
+    """Geometry of 27 sections with the limits RD and RG only (PK increasing)"""
+    return Geometry(os.path.join(geom_folder, 'sevenne.georef'))
+
+
+@pytest.fixture
+def tmp_results(results_folder, tmp_path):
+    """Folder with a copy of the example result files (caches and indexes are written next to them)"""
+    for name in ('result.opt', 'result.plong', 'result.listingcourlis'):
+        shutil.copy(os.path.join(results_folder, name), str(tmp_path))
+    return str(tmp_path)
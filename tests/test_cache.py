@@ -0,0 +1,74 @@
+import numpy as np
+import os
+import os.path
+import pytest
+
+from courlis_tools.core.parsers.cache import cache_folder, load_cache
+from courlis_tools.core.parsers.read_opt import ReadOptFile
+from courlis_tools.core.parsers.read_plong import ReadPlongFile
+
+
+READERS = [('result.opt', ReadOptFile), ('result.plong', ReadPlongFile)]
+
+
+def read(reader, filename, use_cache=True):
+    with reader(filename, use_cache=use_cache) as result:
+        return result.res_plong
+
+
+def assert_same_values(res, other):
+    assert res.time_serie == other.time_serie
+    assert res.model == other.model
+    assert res.variable_names == other.variable_names
+    for reach_name in res.model:
+        assert np.array_equal(res.get_values(reach_name), other.get_values(reach_name))
+
+
+@pytest.mark.parametrize('name, reader', READERS)
+def test_cache_is_written_and_loaded(tmp_results, name, reader):
+    filename = os.path.join(tmp_results, name)
+    res = read(reader, filename)
+    assert os.path.isdir(cache_folder(filename))
+    cached = load_cache(filename)
+    assert cached is not None
+    assert_same_values(res, cached)
+    assert_same_values(res, read(reader, filename))
+
+
+@pytest.mark.parametrize('name, reader', READERS)
+def test_cache_is_invalidated_by_mtime(tmp_results, name, reader):
+    filename = os.path.join(tmp_results, name)
+    read(reader, filename)
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert load_cache(filename) is None
+
+
+@pytest.mark.parametrize('name, reader', READERS)
+def test_cache_is_invalidated_by_size(tmp_results, name, reader):
+    filename = os.path.join(tmp_results, name)
+    read(reader, filename)
+    stat = os.stat(filename)
+    with open(filename, 'a') as fileout:
+        fileout.write('\n')
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))  # same modification time
+    assert os.stat(filename).st_mtime_ns == stat.st_mtime_ns
+    assert load_cache(filename) is None
+
+
+def test_modified_file_is_parsed_again(tmp_results):
+    filename = os.path.join(tmp_results, 'result.opt')
+    res = read(ReadOptFile, filename)
+    with open(filename, 'r') as filein:
+        text = filein.read()
+    with open(filename, 'w') as fileout:
+        fileout.write(text.replace('     19.52582391', '     18.52582391', 1))  # first value, same size
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    modified = read(ReadOptFile, filename)
+    reach_name = list(res.model)[0]
+    assert modified.get_values(reach_name)[0, 0, 0] == 18.52582391
+    assert np.array_equal(modified.get_values(reach_name)[1:], res.get_values(reach_name)[1:])
+    assert_same_values(modified, read(ReadOptFile, filename, use_cache=False))
+    assert_same_values(modified, load_cache(filename))
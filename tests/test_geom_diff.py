@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from courlis_tools.core.geom_diff import GeometryDiff
+
+
+SHIFT = 1.0  # elevation change (m)
+
+
+def shifted(store, shift):
+    """Copy of a geometry with every elevation (bottom and layers) shifted"""
+    result = store.select_sections(np.arange(store.nb_sections))
+    result.z = result.z + shift
+    if result.layers_elev is not None:
+        result.layers_elev = result.layers_elev + shift
+    return result
+
+
+@pytest.mark.parametrize('step', [None, 2.5])
+def test_uniform_deposit(bief_1, step):
+    bief_1.add_constant_layer('mud', 1.0)
+    store = bief_1.store
+    diff = GeometryDiff(store, shifted(store, SHIFT), step=step)
+
+    assert np.array_equal(diff.first_sections, np.arange(store.nb_sections))
+    assert np.array_equal(diff.second_sections, np.arange(store.nb_sections))
+    assert np.allclose(diff.dz, SHIFT)
+    # Area of a uniform deposit of 1 m is the width of the profile
+    widths = store.distances[store.offsets[1:] - 1] - store.distances[store.offsets[:-1]]
+    assert np.allclose(diff.areas, SHIFT * widths)
+    assert np.allclose(diff.deposited_areas, diff.areas)
+    assert np.all(diff.eroded_areas == 0.0)
+
+    # Cumulative volumes: average end area method along PK
+    expected = np.concatenate(([0.0], np.cumsum((diff.areas[:-1] + diff.areas[1:]) / 2 * np.abs(np.diff(store.PK)))))
+    assert np.allclose(diff.volumes, expected)
+    assert np.allclose(diff.deposited_volumes, expected)
+    assert np.all(diff.eroded_volumes == 0.0)
+    assert diff.total_volumes() == (diff.volumes[-1], diff.deposited_volumes[-1], 0.0)
+
+
+def test_erosion_is_symmetric(bief_1):
+    store = bief_1.store
+    deposit = GeometryDiff(store, shifted(store, SHIFT))
+    erosion = GeometryDiff(shifted(store, SHIFT), store)
+    assert np.allclose(erosion.areas, -deposit.areas)
+    assert np.allclose(erosion.eroded_areas, deposit.deposited_areas)
+    assert np.all(erosion.deposited_areas == 0.0)
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from courlis_tools.core.geom import Geometry
+
+
+COORDINATES_ATOL = 1e-6  # coordinates and elevations are written with 6 decimals in text formats
+FORMATS = [  # extension, coordinates, layers (with their names), limits (kept as is or RD/RG at section ends)
+    ('ST', True, None, None),
+    ('geo', False, None, ['RD', 'RG']),
+    ('georef', True, None, ['RD', 'FON', 'RG']),
+    ('geoC', False, 'layer_%i', ['RD', 'RG']),
+    ('georefC', True, 'layer_%i', ['RD', 'FON', 'RG']),
+    ('shp', True, 'names', ['RD', 'RG']),
+    ('npz', True, 'names', None),
+]
+
+
+def save(geometry, filename):
+    if filename.endswith('.ST'):
+        geometry.save_ST(filename)
+    elif filename.endswith('.shp'):
+        geometry.save_shp(filename)
+    elif filename.endswith('.npz'):
+        geometry.save_native(filename)
+    else:
+        geometry.save_courlis(filename)
+
+
+@pytest.mark.parametrize('extension, coordinates, layers, limit_names', FORMATS)
+def test_round_trip(bief_1, tmp_path, extension, coordinates, layers, limit_names):
+    bief_1.add_constant_layer('mud', 1.0)
+    bief_1.add_linear_interp_layer('sand', [151000.0, 162000.0], [0.5, 2.5])
+    filename = str(tmp_path / ('out.' + extension))
+    save(bief_1, filename)
+    loaded = Geometry(filename)
+    store, loaded_store = bief_1.store, loaded.store
+    atol = 0.0 if extension == 'npz' else COORDINATES_ATOL
+
+    assert np.array_equal(loaded_store.names, store.names)
+    assert np.array_equal(loaded_store.PK, store.PK)
+    assert np.array_equal(loaded_store.offsets, store.offsets)
+    assert np.allclose(loaded_store.z, store.z, rtol=0.0, atol=atol)
+    assert np.allclose(loaded_store.distances, store.distances, rtol=0.0, atol=atol)
+    if coordinates:
+        assert np.allclose(loaded_store.x, store.x, rtol=0.0, atol=atol)
+        assert np.allclose(loaded_store.y, store.y, rtol=0.0, atol=atol)
+
+    if layers is None:
+        assert loaded.nb_layers == 0 and loaded_store.layers_elev is None
+    else:
+        assert loaded.layer_names == (['mud', 'sand'] if layers == 'names' else ['layer_1', 'layer_2'])
+        assert np.allclose(loaded_store.layers_elev, store.layers_elev, rtol=0.0, atol=atol)
+
+    if limit_names is None:
+        assert loaded_store.limit_names == store.limit_names
+        assert np.array_equal(loaded_store.limits, store.limits)
+    else:
+        assert loaded_store.limit_names == limit_names
+        assert np.array_equal(loaded_store.limit_points('RD'), store.offsets[:-1])
+        assert np.array_equal(loaded_store.limit_points('RG'), store.offsets[1:] - 1)
+        if 'FON' in limit_names:
+            assert np.array_equal(loaded_store.limit_points('FON'), store.limit_points('FON'))
+
+
+def test_native_is_memory_mapped(bief_1, tmp_path):
+    filename = str(tmp_path / 'out.npz')
+    bief_1.save_native(filename)
+    loaded = Geometry(filename)
+    assert isinstance(loaded.store.x, np.memmap) or isinstance(loaded.store.x.base, np.memmap)
+
+
+def test_georef_reach_name(sevenne, tmp_path):
+    assert sevenne.reach_name == 'Bief_1'
+    filename = str(tmp_path / 'out.geo')
+    sevenne.save_courlis(filename)
+    assert Geometry(filename).reach_name == 'Bief_1'
@@ -0,0 +1,49 @@
+import numpy as np
+import os.path
+import pytest
+
+from courlis_tools.core.geom_model import GeometryModel
+from courlis_tools.core.utils import GeometryRequestException
+
+
+@pytest.fixture
+def model(geom_folder):
+    model = GeometryModel()
+    model.load_reaches([os.path.join(geom_folder, 'sevenne.georef'), os.path.join(geom_folder, 'Bief_1.ST')],
+                       reach_names=['upstream', 'downstream'], nb_workers=1)
+    return model
+
+
+@pytest.mark.parametrize('use_processes', [True, False])
+def test_parallel_loading(geom_folder, model, use_processes):
+    parallel = GeometryModel()
+    parallel.load_reaches([os.path.join(geom_folder, 'sevenne.georef'), os.path.join(geom_folder, 'Bief_1.ST')],
+                          reach_names=['upstream', 'downstream'], nb_workers=2, use_processes=use_processes)
+    assert parallel.reach_names == model.reach_names
+    for reach_name in model.reach_names:
+        assert np.array_equal(parallel.get_reach(reach_name).store.z, model.get_reach(reach_name).store.z)
+
+
+def test_multi_reach_round_trip(model, tmp_path):
+    filename = str(tmp_path / 'model.geo')  # sevenne has no `FON` limit (required for `georef`)
+    model.save_courlis(filename)
+    loaded = GeometryModel()
+    loaded.load_courlis(filename)
+    assert loaded.reach_names == ['upstream', 'downstream']
+    for reach_name in model.reach_names:
+        store, loaded_store = model.get_reach(reach_name).store, loaded.get_reach(reach_name).store
+        assert np.array_equal(loaded_store.names, store.names)
+        assert np.allclose(loaded_store.PK, store.PK)
+        assert np.allclose(loaded_store.z, store.z, atol=1e-6)
+
+
+def test_several_reaches_in_a_file(model, tmp_path):
+    filename = str(tmp_path / 'model.geo')
+    model.save_courlis(filename)
+    with pytest.raises(GeometryRequestException, match='load_courlis'):
+        GeometryModel().load_reaches([filename], nb_workers=1)
+
+
+def test_unique_reaches(geom_folder, model):
+    with pytest.raises(GeometryRequestException):
+        model.load_reaches([os.path.join(geom_folder, 'sevenne.ST')], reach_names=['upstream'])
@@ -0,0 +1,99 @@
+"""Writers are checked against the files written by the original writers (one section and one point at a time)"""
+import hashlib
+import numpy as np
+import os.path
+import pytest
+import shapefile
+
+from courlis_tools.core.geom import Geometry
+
+
+# SHA-256 of the files written by the original writers: `<geometry file>:<output extension>`, the formats with layers
+# are written after adding the layers of `geom_example.py`
+ORIGINAL_DIGESTS = {
+    'Bief_1.ST:ST': 'aebb7d9dcffa0752c11b55d313a4bd7ef74c492944707d64729fb6ffc3b5a09a',
+    'Bief_1.ST:geo': '8c6143b9b14b5c1e7b1ee9417d1db34d4998f1743754e14febbd5bcad68c883a',
+    'Bief_1.ST:georef': '7d0a602224e12db0ab3e3fc1fad279cefd8786e2817e2a595901f2163edeb8ab',
+    'Bief_1.ST:geoC': 'd69a52e773d77a1ff5765c3e26c9df991349d39e961d81aad7989b05ffa69dc8',
+    'Bief_1.ST:georefC': 'ee087c1fcc3bdd4f9dcf6f913fcc30dfd4ea2de2ee642792122e6e9fc2665ae0',
+    'sevenne.ST:ST': 'ab56a0eae1df88ae1645137dbbe56797afc30d7b84f7f015515fffd8db5de3b2',
+    'sevenne.ST:geo': 'd9b15141179e1a4a350438dee1f00e6be7b195e637f61ccf2580d6d4700ad74d',
+    'sevenne.ST:geoC': '0b019b53e4b10f34a5990c431907547e0a5c8bee05e03a04e34d55294a475542',
+    'sevenne.georef:ST': 'ab56a0eae1df88ae1645137dbbe56797afc30d7b84f7f015515fffd8db5de3b2',
+}
+SHP_FILE_LENGTH = slice(24, 28)  # file length in the header of a shapefile
+DBF_DATE = slice(1, 4)  # date of last update in the header of a dbase file
+
+
+def add_example_layers(geometry):
+    geometry.add_constant_layer('mud', 1.0)
+    geometry.add_constant_layer('sand', 2.0)
+    geometry.add_linear_interp_layer('gravel', [15200, 154000, 158000], [0.5, 3, 0])
+
+
+def read_bytes(filename):
+    with open(filename, 'rb') as filein:
+        return filein.read()
+
+
+@pytest.mark.parametrize('key', ORIGINAL_DIGESTS.keys())
+def test_text_writers(geom_folder, tmp_path, key):
+    geometry_file, extension = key.split(':')
+    geometry = Geometry(os.path.join(geom_folder, geometry_file))
+    filename = str(tmp_path / ('out.' + extension))
+    if extension == 'ST':
+        geometry.save_ST(filename)
+    else:
+        if extension.endswith('C'):
+            add_example_layers(geometry)
+        geometry.save_courlis(filename)
+    assert hashlib.sha256(read_bytes(filename)).hexdigest() == ORIGINAL_DIGESTS[key]
+
+
+def test_example_outputs(geom_folder, bief_1, tmp_path):
+    """Files of `geom_example.py` which are in the repository"""
+    bief_1.save_ST(str(tmp_path / 'out.ST'))
+    assert read_bytes(str(tmp_path / 'out.ST')) == read_bytes(os.path.join(geom_folder, 'Bief_1_out.ST'))
+    add_example_layers(bief_1)
+    bief_1.save_courlis(str(tmp_path / 'out.georefC'))
+    assert read_bytes(str(tmp_path / 'out.georefC')) == \
+        read_bytes(os.path.join(geom_folder, 'Bief_1_with-2-layers.georefC'))
+
+
+def test_points_shp(geom_folder, bief_1, tmp_path):
+    add_example_layers(bief_1)
+    bief_1.save_shp(str(tmp_path / 'points.shp'))
+    for extension in ('.shp', '.shx'):
+        assert read_bytes(str(tmp_path / ('points' + extension))) == \
+            read_bytes(os.path.join(geom_folder, 'Bief_1_with-2-layers' + extension))
+
+    # Attributes are not compared with the example dbf: its layer fields were filled with wrong elevations
+    reader = shapefile.Reader(str(tmp_path / 'points.shp'))
+    assert [field[0] for field in reader.fields[1:]] == ['profil', 'PK', 'dist', 'Z_mud', 'Z_sand', 'Z_gravel']
+    records = reader.records()
+    store = bief_1.store
+    assert [record[0] for record in records] == np.repeat(store.names, store.nb_points_per_section()).tolist()
+    values = np.array([record[1:] for record in records], dtype=float)
+    assert np.allclose(values[:, 0], np.repeat(store.PK, store.nb_points_per_section()))
+    assert np.allclose(values[:, 1], store.distances, atol=1e-6)
+    assert np.allclose(values[:, 2:], store.layers_elev.T, atol=1e-6)
+
+
+@pytest.mark.parametrize('name', ['traces', 'limits'])
+def test_polylines_shp(geom_folder, bief_1, tmp_path, name):
+    """The original writer (pyshp 1.2.12) did not count Z and M values in the file length of polylines"""
+    filename = str(tmp_path / name)
+    if name == 'traces':
+        bief_1.export_trace_shp(filename + '.shp')
+    else:
+        bief_1.export_limits_shp(filename + '.shp')
+    original = os.path.join(geom_folder, name)
+
+    shp, original_shp = read_bytes(filename + '.shp'), read_bytes(original + '.shp')
+    assert len(shp) == len(original_shp)
+    assert int.from_bytes(shp[SHP_FILE_LENGTH], 'big') * 2 == len(shp)
+    assert shp[:SHP_FILE_LENGTH.start] + shp[SHP_FILE_LENGTH.stop:] == \
+        original_shp[:SHP_FILE_LENGTH.start] + original_shp[SHP_FILE_LENGTH.stop:]
+    assert read_bytes(filename + '.shx') == read_bytes(original + '.shx')
+    dbf, original_dbf = read_bytes(filename + '.dbf'), read_bytes(original + '.dbf')
+    assert dbf[:DBF_DATE.start] + dbf[DBF_DATE.stop:] == original_dbf[:DBF_DATE.start] + original_dbf[DBF_DATE.stop:]
@@ -0,0 +1,59 @@
+"""Hydraulic tables are compared with a brute force integration over the segments of every profile"""
+import numpy as np
+import pytest
+
+from courlis_tools.core.hydraulics import HydraulicTable
+from courlis_tools.core.sediment_budget import positive_integrals
+
+
+def brute_force(distances, z, level):
+    """Area, width and perimeter of a profile (closed by vertical walls) below a water level"""
+    if level < z.min():
+        return 0.0, 0.0, 0.0
+    depths = level - z
+    lengths = np.abs(np.diff(distances))
+    slants = np.hypot(lengths, np.diff(z))
+    first, second = depths[:-1], depths[1:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fractions = np.where(first * second >= 0, (first >= 0) & (second >= 0),
+                             np.maximum(first, second) / (np.abs(first) + np.abs(second)))
+    area = positive_integrals(first, second, lengths).sum()
+    walls = max(depths[0], 0.0) + max(depths[-1], 0.0)
+    return area, (lengths * fractions).sum(), (slants * fractions).sum() + walls
+
+
+@pytest.fixture(params=['bief_1', 'sevenne'])
+def store(request):
+    return request.getfixturevalue(request.param).store
+
+
+def test_evaluate(store):
+    rng = np.random.default_rng(0)
+    bottoms = np.array([store.z[store.section_slice(i)].min() for i in range(store.nb_sections)])
+    tops = np.array([store.z[store.section_slice(i)].max() for i in range(store.nb_sections)])
+    # Levels from below the bottom to above the banks
+    water_levels = bottoms - 1.0 + rng.uniform(0.0, 1.0, (20, store.nb_sections)) * (tops - bottoms + 3.0)
+    water_levels[0] = bottoms - 0.5
+
+    areas, widths, perimeters, radii = HydraulicTable(store, store.z).evaluate(water_levels, with_perimeters=True)
+    assert np.all(areas[0] == 0.0) and np.all(widths[0] == 0.0) and np.all(perimeters[0] == 0.0)
+    for frame, frame_levels in enumerate(water_levels):
+        for i, level in enumerate(frame_levels):
+            part = store.section_slice(i)
+            area, width, perimeter = brute_force(store.distances[part], store.z[part], level)
+            assert np.isclose(areas[frame, i], area, rtol=1e-9, atol=1e-6)
+            assert np.isclose(widths[frame, i], width, rtol=1e-9, atol=1e-6)
+            assert np.isclose(perimeters[frame, i], perimeter, rtol=1e-9, atol=1e-6)
+            assert np.isclose(radii[frame, i], area / perimeter if perimeter > 0 else 0.0, rtol=1e-9, atol=1e-6)
+
+
+def test_section_table(bief_1):
+    store = bief_1.store
+    table = HydraulicTable(store, store.z)
+    for i in range(store.nb_sections):
+        part = store.section_slice(i)
+        levels, areas, widths, _, _ = table.section_table(i)
+        assert np.array_equal(levels, np.sort(store.z[part]))
+        # Areas are exact at the levels of the points (widths are just above them)
+        expected = [brute_force(store.distances[part], store.z[part], level)[0] for level in levels]
+        assert np.allclose(areas, expected, rtol=1e-9, atol=1e-6)
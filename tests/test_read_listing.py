@@ -0,0 +1,79 @@
+import numpy as np
+import os
+import os.path
+import pytest
+
+from courlis_tools.core.parsers.read_listing import ListingIndex, read_records, REACH_NAME, ReadListingFile
+from courlis_tools.core.utils import CourlisException
+
+
+@pytest.fixture
+def listing_file(tmp_results):
+    return os.path.join(tmp_results, 'result.listingcourlis')
+
+
+@pytest.fixture
+def listing(listing_file):
+    with ReadListingFile(listing_file) as listing:
+        return listing
+
+
+def test_read_listing(listing):
+    res = listing.res_plong
+    assert res.nb_frames == 25
+    assert listing.nb_sections == len(res.model[REACH_NAME])
+    values = res.get_values(REACH_NAME)
+    assert np.allclose(values[:, :, -1], values[:, :, 2] * values[:, :, 3])  # discharge
+
+
+def test_index_frames(listing_file, listing):
+    index = ListingIndex(listing_file)
+    values = listing.res_plong.get_values(REACH_NAME)
+    assert index.nb_frames == listing.res_plong.nb_frames
+    assert index.times.tolist() == listing.res_plong.time_serie
+    assert (index.nb_sections, index.block_size) == (listing.nb_sections, listing.block_records.shape[1])
+    for i_frame in range(index.nb_frames):
+        frame = index.read_frame(i_frame)
+        assert np.all(frame[:, 0] == index.times[i_frame])
+        assert np.array_equal(frame[:, 2], listing.res_plong.model[REACH_NAME])
+        assert np.array_equal(frame[:, 3:], values[i_frame, :, :-1])
+        if i_frame == 0:
+            assert index.read_block(i_frame).shape == (0, index.nb_values)
+        else:
+            assert np.array_equal(index.read_block(i_frame), listing.block_records[i_frame])
+
+
+def test_index_sections(listing_file, listing):
+    index = ListingIndex(listing_file)
+    values = listing.res_plong.get_values(REACH_NAME)
+    for i_section in (0, index.nb_sections // 2, index.nb_sections - 1):
+        assert np.array_equal(index.read_section(i_section)[:, 3:], values[:, i_section, :-1])
+    with pytest.raises(CourlisException):
+        index.read_section(index.nb_sections)
+    with pytest.raises(CourlisException):
+        index.read_frame(index.nb_frames)
+
+
+def test_index_is_reused_and_invalidated(listing_file, monkeypatch):
+    ListingIndex(listing_file)
+    built = []
+    monkeypatch.setattr(ListingIndex, '_build', lambda self: built.append(True))
+    ListingIndex(listing_file)
+    assert not built
+
+    stat = os.stat(listing_file)
+    os.utime(listing_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    ListingIndex(listing_file)
+    assert built
+
+
+@pytest.mark.parametrize('nb_bytes', [1, 4, 5, 100])
+def test_truncated_listing(listing_file, nb_bytes):
+    with open(listing_file, 'rb') as filein:
+        data = filein.read()
+    with open(listing_file, 'wb') as fileout:
+        fileout.write(data[:-nb_bytes])
+    with pytest.raises(CourlisException, match='truncated'):
+        read_records(listing_file)
+    with pytest.raises(CourlisException):
+        ListingIndex(listing_file)
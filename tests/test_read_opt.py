@@ -0,0 +1,95 @@
+import numpy as np
+import os.path
+import pytest
+
+from courlis_tools.core.parsers.read_opt import iter_frames, ReadOptFile
+from courlis_tools.core.utils import CourlisException
+
+
+def read_opt(filename, line_by_line=False, monkeypatch=None):
+    if line_by_line:
+        monkeypatch.setattr(ReadOptFile, 'read_all_frames', lambda self, results: False)
+    with ReadOptFile(filename, use_cache=False) as opt:
+        return opt.res_plong
+
+
+def assert_same_results(res, other, reach_names=None):
+    assert res.variable_names == other.variable_names
+    assert res.variable_abbrs == other.variable_abbrs
+    assert res.variable_precisions == other.variable_precisions
+    assert res.time_serie == other.time_serie
+    assert list(res.model.values()) == list(other.model.values())
+    assert list(other.model.keys()) == (list(res.model.keys()) if reach_names is None else reach_names)
+    for reach_name, other_reach_name in zip(res.model, other.model):
+        assert np.array_equal(res.get_values(reach_name), other.get_values(other_reach_name))
+
+
+def modify_results(filename, function):
+    """Apply a function to the lines of results (after `[resultats]`)"""
+    with open(filename, 'r') as filein:
+        lines = filein.read().split('\n')
+    start = lines.index('[resultats]') + 1
+    lines[start:] = function(lines[start:])
+    with open(filename, 'w') as fileout:
+        fileout.write('\n'.join(lines))
+
+
+def replace_cell(row, column, value):
+    cells = row.split(';')
+    cells[column] = value
+    return ';'.join(cells)
+
+
+@pytest.fixture
+def opt_file(tmp_results):
+    return os.path.join(tmp_results, 'result.opt')
+
+
+def test_bulk_and_line_by_line(opt_file, monkeypatch):
+    res = read_opt(opt_file)
+    assert res.nb_frames == 25
+    assert_same_results(res, read_opt(opt_file, line_by_line=True, monkeypatch=monkeypatch))
+
+
+def test_non_numeric_reach_names(opt_file):
+    res = read_opt(opt_file)
+    modify_results(opt_file, lambda rows: [replace_cell(row, 1, 'Bief_A') if row else row for row in rows])
+    assert_same_results(res, read_opt(opt_file), reach_names=['Bief_A'])
+
+
+def test_iter_frames(opt_file):
+    res = read_opt(opt_file)
+    frames = list(iter_frames(opt_file))
+    assert [time for time, _ in frames] == res.time_serie
+    for i, (_, values) in enumerate(frames):
+        for reach_name, array in values.items():
+            assert np.array_equal(array, res.get_values(reach_name)[i])
+
+
+@pytest.mark.parametrize('line_by_line', [False, True])
+@pytest.mark.parametrize('column, value, message', [(5, 'abc', 'could not convert'),
+                                                    (3, '123.4', 'Unexpected PK'),
+                                                    (0, '1.0', 'Unexpected time')])
+def test_malformed_cells(opt_file, monkeypatch, line_by_line, column, value, message):
+    row_id = 200  # in the second frame
+    modify_results(opt_file, lambda rows: rows[:row_id] + [replace_cell(rows[row_id], column, value)] +
+                   rows[row_id + 1:])
+    with pytest.raises(CourlisException, match=message):
+        read_opt(opt_file, line_by_line, monkeypatch)
+    with pytest.raises(CourlisException, match=message):
+        list(iter_frames(opt_file))
+
+
+@pytest.mark.parametrize('line_by_line', [False, True])
+def test_missing_cells(opt_file, monkeypatch, line_by_line):
+    modify_results(opt_file, lambda rows: rows[:200] + [rows[200].rsplit(';', maxsplit=1)[0]] + rows[201:])
+    with pytest.raises(CourlisException, match='Number of values not coherent'):
+        read_opt(opt_file, line_by_line, monkeypatch)
+
+
+def test_truncated_frame(opt_file, monkeypatch):
+    modify_results(opt_file, lambda rows: rows[:-10])
+    with pytest.raises(CourlisException):
+        read_opt(opt_file)
+    with pytest.raises(CourlisException):
+        list(iter_frames(opt_file))
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from courlis_tools.core.utils import GeometryRequestException
+
+
+def fix_limits(geometry):
+    """Limits of BTH1 (RD and RG swapped) and BTH3 (RG instead of RD) in the order of the other sections"""
+    first, third = geometry.sections[0], geometry.sections[2]
+    first.limits = {'RG': first.limits['RD'], 'FON': first.limits['FON'], 'RD': first.limits['RG']}
+    third.limits = {'FON': third.limits['FON'], 'RD': third.limits['RG']}
+
+
+def section_minima(store):
+    return np.minimum.reduceat(store.z, store.offsets[:-1])
+
+
+def test_inconsistent_limit_order_raises(bief_1):
+    with pytest.raises(GeometryRequestException) as e:
+        bief_1.interpolate_sections(50.0)
+    message = str(e.value)
+    assert 'BTH1 and BTH2 (FON, RG)' in message
+    assert 'BTH2 and BTH3 (FON)' in message
+    assert 'BTH3 and BTH4 (RG)' in message
+    assert bief_1.store.nb_sections == 41  # geometry is unchanged
+
+
+def test_inconsistent_limit_order_accepted_without_required_limits(bief_1):
+    bief_1.interpolate_sections(50.0, required_limits=())
+    assert bief_1.store.nb_sections > 41
+
+
+def test_interpolated_sections(bief_1):
+    fix_limits(bief_1)
+    original = bief_1.store
+    bief_1.interpolate_sections(50.0)
+    store = bief_1.store
+
+    is_original = np.isin(store.names, original.names)
+    assert np.count_nonzero(is_original) == original.nb_sections
+    assert np.all(np.abs(np.diff(store.PK)) <= 50.0 + 1e-6)
+    assert store.limit_names == original.limit_names
+
+    # Intermediate sections have the limits of both original sections around them
+    positions = np.arange(store.nb_sections)
+    upstream = np.maximum.accumulate(np.where(is_original, positions, 0))
+    downstream = np.minimum.accumulate(np.where(is_original, positions, store.nb_sections)[::-1])[::-1]
+    common = (store.limits[upstream] != store.NO_LIMIT) & (store.limits[downstream] != store.NO_LIMIT)
+    assert np.array_equal(store.limits[~is_original] != store.NO_LIMIT, common[~is_original])
+
+    # Bed of the intermediate sections is between the beds of the original sections around them
+    minima = section_minima(store)
+    low = np.minimum(minima[upstream], minima[downstream])
+    high = np.maximum(minima[upstream], minima[downstream])
+    assert np.all((minima >= low - 1e-6) & (minima <= high + 1e-6))
@@ -0,0 +1,50 @@
+import numpy as np
+import os.path
+import pytest
+
+from courlis_tools.core.geom_model import GeometryModel
+from courlis_tools.core.parsers.read_plong import ReadPlongFile
+from courlis_tools.core.res_plong import ResLongProfil
+from courlis_tools.core.sediment_budget import DEFAULT_WIDTH, match_geometries, SedimentBudget
+
+
+@pytest.fixture
+def sevenne_model(geom_folder):
+    model = GeometryModel()
+    model.load_reaches([os.path.join(geom_folder, 'sevenne.ST')], nb_workers=1)  # PK from 0 to 520
+    return model
+
+
+def two_reach_results():
+    """Results of 2 reaches (PK from 0 to 500 and from 1000 to 1500) with a single layer of 1 m and then 2 m"""
+    res = ResLongProfil()
+    for name in ('Z_water', 'Z_1', 'Z_rb'):
+        res.add_variable(name)
+    for reach_name, start in (('upstream', 0.0), ('downstream', 1000.0)):
+        res.add_reach(reach_name)
+        for pk in np.linspace(start, start + 500.0, 6).tolist():
+            res.add_section(reach_name, pk)
+    for time, thickness in ((0.0, 1.0), (10.0, 2.0)):
+        res.add_frame(time, {reach_name: np.tile([10.0, thickness, 0.0], (6, 1)) for reach_name in res.model})
+    return res
+
+
+def test_match_by_pk_range(sevenne_model):
+    res = two_reach_results()
+    geometries = match_geometries(res, sevenne_model.reaches)
+    assert list(geometries) == ['upstream']
+
+    budget = SedimentBudget(res, geometries)
+    volumes, _, _ = budget.get_budget('upstream')
+    assert not np.allclose(volumes[0, 0], 500.0 * DEFAULT_WIDTH)
+    volumes, deposits, erosions = budget.get_budget('downstream')  # per meter of width
+    assert np.allclose(volumes[:, 0], [500.0, 1000.0])
+    assert np.allclose(deposits[:, 0], [0.0, 500.0]) and np.allclose(erosions, 0.0)
+
+
+def test_match_by_name(sevenne_model, results_folder):
+    with ReadPlongFile(os.path.join(results_folder, 'result.plong'), use_cache=False) as plong:
+        res = plong.res_plong
+    sevenne_model.reaches['Bief_1'] = sevenne_model.reaches.pop('sevenne')
+    res.add_reach('other')
+    assert list(match_geometries(res, sevenne_model.reaches)) == ['Bief_1']
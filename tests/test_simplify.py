@@ -0,0 +1,89 @@
+"""Simplification is compared with a recursive Douglas-Peucker of every profile"""
+import numpy as np
+import pytest
+
+from courlis_tools.core.section_store import SectionStore
+from courlis_tools.core.simplify import resample_sections, simplify_sections
+
+
+def chord_errors(distances, values, start, end):
+    """Vertical distance of the points between `start` and `end` to their chord (for z and every layer)"""
+    span = distances[end] - distances[start]
+    weights = (distances[start + 1:end] - distances[start]) / span if span > 0 else \
+        np.zeros(end - start - 1)
+    chords = values[:, [start]] + weights * (values[:, [end]] - values[:, [start]])
+    return np.abs(values[:, start + 1:end] - chords).max(axis=0)
+
+
+def douglas_peucker(distances, values, start, end, tolerance, kept):
+    if end - start < 2:
+        return
+    errors = chord_errors(distances, values, start, end)
+    worst = int(np.argmax(errors))
+    if errors[worst] > tolerance:
+        kept[start + 1 + worst] = True
+        douglas_peucker(distances, values, start, start + 1 + worst, tolerance, kept)
+        douglas_peucker(distances, values, start + 1 + worst, end, tolerance, kept)
+
+
+def reference_simplify(store, tolerance):
+    """Points kept in every section (ends and limits first) and error of every section"""
+    values = np.vstack([store.z] + ([] if store.layers_elev is None else list(store.layers_elev)))
+    kept = np.zeros(store.nb_points, dtype=bool)
+    errors = np.zeros(store.nb_sections)
+    for i in range(store.nb_sections):
+        part = store.section_slice(i)
+        distances, section_values = store.distances[part], values[:, part]
+        section_kept = np.zeros(len(distances), dtype=bool)
+        section_kept[[0, -1]] = True
+        section_kept[[index for index in store.section_limits(i).values() if index != SectionStore.NO_LIMIT]] = True
+        ends = np.flatnonzero(section_kept)
+        for start, end in zip(ends[:-1], ends[1:]):
+            douglas_peucker(distances, section_values, start, end, tolerance, section_kept)
+        ends = np.flatnonzero(section_kept)
+        errors[i] = max([0.0] + [chord_errors(distances, section_values, start, end).max()
+                                 for start, end in zip(ends[:-1], ends[1:]) if end - start > 1])
+        kept[part] = section_kept
+    return kept, errors
+
+
+@pytest.mark.parametrize('tolerance', [0.0, 0.05, 0.5, 2.0])
+def test_simplify(bief_1, tolerance):
+    bief_1.add_linear_interp_layer('sand', [151000.0, 162000.0], [0.5, 2.5])
+    store = bief_1.store
+    kept, expected_errors = reference_simplify(store, tolerance)
+    simplified, errors = simplify_sections(store, tolerance)
+
+    assert np.array_equal(simplified.offsets, np.concatenate(([0], np.cumsum(
+        np.bincount(store.section_index()[kept], minlength=store.nb_sections)))))
+    assert np.array_equal(simplified.z, store.z[kept])
+    assert np.array_equal(simplified.distances, store.distances[kept])
+    assert np.array_equal(simplified.layers_elev, store.layers_elev[:, kept])
+    assert np.allclose(errors, expected_errors)
+    assert np.all(errors <= tolerance)
+    for i in range(store.nb_sections):
+        for limit_name, index in store.section_limits(i).items():
+            point = store.offsets[i] + index
+            assert simplified.distances[simplified.offsets[i] + simplified.section_limits(i)[limit_name]] == \
+                store.distances[point]
+
+
+@pytest.mark.parametrize('max_points', [2, 10, 40])
+def test_resample(bief_1, max_points):
+    store = bief_1.store
+    resampled, errors = resample_sections(store, max_points)
+    nb_points, nb_limits = store.nb_points_per_section(), np.array(
+        [len(set([0, n - 1] + list(store.section_limits(i).values()))) for i, n in enumerate(
+            store.nb_points_per_section().tolist())])
+    assert np.all(resampled.nb_points_per_section() <= np.maximum(np.minimum(nb_points, max_points), nb_limits))
+    for i in range(store.nb_sections):
+        part = store.section_slice(i)
+        new_part = resampled.section_slice(i)
+        for limit_name, index in store.section_limits(i).items():
+            new_index = resampled.section_limits(i)[limit_name]
+            assert resampled.z[new_part][new_index] == store.z[part][index]
+            assert resampled.distances[new_part][new_index] == store.distances[part][index]
+        # Error is the maximum vertical distance of the original points to the resampled profile
+        expected = np.abs(store.z[part] - np.interp(store.distances[part], resampled.distances[new_part],
+                                                    resampled.z[new_part])).max()
+        assert np.isclose(errors[i], expected)
@@ -0,0 +1,116 @@
+"""Queries of the spatial index are compared with brute force searches over all points and segments"""
+import numpy as np
+import pytest
+
+from courlis_tools.core.spatial_index import SpatialIndex
+
+
+NB_LOCATIONS = 300
+
+
+def random_locations(store, seed=0):
+    """Locations around the geometry (with a margin of a tenth of its extent)"""
+    rng = np.random.default_rng(seed)
+    xmin, xmax, ymin, ymax = store.x.min(), store.x.max(), store.y.min(), store.y.max()
+    margin = max(xmax - xmin, ymax - ymin) / 10
+    return rng.uniform(xmin - margin, xmax + margin, NB_LOCATIONS), \
+        rng.uniform(ymin - margin, ymax + margin, NB_LOCATIONS)
+
+
+def segments(store):
+    section_index = store.section_index()
+    starts = np.flatnonzero(section_index[:-1] == section_index[1:])
+    return starts, section_index[starts]
+
+
+def point_segment_distances(x, y, x0, y0, x1, y1):
+    """Distances between every location (rows) and every segment (columns)"""
+    x, y = x[:, np.newaxis], y[:, np.newaxis]
+    dx, dy = x1 - x0, y1 - y0
+    length2 = dx ** 2 + dy ** 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(length2 > 0, ((x - x0) * dx + (y - y0) * dy) / length2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(x - (x0 + t * dx), y - (y0 + t * dy))
+
+
+def segment_crosses_rectangle(x0, y0, x1, y1, xmin, ymin, xmax, ymax):
+    """Segment with an end inside the rectangle or crossing one of its sides (orientation tests)"""
+    def orientation(ax, ay, bx, by, cx, cy):
+        return np.sign((bx - ax) * (cy - ay) - (by - ay) * (cx - ax))
+
+    def inside(x, y):
+        return xmin <= x <= xmax and ymin <= y <= ymax
+
+    if inside(x0, y0) or inside(x1, y1):
+        return True
+    corners = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
+    for (ax, ay), (bx, by) in zip(corners, corners[1:] + corners[:1]):
+        if orientation(x0, y0, x1, y1, ax, ay) * orientation(x0, y0, x1, y1, bx, by) <= 0 and \
+                orientation(ax, ay, bx, by, x0, y0) * orientation(ax, ay, bx, by, x1, y1) <= 0:
+            return True
+    return False
+
+
+@pytest.fixture(params=['bief_1', 'sevenne'])
+def store(request):
+    return request.getfixturevalue(request.param).store
+
+
+def test_nearest_points(store):
+    x, y = random_locations(store)
+    index, sections, distances = SpatialIndex(store).nearest_points(x, y)
+    all_distances = np.hypot(x[:, np.newaxis] - store.x, y[:, np.newaxis] - store.y)
+    assert np.allclose(distances, all_distances.min(axis=1))
+    assert np.allclose(all_distances[np.arange(NB_LOCATIONS), index], distances)
+    assert np.array_equal(sections, store.section_index()[index])
+
+
+def test_nearest_sections(store):
+    x, y = random_locations(store, seed=1)
+    sections, distances, proj_x, proj_y, abscissas = SpatialIndex(store).nearest_sections(x, y)
+
+    starts, segment_sections = segments(store)
+    all_distances = point_segment_distances(x, y, store.x[starts], store.y[starts], store.x[starts + 1],
+                                            store.y[starts + 1])
+    assert np.allclose(distances, all_distances.min(axis=1))
+    # Section of a nearest segment (several segments can be at the same distance, e.g. at a shared point)
+    nearest = np.isclose(all_distances, distances[:, np.newaxis])
+    assert all(nearest[k, segment_sections == section].any() for k, section in enumerate(sections))
+    assert np.allclose(np.hypot(x - proj_x, y - proj_y), distances)
+
+    # Projections are on the traces of their section, at their abscissa along the profile
+    points = store.section_index() == sections[:, np.newaxis]
+    for k in range(NB_LOCATIONS):
+        profile = np.flatnonzero(points[k])
+        assert np.isclose(np.interp(abscissas[k], store.distances[profile], store.x[profile]), proj_x[k])
+        assert np.isclose(np.interp(abscissas[k], store.distances[profile], store.y[profile]), proj_y[k])
+
+
+def bboxes(store, seed=2, nb_bboxes=50):
+    rng = np.random.default_rng(seed)
+    x, y = random_locations(store, seed)
+    widths = rng.uniform(0.0, (store.x.max() - store.x.min()) / 5, NB_LOCATIONS)
+    heights = rng.uniform(0.0, (store.y.max() - store.y.min()) / 5, NB_LOCATIONS)
+    return list(zip(x, y, x + widths, y + heights))[:nb_bboxes]
+
+
+def test_points_in_bbox(store):
+    index = SpatialIndex(store)
+    for xmin, ymin, xmax, ymax in bboxes(store):
+        expected = np.flatnonzero((store.x >= xmin) & (store.x <= xmax) & (store.y >= ymin) & (store.y <= ymax))
+        assert np.array_equal(index.points_in_bbox(xmin, ymin, xmax, ymax), expected)
+
+
+def test_sections_in_bbox(store):
+    index = SpatialIndex(store)
+    starts, segment_sections = segments(store)
+    section_index = store.section_index()
+    for xmin, ymin, xmax, ymax in bboxes(store, seed=3):
+        inside = (store.x >= xmin) & (store.x <= xmax) & (store.y >= ymin) & (store.y <= ymax)
+        expected = set(section_index[inside].tolist())
+        for start, section in zip(starts.tolist(), segment_sections.tolist()):
+            if segment_crosses_rectangle(store.x[start], store.y[start], store.x[start + 1], store.y[start + 1],
+                                         xmin, ymin, xmax, ymax):
+                expected.add(section)
+        assert index.sections_in_bbox(xmin, ymin, xmax, ymax).tolist() == sorted(expected)